@@ -1,9 +1,9 @@
 ### main deps
 from amaranth import *
-from amaranth.build import Platform
-from typing import List, Dict, Tuple, Optional
-### test deps ###
-from amaranth.sim import Simulator, Delay, Settle
+from typing import TYPE_CHECKING, List, Dict, Tuple, Optional
+if TYPE_CHECKING:
+    from amaranth.build import Platform
+### test deps : imported by the test suite only, for the module to load fast ###
 
 class Bleeper(Elaboratable):
     """
@@ -18,13 +18,16 @@ class Bleeper(Elaboratable):
             self.q
         ]
 
-    def elaborate(self, platform: Platform) -> Module:
+    def elaborate(self, platform: "Platform") -> Module:
         m = Module()
         m.d.sync += self.q.eq(~self.q)
         return m
 
 ### Test suite ###
 if __name__ == "__main__":
+    ### test deps ###
+    from amaranth.sim import Simulator, Delay, Settle
+
     m = Module()
     m.submodules.bleeper = bleeper = Bleeper()
 
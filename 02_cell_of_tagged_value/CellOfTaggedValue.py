@@ -1,13 +1,10 @@
 ### main deps
 from amaranth import *
-from amaranth.build import Platform
-from typing import List, Dict, Tuple, Optional
-### test deps ###
-from amaranth.sim import Simulator, Delay, Settle
-from amaranth.cli import main_parser # READ amaranth/cli.py to find out parameters and what it does.
-from amaranth.asserts import * # AnyConst, AnySeq, Assert, Assume, Cover, Past, Stable, Rose, Fell, Initial
-#
-from cli_sporny import main_runner_by_sporniket
+from typing import TYPE_CHECKING, List, Dict, Tuple, Optional
+if TYPE_CHECKING:
+    from amaranth.build import Platform
+    from amaranth.sim import Simulator
+### test deps : imported by the test suite only, for the module to load fast ###
 
 class CellOfTaggedValue(Elaboratable):
     """
@@ -37,7 +34,7 @@ class CellOfTaggedValue(Elaboratable):
             self.isFree, self.isMatching, self.dataOut
         ]
 
-    def elaborate(self, platform: Platform) -> Module:
+    def elaborate(self, platform: "Platform") -> Module:
         m = Module()
 
         m.d.comb += [
@@ -56,9 +53,14 @@ class CellOfTaggedValue(Elaboratable):
 
 ### Test suite ###
 if __name__ == "__main__":
+    ### test deps ###
+    from amaranth.asserts import * # AnyConst, AnySeq, Assert, Assume, Cover, Past, Stable, Rose, Fell, Initial
+    #
+    from cli_sporny import main_parser_by_sporniket, main_runner_by_sporniket # READ cli_sporny.main_parser_by_sporniket to find out parameters and what it does.
+
     # Prepare
     # Prepare : retrieve cli args
-    parser = main_parser()
+    parser = main_parser_by_sporniket()
     args = parser.parse_args()
     isSimulation = ("simulate" == args.action)
 
@@ -107,7 +109,7 @@ if __name__ == "__main__":
                 Assert(~(taggedValue.isMatching))
             ]
 
-    def mySimulation(sim:Simulator, m:Module):
+    def mySimulation(sim:"Simulator", m:Module):
 
         def process():
             yield dataIn.eq(512)
@@ -127,4 +129,5 @@ if __name__ == "__main__":
 
 
     # Execute
-    main_runner_by_sporniket(parser, args, m, ports=[rst, sync.clk] + taggedValue.ports(), prepareVerification=myVerification, prepareSimulation=mySimulation)
+    main_runner_by_sporniket(parser, args, m, ports=[rst, sync.clk] + taggedValue.ports(), prepareVerification=myVerification, prepareSimulation=mySimulation,
+        stimulus=[dataIn, writeEnabled])
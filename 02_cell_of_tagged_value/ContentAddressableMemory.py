@@ -0,0 +1,203 @@
+### main deps
+from amaranth import *
+from typing import TYPE_CHECKING, List, Dict, Tuple, Optional
+if TYPE_CHECKING:
+    from amaranth.build import Platform
+    from amaranth.sim import Simulator
+### test deps : imported by the test suite only, for the module to load fast ###
+### local deps
+from CellOfTaggedValue import CellOfTaggedValue
+
+class ContentAddressableMemory(Elaboratable):
+    """
+    A table of `depth` cells of tagged value, that output the tag of the cell matching a value.
+
+    The tag of a cell is its index in the table. `dataIn` is broadcasted to all the cells, and the
+    matching lines are reduced by a tree of priority encoders : when several cells are matching, the
+    lowest tag wins.
+
+    When `pipelineEvery` is 0, the lookup is done in the same clock cycle. Otherwise, the matching lines
+    are registered, and so are the outputs of every `pipelineEvery` levels of the tree ; a lookup is
+    then answered `latency` clock cycles later, and a new lookup can start at each clock cycle.
+    """
+
+    def __init__(self, depth: int, valueShape: Shape, pipelineEvery: int = 0):
+        if depth < 2:
+            raise ValueError("ContentAddressableMemory MUST have a depth of at least 2.")
+        if pipelineEvery < 0:
+            raise ValueError("pipelineEvery MUST be positive, or 0 to disable the pipeline.")
+        self.depth = depth
+        self.valueShape = valueShape
+        self.tagShape = Shape.cast(range(depth))
+        self.pipelineEvery = pipelineEvery
+
+        # inputs
+        self.writeEnabled = Signal() # should be asserted to bind value in dataIn to the tag in writeTag.
+        self.writeTag = Signal(self.tagShape) # the tag of the cell to bind.
+        self.dataIn = Signal(shape=valueShape, reset_less=True) # the value to look up, or the value to bind to the tag.
+
+        #outputs
+        self.isMatching = Signal() # asserted when a cell is matching dataIn (hit), deasserted otherwise (miss).
+        self.dataOut = Signal(shape=self.tagShape) # the tag of the matching cell, meaningless on a miss.
+
+    @property
+    def levels(self) -> int:
+        """The number of levels of the tree of priority encoders."""
+        return (self.depth - 1).bit_length()
+
+    @property
+    def latency(self) -> int:
+        """The number of clock cycles between a lookup and its result."""
+        if self.pipelineEvery == 0:
+            return 0
+        return 1 + self.levels // self.pipelineEvery
+
+    def ports(self) -> List[Signal]:
+        return [
+            # inputs
+            self.writeEnabled, self.writeTag, self.dataIn,
+
+            #outputs
+            self.isMatching, self.dataOut
+        ]
+
+    def elaborate(self, platform: "Platform") -> Module:
+        m = Module()
+
+        # -- the cells, all watching dataIn
+        hits = []
+        tags = []
+        for i in range(self.depth):
+            cell = CellOfTaggedValue(i, self.tagShape, self.valueShape)
+            m.submodules[f"cell_{i}"] = cell
+            m.d.comb += [
+                cell.dataIn.eq(self.dataIn),
+                cell.writeEnabled.eq(self.writeEnabled & (self.writeTag == i))
+            ]
+            hits.append(cell.isMatching)
+            tags.append(cell.dataOut)
+
+        if self.pipelineEvery > 0:
+            hits = [self._stage(m, hit, f"hit_l0_{i}") for i, hit in enumerate(hits)]
+            tags = [self._stage(m, tag, f"tag_l0_{i}") for i, tag in enumerate(tags)]
+
+        # -- the tree of priority encoders, the lowest tag wins
+        level = 0
+        while len(hits) > 1:
+            level += 1
+            nextHits = []
+            nextTags = []
+            for i in range(0, len(hits) - 1, 2):
+                hit = Signal(name=f"hit_l{level}_{i // 2}")
+                tag = Signal(self.tagShape, name=f"tag_l{level}_{i // 2}")
+                m.d.comb += [
+                    hit.eq(hits[i] | hits[i + 1]),
+                    tag.eq(Mux(hits[i], tags[i], tags[i + 1]))
+                ]
+                nextHits.append(hit)
+                nextTags.append(tag)
+            if len(hits) % 2 == 1:
+                # -- odd one out, goes straight to the next level
+                nextHits.append(hits[-1])
+                nextTags.append(tags[-1])
+            if self.pipelineEvery > 0 and level % self.pipelineEvery == 0:
+                nextHits = [self._stage(m, hit) for hit in nextHits]
+                nextTags = [self._stage(m, tag) for tag in nextTags]
+            hits = nextHits
+            tags = nextTags
+
+        m.d.comb += [
+            self.isMatching.eq(hits[0]),
+            self.dataOut.eq(tags[0])
+        ]
+
+        return m
+
+    def _stage(self, m: Module, value: Value, name: Optional[str] = None) -> Signal:
+        """Register the given value, and return the register."""
+        register = Signal.like(value, name=f"{value.name}_q" if name is None else name)
+        m.d.sync += register.eq(value)
+        return register
+
+
+### Test suite ###
+if __name__ == "__main__":
+    ### test deps ###
+    from amaranth.asserts import * # AnyConst, AnySeq, Assert, Assume, Cover, Past, Stable, Rose, Fell, Initial
+    #
+    from cli_sporny import main_parser_by_sporniket, main_runner_by_sporniket # READ cli_sporny.main_parser_by_sporniket to find out parameters and what it does.
+
+    # Prepare
+    # Prepare : retrieve cli args
+    parser = main_parser_by_sporniket()
+    args = parser.parse_args()
+    isSimulation = ("simulate" == args.action)
+
+    # Prepare : prepare the test bench
+    m = Module()
+    depth = 5
+    m.submodules.cam = cam = ContentAddressableMemory(depth, unsigned(7))
+
+    # Prepare : prepare the test bench : workaround sim bug , override clk and rst
+    nameOfClockDomain = "sync"
+    m.domains.sync = sync = ClockDomain(nameOfClockDomain)
+    syncClk = ClockSignal(nameOfClockDomain)
+    rst = Signal()
+    sync.rst = rst
+    # Prepare : prepare the test bench : workaround sim bug , input signals of interest
+    dataIn = Signal(unsigned(7), reset=0)
+    m.d.comb += cam.dataIn.eq(dataIn)
+    writeEnabled = Signal()
+    m.d.comb += cam.writeEnabled.eq(writeEnabled)
+    writeTag = Signal(cam.tagShape)
+    m.d.comb += cam.writeTag.eq(writeTag)
+
+    # To verify
+    def myVerification(m:Module):
+        with m.If(Past(rst)):
+            # -- Reset renders all the cells free again, nothing can match
+            m.d.sync += Assert(~cam.isMatching)
+        with m.If(~Past(rst) & Past(writeEnabled) & (Past(writeTag) < depth) & (dataIn == Past(dataIn))):
+            # -- Write enabled bind the cell to a value, and the table immediately matches the binded value,
+            # -- at worst with the tag of another cell bound to the same value.
+            m.d.sync += [
+                Assert(cam.isMatching),
+                Assert(cam.dataOut <= Past(writeTag))
+            ]
+        with m.If(cam.isMatching):
+            # -- the tag is always a tag of the table
+            m.d.sync += Assert(cam.dataOut < depth)
+        m.d.sync += Cover(cam.isMatching & (cam.dataOut == depth - 1))
+
+    def mySimulation(sim:"Simulator", m:Module):
+
+        def process():
+            # bind 15 to tag 3, and 20 to tag 1
+            yield dataIn.eq(15)
+            yield writeTag.eq(3)
+            yield writeEnabled.eq(1)
+            yield
+            yield dataIn.eq(20)
+            yield writeTag.eq(1)
+            yield
+            yield writeEnabled.eq(0)
+            yield
+            # look up
+            yield dataIn.eq(15)
+            yield
+            yield dataIn.eq(12)
+            yield
+            # bind 15 to tag 0 too, the lowest tag wins
+            yield dataIn.eq(15)
+            yield writeTag.eq(0)
+            yield writeEnabled.eq(1)
+            yield
+            yield writeEnabled.eq(0)
+            yield
+
+        sim.add_sync_process(process)
+
+
+    # Execute
+    main_runner_by_sporniket(parser, args, m, ports=[rst, sync.clk] + cam.ports(), prepareVerification=myVerification, prepareSimulation=mySimulation,
+        stimulus=[dataIn, writeEnabled, writeTag])
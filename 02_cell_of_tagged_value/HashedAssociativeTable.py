@@ -0,0 +1,242 @@
+### main deps
+from amaranth import *
+from typing import TYPE_CHECKING, List, Dict, Tuple, Optional
+if TYPE_CHECKING:
+    from amaranth.build import Platform
+    from amaranth.sim import Simulator
+### test deps : imported by the test suite only, for the module to load fast ###
+
+class HashedAssociativeTable(Elaboratable):
+    """
+    A table of `buckets` x `ways` cells of tagged value, stored in block RAM, that output the tag of the cell
+    matching a value.
+
+    A value can only be bound to a cell of its bucket, given by a hash of the value ; each way is a memory of
+    `buckets` entries (the value and a 'bound' flag), all the ways of the bucket are read and compared at once.
+    The tag of a cell is `way * buckets + bucket`.
+
+    Each operation (a lookup, or a write when `writeEnabled` is asserted) is answered `latency` clock cycles
+    later, and a new operation can start at each clock cycle :
+
+    * `isMatching` is asserted when `dataIn` is bound, after the operation, to the cell whose tag is `dataOut` ;
+    * `isFree` is asserted when the bucket of `dataIn` had a free cell before the operation ;
+    * a write binds `dataIn` to the first free cell of its bucket, unless `dataIn` is already bound ;
+      `overflow` is asserted when the bucket is full, the value is then not bound.
+
+    After a reset, the memories are cleared, one bucket per clock cycle ; meanwhile `isReady` is deasserted, and
+    the operations are ignored (not matching, not free, no overflow).
+    """
+
+    def __init__(self, valueShape: Shape, buckets: int = 512, ways: int = 4):
+        if buckets < 2 or buckets & (buckets - 1) != 0:
+            raise ValueError("HashedAssociativeTable MUST have a power of 2 of buckets, at least 2.")
+        if ways < 1:
+            raise ValueError("HashedAssociativeTable MUST have at least 1 way.")
+        self.valueShape = valueShape
+        self.buckets = buckets
+        self.ways = ways
+        self.tagShape = Shape.cast(range(buckets * ways))
+
+        # inputs
+        self.writeEnabled = Signal() # should be asserted to bind value in dataIn to a free cell of its bucket.
+        self.dataIn = Signal(shape=valueShape, reset_less=True) # the value to look up, or the value to bind.
+
+        #outputs
+        self.isMatching = Signal() # asserted when dataIn is bound to a cell (hit), deasserted otherwise (miss).
+        self.isFree = Signal() # asserted when the bucket of dataIn has a free cell.
+        self.overflow = Signal() # asserted when a write did not find any free cell in the bucket of dataIn.
+        self.dataOut = Signal(shape=self.tagShape) # the tag of the bound cell, meaningless on a miss.
+        self.isReady = Signal() # deasserted while the memories are cleared after a reset.
+
+    @property
+    def bucketBits(self) -> int:
+        """The width of the index of a bucket."""
+        return (self.buckets - 1).bit_length()
+
+    @property
+    def latency(self) -> int:
+        """The number of clock cycles between an operation and its result."""
+        return 2
+
+    def bucketOf(self, value: int) -> int:
+        """The bucket of the given value, like computed by the hardware : the value is XOR-folded."""
+        value &= (1 << len(self.dataIn)) - 1
+        bucket = 0
+        while value != 0:
+            bucket ^= value & (self.buckets - 1)
+            value >>= self.bucketBits
+        return bucket
+
+    def ports(self) -> List[Signal]:
+        return [
+            # inputs
+            self.writeEnabled, self.dataIn,
+
+            #outputs
+            self.isMatching, self.isFree, self.overflow, self.dataOut, self.isReady
+        ]
+
+    def elaborate(self, platform: "Platform") -> Module:
+        m = Module()
+        valueWidth = len(self.dataIn)
+
+        # -- clearing of the memories, after a reset
+        clearing = Signal(reset=1)
+        clearBucket = Signal(self.bucketBits)
+        m.d.comb += self.isReady.eq(~clearing)
+        with m.If(clearing):
+            m.d.sync += clearBucket.eq(clearBucket + 1)
+            with m.If(clearBucket == self.buckets - 1):
+                m.d.sync += clearing.eq(0)
+
+        # -- stage 0 : hash the value, and read all the ways of its bucket
+        hashed = self.dataIn[0 : self.bucketBits]
+        for start in range(self.bucketBits, valueWidth, self.bucketBits):
+            hashed = hashed ^ self.dataIn[start : start + self.bucketBits]
+        bucket = Signal(self.bucketBits)
+        m.d.comb += bucket.eq(hashed)
+
+        # -- stage 1 : compare the ways with the value, and write to the first free way if required
+        value1 = Signal(valueWidth)
+        bucket1 = Signal(self.bucketBits)
+        write1 = Signal()
+        ready1 = Signal()
+        m.d.sync += [
+            value1.eq(self.dataIn),
+            bucket1.eq(bucket),
+            write1.eq(self.writeEnabled & self.isReady),
+            ready1.eq(self.isReady)
+        ]
+
+        hits = []
+        frees = []
+        writeEnables = []
+        for way in range(self.ways):
+            memory = Memory(width=valueWidth + 1, depth=self.buckets, name=f"way_{way}")
+            # -- transparent, so that an operation sees the write of the previous operation on the same bucket
+            m.submodules[f"read_{way}"] = readPort = memory.read_port(transparent=True)
+            m.submodules[f"write_{way}"] = writePort = memory.write_port()
+            m.d.comb += readPort.addr.eq(bucket)
+
+            isBound = readPort.data[valueWidth]
+            hits.append(isBound & (readPort.data[0 : valueWidth] == value1))
+            frees.append(~isBound)
+            writeEnable = Signal(name=f"writeEnabled_{way}")
+            writeEnables.append(writeEnable)
+            m.d.comb += [
+                writePort.addr.eq(Mux(clearing, clearBucket, bucket1)),
+                writePort.data.eq(Mux(clearing, 0, Cat(value1, Const(1)))),
+                writePort.en.eq(clearing | writeEnable)
+            ]
+
+        hitAny, hitWay = self._firstOf(m, hits, "hit")
+        freeAny, freeWay = self._firstOf(m, frees, "free")
+        insert = Signal()
+        m.d.comb += insert.eq(write1 & ~hitAny & freeAny)
+        for way, writeEnable in enumerate(writeEnables):
+            m.d.comb += writeEnable.eq(insert & (freeWay == way))
+
+        # -- stage 2 : the result
+        m.d.sync += [
+            self.isMatching.eq(ready1 & (hitAny | insert)),
+            self.isFree.eq(ready1 & freeAny),
+            self.overflow.eq(write1 & ~hitAny & ~freeAny),
+            self.dataOut.eq(Cat(bucket1, Mux(hitAny, hitWay, freeWay)))
+        ]
+
+        return m
+
+    def _firstOf(self, m: Module, lines: List[Value], name: str) -> Tuple[Signal, Signal]:
+        """Whether any line is asserted, and the index of the lowest asserted line."""
+        isAny = Signal(name=f"{name}Any")
+        first = Signal(range(self.ways), name=f"{name}Way")
+        m.d.comb += isAny.eq(Cat(lines).any())
+        index = Const(0, first.shape())
+        for way in reversed(range(self.ways)):
+            index = Mux(lines[way], way, index)
+        m.d.comb += first.eq(index)
+        return isAny, first
+
+
+### Test suite ###
+if __name__ == "__main__":
+    ### test deps ###
+    from amaranth.asserts import * # AnyConst, AnySeq, Assert, Assume, Cover, Past, Stable, Rose, Fell, Initial
+    #
+    from cli_sporny import main_parser_by_sporniket, main_runner_by_sporniket # READ cli_sporny.main_parser_by_sporniket to find out parameters and what it does.
+
+    # Prepare
+    # Prepare : retrieve cli args
+    parser = main_parser_by_sporniket()
+    args = parser.parse_args()
+    isSimulation = ("simulate" == args.action)
+
+    # Prepare : prepare the test bench
+    m = Module()
+    m.submodules.table = table = HashedAssociativeTable(unsigned(7), buckets=4, ways=2)
+
+    # Prepare : prepare the test bench : workaround sim bug , override clk and rst
+    nameOfClockDomain = "sync"
+    m.domains.sync = sync = ClockDomain(nameOfClockDomain)
+    syncClk = ClockSignal(nameOfClockDomain)
+    rst = Signal()
+    sync.rst = rst
+    # Prepare : prepare the test bench : workaround sim bug , input signals of interest
+    dataIn = Signal(unsigned(7), reset=0)
+    m.d.comb += table.dataIn.eq(dataIn)
+    writeEnabled = Signal()
+    m.d.comb += table.writeEnabled.eq(writeEnabled)
+
+    # To verify
+    def myVerification(m:Module):
+        isAnswering = ~Past(rst) & ~Past(rst, 2) & Past(table.isReady, 2)
+        with m.If(Past(rst)):
+            # -- Reset renders the table not ready, nothing can match
+            m.d.sync += [
+                Assert(~table.isReady),
+                Assert(~table.isMatching)
+            ]
+        with m.If(isAnswering & Past(writeEnabled, 2)):
+            # -- A write either binds the value, or overflows
+            m.d.sync += Assert(table.isMatching ^ table.overflow)
+        with m.If(isAnswering & ~Past(rst, 3) & Past(writeEnabled, 3) & ~Past(writeEnabled, 2)
+                & (Past(dataIn, 2) == Past(dataIn, 3)) & Past(table.isMatching)):
+            # -- A value bound by a write is immediately matching, with the same tag
+            m.d.sync += [
+                Assert(table.isMatching),
+                Assert(table.dataOut == Past(table.dataOut))
+            ]
+        with m.If(table.overflow):
+            # -- only a full bucket overflows
+            m.d.sync += Assert(~table.isFree)
+        m.d.sync += Cover(table.overflow)
+
+    def mySimulation(sim:"Simulator", m:Module):
+
+        # -- a value of another bucket than 15, and two values of the same bucket than 15
+        other = next(v for v in range(1 << 7) if table.bucketOf(v) != table.bucketOf(15))
+        colliding = [v for v in range(1 << 7) if v != 15 and table.bucketOf(v) == table.bucketOf(15)][:2]
+
+        def process():
+            # wait for the end of the clearing
+            for _ in range(table.buckets):
+                yield
+            # bind 15, the other value, then the colliding values : the bucket of 15 is full, the last one overflows
+            yield writeEnabled.eq(1)
+            for value in [15, other] + colliding:
+                yield dataIn.eq(value)
+                yield
+            yield writeEnabled.eq(0)
+            # look up
+            for value in [15, other, 12] + colliding:
+                yield dataIn.eq(value)
+                yield
+            for _ in range(table.latency):
+                yield
+
+        sim.add_sync_process(process)
+
+
+    # Execute
+    main_runner_by_sporniket(parser, args, m, ports=[rst, sync.clk] + table.ports(), prepareVerification=myVerification, prepareSimulation=mySimulation,
+        stimulus=[dataIn, writeEnabled])
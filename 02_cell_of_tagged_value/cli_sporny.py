@@ -1,41 +1,1469 @@
 # derived from amaranth.cli
 
+import argparse
+import cProfile
+import csv
+import gzip
+import hashlib
+import io
+import json
+import mmap
+import os
+import runpy
+import shutil
+import signal
+import subprocess
+import sys
+import sysconfig
+import time
+import traceback
+import warnings
+from contextlib import contextmanager, redirect_stdout
+from typing import TYPE_CHECKING
+
+from amaranth import __version__ as amaranth_version
+from amaranth.hdl.ast import Assign, Cat, Const, Operator, Signal, SignalDict, SignalSet, Slice, Switch
 from amaranth.hdl.ir import Fragment
-from amaranth.back import rtlil, cxxrtl, verilog
-from amaranth.sim import Simulator
 
+# -- the backends, the simulator, the toolchain and the waveform tools are only imported by the action that needs them,
+# -- for the command line to start fast ; see `benchmarks/startup.py`
+if TYPE_CHECKING:
+    from amaranth.sim import Simulator
+
+
+def main_parser_by_sporniket(parser=None):
+    """The parser of amaranth.cli, with the additionnal options supported by main_runner_by_sporniket."""
+    if parser is None:
+        parser = argparse.ArgumentParser()
+
+    p_action = parser.add_subparsers(dest="action")
+
+    p_generate = p_action.add_parser("generate",
+        help="generate RTLIL, Verilog or CXXRTL from the design")
+    p_generate.add_argument("-t", "--type", dest="generate_type",
+        metavar="LANGUAGE", choices=["il", "cc", "v"],
+        help="generate LANGUAGE (il for RTLIL, v for Verilog, cc for CXXRTL) on the standard output, or into the FILEs"
+            " whose extension is not .il, .cc or .v")
+    p_generate.add_argument("--no-src", dest="emit_src", default=True, action="store_false",
+        help="suppress generation of source location attributes")
+    p_generate.add_argument("--watch", dest="generate_watch", default=False, action="store_true",
+        help="keep running, and generate the FILEs again each time a source file of the design changes")
+    p_generate.add_argument("generate_files",
+        metavar="FILE", nargs="*",
+        help="write generated code to FILE, in the language given by its extension ; all the FILEs are generated from"
+            " a single elaboration, a FILE is only written when its content changes")
+
+    p_simulate = p_action.add_parser(
+        "simulate", help="simulate the design")
+    p_simulate.add_argument("-v", "--vcd-file",
+        metavar="VCD-FILE",
+        help="write execution trace to VCD-FILE (compressed when named *.vcd.gz, converted to FST by vcd2fst when named *.fst)")
+    p_simulate.add_argument("-w", "--gtkw-file",
+        metavar="GTKW-FILE", type=argparse.FileType("w"),
+        help="write GTKWave configuration to GTKW-FILE")
+    p_simulate.add_argument("-p", "--period", dest="sync_period",
+        metavar="TIME", type=float, default=None,
+        help="set 'sync' clock domain period to TIME (default: the period of the default clock of the platform, if"
+            " any, else 1e-06)")
+    p_simulate.add_argument("-c", "--clocks", dest="sync_clocks",
+        metavar="COUNT", type=int, required=True,
+        help="simulate for COUNT 'sync' clock periods")
+    p_simulate.add_argument("-e", "--engine", dest="engine",
+        metavar="ENGINE", choices=["pysim", "cxxrtl"], default="pysim",
+        help="simulate with ENGINE (pysim for the python simulator, cxxrtl for a compiled simulation of the design"
+            " that only drives the 'sync' clock ; default: %(default)s)")
+    p_simulate.add_argument("--trace-from", dest="trace_from",
+        metavar="CYCLE", type=int, default=0,
+        help="start writing the execution trace at CYCLE (default: %(default)s)")
+    p_simulate.add_argument("--trace-until", dest="trace_until",
+        metavar="CYCLE", type=int, default=None,
+        help="stop writing the execution trace at CYCLE (default: the end of the simulation)")
+    p_simulate.add_argument("--trace-trigger", dest="trace_trigger",
+        metavar="SIGNAL", default=None,
+        help="from the start of the trace window, wait for the port named SIGNAL to be asserted, then move the window"
+            " to start at this cycle")
+    p_simulate.add_argument("--vectors", dest="vectors_file",
+        metavar="VECTORS-FILE", default=None,
+        help="apply the input vectors of VECTORS-FILE, one per cycle, instead of the simulation processes (CSV when"
+            " named *.csv, else binary)")
+    p_simulate.add_argument("--vectors-out", dest="vectors_out_file",
+        metavar="VECTORS-FILE", default=None,
+        help="with --vectors, write the sampled outputs to VECTORS-FILE, one vector per cycle")
+    p_simulate.add_argument("--vectors-expected", dest="vectors_expected_file",
+        metavar="VECTORS-FILE", default=None,
+        help="with --vectors, compare the sampled outputs to the vectors of VECTORS-FILE, and fail on a mismatch")
+    p_simulate.add_argument("--checkpoint-at", dest="checkpoint_at",
+        metavar="CYCLE", type=int, nargs="+", default=[],
+        help="save the state of the simulation at each CYCLE, into the file given by --checkpoint")
+    p_simulate.add_argument("--checkpoint", dest="checkpoint_file",
+        metavar="CHECKPOINT-FILE", default=None,
+        help="with --checkpoint-at, save the states into CHECKPOINT-FILE, where '{cycle}' is replaced by the cycle"
+            " (default: NAME.{cycle}.checkpoint.json.gz)")
+    p_simulate.add_argument("--restore", dest="restore_file",
+        metavar="CHECKPOINT-FILE", default=None,
+        help="start the simulation from the state saved in CHECKPOINT-FILE instead of the reset ; the simulation still"
+            " ends at the cycle given by --clocks")
+    p_simulate.add_argument("--fork", dest="fork_files",
+        metavar="VECTORS-FILE", nargs="+", default=[],
+        help="with --restore, run one copy of the restored simulation per VECTORS-FILE, in parallel, each copy applying"
+            " its vectors ; '{scenario}' in the other file names is replaced by the name of the VECTORS-FILE")
+    p_simulate.add_argument("-j", "--jobs", dest="simulate_jobs",
+        metavar="COUNT", type=int, default=os.cpu_count(),
+        help="with --fork, run at most COUNT copies at once (default: %(default)s)")
+    p_simulate.add_argument("--fast-forward", dest="fast_forward", default=False, action="store_true",
+        help="jump over the cycles where only free running down-counters change, out of the trace window and once the"
+            " simulation processes are done")
+
+    p_verify = p_action.add_parser(
+        "verify", help="formally verify the design with SymbiYosys")
+    p_verify.add_argument("--tasks", dest="verify_tasks",
+        metavar="TASK", nargs="+", choices=["bmc", "cover", "prove"], default=["bmc", "cover"],
+        help="run the TASKs (default: %(default)s)")
+    p_verify.add_argument("--depth", dest="verify_depth",
+        metavar="DEPTH", type=int, default=10,
+        help="solve for DEPTH steps (default: %(default)s)")
+    p_verify.add_argument("--engines", dest="verify_engines",
+        metavar="ENGINE", nargs="+", default=["smtbmc boolector"],
+        help="run each task with each ENGINE concurrently, the first conclusive result wins (default: %(default)s)")
+    p_verify.add_argument("-j", "--jobs", dest="verify_jobs",
+        metavar="COUNT", type=int, default=os.cpu_count(),
+        help="run at most COUNT solvers at once (default: %(default)s)")
+    p_verify.add_argument("--no-cache", dest="verify_cache", default=True, action="store_false",
+        help="solve again tasks whose result is known for the same design and options")
 
-def main_runner_by_sporniket(parser, args, design, platform=None, name="top", ports=(), prepareVerification=None, prepareSimulation=None):
+    for p_profiled in (p_generate, p_simulate, p_verify):
+        p_profiled.add_argument("--profile", dest="profile", default=False, action="store_true",
+            help="time each phase of the action, and write a JSON report (default: next to the generated file or the"
+                " execution trace, else NAME.ACTION.profile.json)")
+        p_profiled.add_argument("--profile-report", dest="profile_report",
+            metavar="REPORT-FILE", default=None,
+            help="write the JSON report of --profile to REPORT-FILE")
+        p_profiled.add_argument("--cprofile", dest="cprofile_phases",
+            metavar="PHASE", nargs="+", choices=PROFILED_PHASES, default=[],
+            help=f"like --profile, and run each PHASE under cProfile, the statistics are written next to the report"
+                f" (PHASE among {', '.join(PROFILED_PHASES)})")
+
+    return parser
+
+
+def main_runner_by_sporniket(parser, args, design, platform=None, name="top", ports=(), prepareVerification=None, prepareSimulation=None,
+        stimulus=()):
+    """Run the action given by the command line.
+
+    `stimulus` are the signals, beside the ports, that the input vectors of the simulate action may drive, e.g. the
+    signals of the test bench that drive the inputs of the module.
+    """
+    cprofile_phases = getattr(args, "cprofile_phases", ())
+    profiler = PhaseProfiler(enabled=getattr(args, "profile", False) or len(cprofile_phases) > 0,
+        cprofile_phases=cprofile_phases)
+    try:
+        run_action(parser, args, design, platform, name, ports, prepareVerification, prepareSimulation, stimulus, profiler)
+    finally:
+        if profiler.phases:
+            report_file = getattr(args, "profile_report", None) or default_profile_report(args, name)
+            profiler.write_report(report_file, action=args.action, name=name)
+    if getattr(args, "generate_watch", False) and not _watching:
+        watch_and_run_again(os.path.realpath(sys.modules["__main__"].__file__))
+
+
+def run_action(parser, args, design, platform, name, ports, prepareVerification, prepareSimulation, stimulus, profiler):
     if args.action == "generate":
+        outputs = [(file, generate_type_of(file, args.generate_type)) for file in args.generate_files]
+        if not outputs:
+            if getattr(args, "generate_watch", False):
+                parser.error("--watch requires FILEs to generate")
+            outputs = [(None, args.generate_type)]
+        for file, generate_type in outputs:
+            if generate_type is None:
+                parser.error(f"Unable to auto-detect language of {file or 'the standard output'}, specify explicitly"
+                    " with -t/--type")
         if not prepareVerification is None:
-            prepareVerification(design)
-        fragment = Fragment.get(design, platform)
-        generate_type = args.generate_type
-        if generate_type is None and args.generate_file:
-            if args.generate_file.name.endswith(".il"):
-                generate_type = "il"
-            if args.generate_file.name.endswith(".cc"):
-                generate_type = "cc"
-            if args.generate_file.name.endswith(".v"):
-                generate_type = "v"
-        if generate_type is None:
-            parser.error("Unable to auto-detect language, specify explicitly with -t/--type")
+            with profiler.phase("prepareVerification"):
+                prepareVerification(design)
+        with profiler.phase("elaboration"):
+            fragment = Fragment.get(design, platform)
+        profiler.measure_design(fragment)
+        with profiler.phase("conversion"):
+            texts = convert_all(fragment, name, ports, {generate_type for _, generate_type in outputs}, args.emit_src)
+        with profiler.phase("output"):
+            for file, generate_type in outputs:
+                if file is None:
+                    print(texts[generate_type])
+                else:
+                    print(f"{'written' if write_if_changed(file, texts[generate_type]) else 'unchanged':<9} : {file}",
+                        file=sys.stderr)
+
+    if args.action == "simulate":
+        if args.sync_period is None:
+            clock_frequency = getattr(platform, "default_clk_frequency", None)
+            args.sync_period = 1e-6 if clock_frequency is None else 1 / clock_frequency
+        with profiler.phase("elaboration"):
+            fragment = Fragment.get(design, platform)
+        profiler.measure_design(fragment)
+        profiler.details.update(engine=getattr(args, "engine", "pysim"), sync_clocks=args.sync_clocks)
+        trace_trigger = getattr(args, "trace_trigger", None)
+        if trace_trigger is not None:
+            trace_trigger = find_port(parser, ports, trace_trigger)
+        window = dict(trace_from=getattr(args, "trace_from", 0), trace_until=getattr(args, "trace_until", None),
+            trace_trigger=trace_trigger)
+        # -- a missing tool would only fail once the trace window opens, after the whole warm-up
+        waveform_tool = None if args.vcd_file is None else WaveformFile.tool(args.vcd_file)
+        if waveform_tool is not None and shutil.which(waveform_tool) is None:
+            parser.error(f"'{waveform_tool}' is required to write {args.vcd_file}, install the GTKWave tools or set"
+                " VCD2FST")
+        vectors_file = getattr(args, "vectors_file", None)
+        fork_files = getattr(args, "fork_files", [])
+        restore_file = getattr(args, "restore_file", None)
+        if vectors_file is None and not fork_files and (getattr(args, "vectors_out_file", None)
+                or getattr(args, "vectors_expected_file", None)):
+            parser.error("--vectors-out and --vectors-expected require --vectors or --fork")
+        checkpoint_pattern = getattr(args, "checkpoint_file", None) or f"{name}.{{cycle}}.checkpoint.json.gz"
+        checkpoints = {cycle: checkpoint_pattern.replace("{cycle}", str(cycle))
+            for cycle in getattr(args, "checkpoint_at", [])}
+        if fork_files:
+            if restore_file is None:
+                parser.error("--fork requires --restore")
+            if vectors_file is not None or checkpoints or args.gtkw_file is not None:
+                parser.error("--fork applies its own vectors to each copy, it excludes --vectors, --checkpoint-at and"
+                    " --gtkw-file")
+        if getattr(args, "engine", "pysim") == "cxxrtl":
+            if vectors_file is not None:
+                parser.error("The cxxrtl engine does not drive any input, --vectors requires the pysim engine")
+            if checkpoints or restore_file is not None or fork_files:
+                parser.error("The checkpoints of the simulation require the pysim engine")
+            if getattr(args, "fast_forward", False):
+                parser.error("The cxxrtl engine runs every cycle, --fast-forward requires the pysim engine")
+            if not prepareSimulation is None:
+                warnings.warn("The cxxrtl engine only drives the 'sync' clock, the simulation processes are ignored")
+            run_cxxrtl_simulation(fragment, ports=ports, sync_period=args.sync_period, sync_clocks=args.sync_clocks,
+                vcd_file=args.vcd_file, gtkw_file=args.gtkw_file, profiler=profiler, **window)
+            return
+        checkpoint = None
+        start_cycle = 0
+        if restore_file is not None:
+            checkpoint = read_checkpoint(restore_file)
+            start_cycle = checkpoint["cycle"]
+            if args.sync_clocks < start_cycle:
+                parser.error(f"{restore_file} is saved at cycle {start_cycle}, after the end of the simulation")
+            profiler.details.update(restored_cycle=start_cycle)
+        if fork_files:
+            with profiler.phase("simulation"):
+                passed = run_forked_simulations(parser, fragment, ports, stimulus, checkpoint, fork_files,
+                    sync_period=args.sync_period, sync_clocks=args.sync_clocks, vcd_file=args.vcd_file,
+                    output_file=getattr(args, "vectors_out_file", None),
+                    expected_file=getattr(args, "vectors_expected_file", None), jobs=args.simulate_jobs, **window)
+            if not passed:
+                sys.exit(1)
+            return
+        with profiler.phase("compilation"):
+            from amaranth.sim import Simulator
+            sim = Simulator(fragment)
+            sim.add_clock(args.sync_period)
+            if checkpoint is not None:
+                try:
+                    restore_checkpoint(sim, checkpoint, args.sync_period)
+                except ValueError as e:
+                    parser.error(f"Unable to restore {restore_file} : {e}")
+        with profiler.phase("prepareSimulation"):
+            if vectors_file is not None:
+                testbench = VectorTestbench(parser, fragment, ports, stimulus, vectors_file,
+                    getattr(args, "vectors_out_file", None), getattr(args, "vectors_expected_file", None))
+                # -- not a sync process, that would only start after the first clock edge
+                sim.add_process(testbench.process(args.sync_clocks, start_cycle))
+            elif not prepareSimulation is None:
+                prepareSimulation(sim, design)
+        fast_forward = FastForward(sim, args.sync_period) if getattr(args, "fast_forward", False) else None
+        with profiler.phase("simulation"):
+            run_python_simulation(sim, ports=ports, sync_period=args.sync_period, sync_clocks=args.sync_clocks,
+                vcd_file=args.vcd_file, gtkw_file=args.gtkw_file, start_cycle=start_cycle, checkpoints=checkpoints,
+                fast_forward=fast_forward, **window)
+        if fast_forward is not None:
+            profiler.details.update(fast_forward=fast_forward.summary())
+            print(f"fast-forward : {fast_forward.skipped} of {args.sync_clocks - start_cycle} cycles skipped in"
+                f" {fast_forward.jumps} jumps, {len(fast_forward.counters)} down-counters", file=sys.stderr)
+        if vectors_file is not None and not testbench.report():
+            sys.exit(1)
+
+    if args.action == "verify":
+        sby = os.environ.get("SBY", "sby")
+        if shutil.which(sby) is None:
+            parser.error(f"'{sby}' is required to verify, install SymbiYosys or set SBY")
+        if not prepareVerification is None:
+            with profiler.phase("prepareVerification"):
+                prepareVerification(design)
+        with profiler.phase("elaboration"):
+            fragment = Fragment.get(design, platform)
+        profiler.measure_design(fragment)
+        with profiler.phase("conversion"):
+            from amaranth.back import rtlil
+            output = rtlil.convert(fragment, name=name, ports=ports)
+        with profiler.phase("verification"):
+            results = run_formal_verification(output, name=name, tasks=args.verify_tasks, depth=args.verify_depth,
+                engines=args.verify_engines, jobs=args.verify_jobs, useCache=args.verify_cache)
+        if any(result["status"] != "PASS" for result in results.values()):
+            sys.exit(1)
+
+
+### generation ###
+
+# the language of a generated file, by extension
+GENERATE_TYPES = {".il": "il", ".cc": "cc", ".v": "v"}
+
+
+def generate_type_of(file:str, generate_type:str = None) -> str:
+    """The language of the file, by its extension, else `generate_type`."""
+    return GENERATE_TYPES.get(os.path.splitext(file)[1], generate_type)
+
+
+def convert_all(fragment:Fragment, name:str, ports, generate_types, emit_src:bool = True) -> dict:
+    """Convert the design into each language, and return the texts by language.
+
+    The design is converted into RTLIL once, Verilog and CXXRTL are derived from the RTLIL by yosys, like
+    `verilog.convert()` and `cxxrtl.convert()` do.
+    """
+    from amaranth.back import rtlil
+
+    rtlil_text, _ = rtlil.convert_fragment(fragment.prepare(ports=ports), name=name, emit_src=emit_src)
+    texts = {}
+    for generate_type in generate_types:
         if generate_type == "il":
-            output = rtlil.convert(fragment, name=name, ports=ports, emit_src=args.emit_src)
+            texts[generate_type] = rtlil_text
         if generate_type == "cc":
-            output = cxxrtl.convert(fragment, name=name, ports=ports, emit_src=args.emit_src)
+            from amaranth.back import cxxrtl
+            texts[generate_type] = cxxrtl._convert_rtlil_text(rtlil_text, None)
         if generate_type == "v":
-            output = verilog.convert(fragment, name=name, ports=ports, emit_src=args.emit_src)
-        if args.generate_file:
-            args.generate_file.write(output)
+            from amaranth.back import verilog
+            texts[generate_type] = verilog._convert_rtlil_text(rtlil_text)
+    return texts
+
+
+def write_if_changed(file:str, text:str) -> bool:
+    """Write the text into the file, unless the file has the same content ; return True when written.
+
+    An unchanged file keeps its modification time, so that the tools that depend on it (sby, yosys, make...) are not
+    run again. The file is replaced at once, a tool never reads it half written.
+    """
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    try:
+        with open(file, "rb") as f:
+            if hashlib.sha256(f.read()).digest() == digest:
+                return False
+    except OSError:
+        pass
+    with open(file + ".tmp", "w") as f:
+        f.write(text)
+    os.replace(file + ".tmp", file)
+    return True
+
+
+### watch mode ###
+
+# the period of the polling of the source files, in seconds
+WATCH_PERIOD = 0.5
+
+# True while the watch mode runs the script again, for `main_runner_by_sporniket` to only run the action
+_watching = False
+
+
+def watched_sources() -> dict:
+    """The python files of the design : the modules imported out of python and its installed packages, by name."""
+    paths = sysconfig.get_paths()
+    library_dirs = [os.path.realpath(paths[key]) + os.sep for key in ("stdlib", "platstdlib", "purelib", "platlib")]
+    sources = {}
+    for name, module in list(sys.modules.items()):
+        file = getattr(module, "__file__", None)
+        if file is None or not file.endswith(".py"):
+            continue
+        file = os.path.realpath(file)
+        if not any(file.startswith(library_dir) for library_dir in library_dirs):
+            sources[name] = file
+    return sources
+
+
+def modification_times(files) -> dict:
+    """The modification time of each file, None when it cannot be read."""
+    times = {}
+    for file in files:
+        try:
+            times[file] = os.stat(file).st_mtime_ns
+        except OSError:
+            times[file] = None
+    return times
+
+
+def watch_and_run_again(script:str):
+    """Run the script again each time one of its source files changes, until interrupted.
+
+    The modules of the design are imported again, python, amaranth and this module stay loaded : a change of this
+    module requires to restart the watch. An error of a run is reported, and the watch goes on.
+    """
+    global _watching
+    sources = watched_sources()
+    times = modification_times({script, *sources.values()})
+    print(f"watching {len(times)} source files, interrupt to stop", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(WATCH_PERIOD)
+            current = modification_times(times)
+            changed = [file for file in current if current[file] != times[file]]
+            if not changed:
+                continue
+            print(f"changed   : {', '.join(os.path.relpath(file) for file in changed)}", file=sys.stderr)
+            for name in sources:
+                if name not in ("__main__", __name__):
+                    sys.modules.pop(name, None)
+            _watching = True
+            try:
+                runpy.run_path(script, run_name="__main__")
+            except SystemExit as e:
+                if e.code:
+                    print(f"failed    : exit code {e.code}", file=sys.stderr)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                _watching = False
+            sources = watched_sources()
+            times = modification_times({script, *sources.values(), *changed})
+    except KeyboardInterrupt:
+        print("watch stopped", file=sys.stderr)
+
+
+def find_port(parser, ports, name):
+    """Find the port of the design with the given name."""
+    for port in ports:
+        if port.name == name:
+            return port
+    parser.error(f"No port named '{name}', known ports are : {', '.join(port.name for port in ports)}")
+
+
+### profiling ###
+
+# the phases of the actions, in the order they may happen
+PROFILED_PHASES = ["prepareVerification", "elaboration", "conversion", "compilation", "prepareSimulation",
+    "simulation", "verification", "output"]
+
+
+def default_profile_report(args, name:str) -> str:
+    """The report of --profile goes next to the generated file or the execution trace, if any."""
+    output = next(iter(getattr(args, "generate_files", None) or []), None) or getattr(args, "vcd_file", None)
+    if output is not None:
+        return f"{output}.profile.json"
+    return f"{name}.{args.action}.profile.json"
+
+
+def count_statements(statements) -> int:
+    """Count the statements, including the statements nested into the cases of the switches."""
+    count = 0
+    for statement in statements:
+        count += 1
+        if isinstance(statement, Switch):
+            for case_statements in statement.cases.values():
+                count += count_statements(case_statements)
+    return count
+
+
+class PhaseProfiler:
+    """Time the phases of an action, run the selected phases under cProfile, and write the results as JSON.
+
+    When disabled, the phases are only run.
+    """
+
+    def __init__(self, enabled:bool = False, cprofile_phases=()):
+        self.enabled = enabled
+        self.cprofile_phases = set(cprofile_phases)
+        self.phases = []  # (name, seconds, cProfile.Profile or None), in the order they are run
+        self.design = {}
+        self.details = {}
+
+    @contextmanager
+    def phase(self, name:str):
+        if not self.enabled:
+            yield
+            return
+        profile = cProfile.Profile() if name in self.cprofile_phases else None
+        start = time.perf_counter()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            self.phases.append((name, time.perf_counter() - start, profile))
+
+    def measure_design(self, fragment:Fragment):
+        """Record the size of the elaborated design : fragments, statements and signals."""
+        if not self.enabled:
+            return
+        fragments, statements, signals = 0, 0, SignalSet()
+        pending = [fragment]
+        while pending:
+            current = pending.pop()
+            fragments += 1
+            statements += count_statements(current.statements)
+            for statement in current.statements:
+                signals |= statement._lhs_signals() | statement._rhs_signals()
+            pending.extend(subfragment for subfragment, _ in current.subfragments)
+        self.design = dict(fragments=fragments, statements=statements, signals=len(signals))
+
+    def write_report(self, report_file:str, **details):
+        """Write the report, and the statistics of each phase run under cProfile next to it."""
+        base = report_file[:-len(".json")] if report_file.endswith(".json") else report_file
+        phases = []
+        for index, (name, seconds, profile) in enumerate(self.phases):
+            phase = dict(name=name, seconds=round(seconds, 6))
+            if profile is not None:
+                phase["cprofile"] = f"{base}.{index}-{name}.prof"
+                profile.dump_stats(phase["cprofile"])
+            phases.append(phase)
+        report = dict(details, **self.details, python=sys.version.split()[0], amaranth=amaranth_version,
+            design=self.design, phases=phases, seconds=round(sum(seconds for _, seconds, _ in self.phases), 6))
+        with open(report_file, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        summary = ", ".join(f"{phase['name']} {phase['seconds']:.3f} s" for phase in phases)
+        print(f"profile : {summary} -- {report_file}", file=sys.stderr)
+
+
+### waveforms ###
+
+class WaveformFile:
+    """A text stream to write a VCD trace, in the format given by the extension of the file name.
+
+    * `*.vcd` : plain VCD.
+    * `*.vcd.gz` : VCD compressed on the fly with gzip.
+    * `*.fst` : FST, converted on the fly by `vcd2fst` (GTKWave tools, the path can be overriden by `VCD2FST`).
+    """
+
+    @staticmethod
+    def tool(name:str):
+        """The external tool needed to write the file `name`, None when it is written by python itself."""
+        return os.environ.get("VCD2FST", "vcd2fst") if name.endswith(".fst") else None
+
+    def __init__(self, name:str):
+        self.name = name
+        self._size = 0
+        self._process = None
+        tool = self.tool(name)
+        if tool is not None:
+            self._process = subprocess.Popen([tool, "-v", "-", "-f", name],
+                stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, encoding="utf-8")
+            self._stream = self._process.stdin
+        elif name.endswith(".gz"):
+            self._stream = gzip.open(name, "wt", compresslevel=6)
         else:
-            print(output)
+            self._stream = open(name, "w")
 
-    if args.action == "simulate":
-        fragment = Fragment.get(design, platform)
-        sim = Simulator(fragment)
-        sim.add_clock(args.sync_period)
-        if not prepareSimulation is None:
-            prepareSimulation(sim, design)
-        with sim.write_vcd(vcd_file=args.vcd_file, gtkw_file=args.gtkw_file, traces=ports):
-            sim.run_until(args.sync_period * args.sync_clocks, run_passive=True)
+    def write(self, text:str) -> int:
+        self._size += len(text)
+        return self._stream.write(text)
+
+    def tell(self) -> int:
+        return self._size
+
+    def flush(self):
+        self._stream.flush()
+
+    def close(self):
+        if self._stream.closed:
+            return
+        self._stream.close()
+        if self._process is not None and self._process.wait() != 0:
+            raise RuntimeError(f"vcd2fst failed to write '{self.name}'")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def trace_window(sync_clocks:int, trace_from:int = 0, trace_until:int = None, start_cycle:int = 0):
+    """Clip the trace window to the simulation, and return it as (first cycle, cycle after the last one)."""
+    trace_until = sync_clocks if trace_until is None else min(max(trace_until, start_cycle), sync_clocks)
+    trace_from = min(max(trace_from, start_cycle), trace_until)
+    return trace_from, trace_until
+
+
+@contextmanager
+def write_vcd_from_now(sim:"Simulator", vcd_file, gtkw_file=None, traces=()):
+    """Like `Simulator.write_vcd()`, that refuses to start after the simulation time advanced."""
+    engine = sim._engine
+    with engine.write_vcd(vcd_file=vcd_file, gtkw_file=gtkw_file, traces=traces):
+        if engine.now > 0:
+            # -- the writer starts from the reset values, update it with the current values.
+            vcd_writer = engine._vcd_writers[-1]
+            for signal, index in engine._state.signals.items():
+                vcd_writer.update(engine.now, signal, engine._state.slots[index].curr)
+        yield
+
+
+def run_python_simulation(sim:"Simulator", ports=(), sync_period=1e-6, sync_clocks=0, vcd_file=None, gtkw_file=None,
+        trace_from=0, trace_until=None, trace_trigger=None, start_cycle=0, checkpoints=None, fast_forward=None):
+    """Run the simulation from `start_cycle` until `sync_clocks` periods, and only trace the cycles inside the trace
+    window.
+
+    Out of the window, the simulation runs without any VCD writer attached. When waiting for the trigger,
+    the simulation is run one period at a time to check the trigger. `checkpoints` gives the file where to save the
+    state of the simulation, by cycle. `fast_forward`, a `FastForward` of the simulator, runs the cycles instead of
+    the simulator.
+    """
+    pending_checkpoints = sorted(cycle for cycle in (checkpoints or {}) if start_cycle <= cycle <= sync_clocks)
+    current_cycle = start_cycle
+
+    def run_until_cycle(cycle:int):
+        nonlocal current_cycle
+        # -- stop at each checkpoint on the way
+        for stop in [c for c in pending_checkpoints if c <= cycle] + [cycle]:
+            if stop > current_cycle and fast_forward is not None:
+                fast_forward.run(current_cycle, stop)
+            elif stop > current_cycle:
+                sim.run_until(sync_period * stop, run_passive=True)
+            current_cycle = max(current_cycle, stop)
+            if stop in pending_checkpoints:
+                pending_checkpoints.remove(stop)
+                save_checkpoint(sim, checkpoints[stop], stop, sync_period)
+
+    if vcd_file is None:
+        run_until_cycle(sync_clocks)
+        return
+
+    window_start, window_end = trace_window(sync_clocks, trace_from, trace_until, start_cycle)
+    run_until_cycle(window_start)
+    if trace_trigger is not None:
+        state = sim._engine._state
+        trigger = state.slots[state.get_signal(trace_trigger)]
+        cycle = window_start
+        while not trigger.curr and cycle < sync_clocks:
+            cycle += 1
+            run_until_cycle(cycle)
+        window_start, window_end = trace_window(sync_clocks, cycle, cycle + window_end - window_start, start_cycle)
+
+    with WaveformFile(vcd_file) as vcd_stream, write_vcd_from_now(sim, vcd_stream, gtkw_file, traces=ports):
+        run_until_cycle(window_end)
+    run_until_cycle(sync_clocks)
+
+
+### fast-forward ###
+
+def is_decrement(signal:Signal, value) -> bool:
+    """Whether `value` is `signal - 1`."""
+    return (isinstance(value, Operator) and value.operator == "-" and value.operands[0] is signal
+        and isinstance(value.operands[1], Const) and value.operands[1].value == 1)
+
+
+def collect_reads(value, reads:SignalSet):
+    """Collect the signals read by `value`, except the signals only compared to zero."""
+    if isinstance(value, Operator) and value.operator == "==" and isinstance(value.operands[0], Signal) \
+            and isinstance(value.operands[1], Const) and value.operands[1].value == 0:
+        return
+    if isinstance(value, Operator):
+        for operand in value.operands:
+            collect_reads(operand, reads)
+    elif isinstance(value, Slice):
+        collect_reads(value.value, reads)
+    elif isinstance(value, Cat):
+        for part in value.parts:
+            collect_reads(part, reads)
+    elif not isinstance(value, Const):
+        reads.update(value._rhs_signals())
+
+
+def find_down_counters(fragment:Fragment, domain:str = "sync") -> SignalSet:
+    """The free running down-counters of a domain of the (prepared) design.
+
+    A down-counter is a register of the domain that is only assigned a constant or itself minus one, and that the rest
+    of the design only compares to zero ; while it is not zero, its value does not matter to the rest of the design.
+    """
+    registers = SignalSet()
+    decremented = SignalSet()
+    reads = SignalSet()
+    others = SignalSet()  # -- the signals assigned anything else
+
+    def walk(statements):
+        for statement in statements:
+            if isinstance(statement, Assign) and isinstance(statement.lhs, Signal):
+                if is_decrement(statement.lhs, statement.rhs):
+                    decremented.add(statement.lhs)
+                elif not isinstance(statement.rhs, Const):
+                    others.add(statement.lhs)
+                    collect_reads(statement.rhs, reads)
+            elif isinstance(statement, Assign):
+                others.update(statement.lhs._lhs_signals())
+                reads.update(statement.lhs._rhs_signals())
+                collect_reads(statement.rhs, reads)
+            elif isinstance(statement, Switch):
+                collect_reads(statement.test, reads)
+                for case_statements in statement.cases.values():
+                    walk(case_statements)
+            else:
+                reads.update(statement._rhs_signals())
+
+    fragments = [fragment]
+    while fragments:
+        current = fragments.pop()
+        registers.update(current.drivers.get(domain, ()))
+        walk(current.statements)
+        fragments.extend(subfragment for subfragment, _ in current.subfragments)
+    return SignalSet(signal for signal in decremented
+        if signal in registers and signal not in reads and signal not in others and not signal.shape().signed)
+
+
+class FastForward:
+    """Run the python simulation, jumping over the spans of cycles where only free running down-counters change.
+
+    A span is detected by watching two cycles : every signal keeps its value, but down-counters that decrease by one.
+    As the rest of the design only sees whether a counter is zero, the next cycles are the same until the first
+    counter reaches zero : the counters are decreased and the time is advanced at once, up to this cycle.
+
+    Only the idle simulation is watched : no VCD writer is attached, and the python processes are done. After a
+    failed attempt, more and more cycles (up to `MAX_BACKOFF`) are simulated before the next one.
+    """
+
+    # the most cycles simulated between two attempts
+    MAX_BACKOFF = 1024
+
+    def __init__(self, sim:"Simulator", sync_period:float, domain:str = "sync"):
+        self.sim = sim
+        self.sync_period = sync_period
+        state = sim._engine._state
+        clocks = clock_processes(sim)
+        domains = sim._fragment.domains
+        # -- the time of a single clock is advanced, any other clock would drift
+        self.clock = None
+        if len(clocks) == 1 and domain in domains and domains[domain].clk in clocks:
+            self.clock = clocks[domains[domain].clk]
+        counters = find_down_counters(sim._fragment, domain) if self.clock is not None else ()
+        self.counters = SignalSet(counters)
+        self._slots = {state.get_signal(counter) for counter in counters}
+        self.backoff = 1
+        self.wait = 0
+        self.skipped = 0
+        self.jumps = 0
+
+    def summary(self) -> dict:
+        return dict(counters=sorted(counter.name for counter in self.counters), skipped=self.skipped, jumps=self.jumps)
+
+    def is_idle(self) -> bool:
+        from amaranth.sim._pycoro import PyCoroProcess
+
+        engine = self.sim._engine
+        return (not engine._vcd_writers and not engine._timeline.deadlines
+            and all(process.coroutine is None for process in engine._processes if isinstance(process, PyCoroProcess)))
+
+    def run(self, cycle:int, target:int):
+        """Run the simulation from the start of `cycle` to the start of `target`."""
+        if not self._slots:
+            self.sim.run_until(self.sync_period * target, run_passive=True)
+            return
+        while cycle < target:
+            if self.wait == 0 and target - cycle > 2:
+                if self.is_idle():
+                    cycle = self.attempt(cycle, target)
+                    continue
+                self.failed()
+            steps = min(max(self.wait, 1), target - cycle)
+            self.sim.run_until(self.sync_period * (cycle + steps), run_passive=True)
+            cycle += steps
+            self.wait = max(0, self.wait - steps)
+
+    def attempt(self, cycle:int, target:int) -> int:
+        """Watch two cycles, then jump when only down-counters changed ; return the cycle reached."""
+        engine = self.sim._engine
+        slots = engine._state.slots
+        watched = [[slot.curr for slot in slots]]
+        for step in (1, 2):
+            self.sim.run_until(self.sync_period * (cycle + step), run_passive=True)
+            watched.append([slot.curr for slot in slots])
+        cycle += 2
+        moving = []
+        for index, (before, middle, after) in enumerate(zip(*watched)):
+            if before == middle == after:
+                continue
+            if index not in self._slots or middle != before - 1 or after != middle - 1:
+                self.failed()
+                return cycle
+            moving.append(index)
+        # -- the last cycle is simulated, for the simulation to stop at the very same time as without any jump
+        jump = min([slots[index].curr for index in moving] + [target - cycle - 1])
+        if not moving or jump == 0:
+            self.failed()
+            return cycle
+        # -- committed like any change, for the logic comparing the counters to zero to run again
+        for index in moving:
+            slots[index].set(slots[index].curr - jump)
+        engine._state.commit()
+        engine._timeline.now += jump * self.clock.period
+        self.skipped += jump
+        self.jumps += 1
+        self.backoff = 1
+        return cycle + jump
+
+    def failed(self):
+        self.wait = self.backoff
+        self.backoff = min(2 * self.backoff, self.MAX_BACKOFF)
+
+
+### vector files ###
+
+def is_csv(name:str) -> bool:
+    return name.endswith(".csv")
+
+
+class VectorReader:
+    """Read a file of vectors, one per cycle, without loading the whole file.
+
+    * `*.csv` : a header with the name of each port, then one row per cycle ; the values are integers in any base
+      known by python (`12`, `0x0c`, `0b1100`), an empty field or `x` means "don't care" (the input keeps its value,
+      the output is not compared).
+    * other names : binary, a text header `vectors NAME:WIDTH NAME:WIDTH...` then one record per cycle, each value
+      stored unsigned, little endian, in as many bytes as required by its width. The records are memory-mapped.
+    """
+
+    def __init__(self, name:str):
+        self.name = name
+        if is_csv(name):
+            self._file = open(name, newline="")
+            self._rows = csv.reader(self._file)
+            self.names = [field.strip() for field in next(self._rows)]
+            self.widths = None
+        else:
+            self._file = open(name, "rb")
+            header = self._file.readline().decode("ascii").split()
+            if len(header) == 0 or header[0] != "vectors":
+                raise ValueError(f"{name} is not a binary vector file")
+            self.names = [field.split(":")[0] for field in header[1:]]
+            self.widths = [int(field.split(":")[1]) for field in header[1:]]
+            self._start = self._file.tell()
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __iter__(self):
+        """Iterate over the vectors, a list of values (None for "don't care") in the order of the names."""
+        if self.widths is None:
+            for row in self._rows:
+                yield [None if field.strip() in ("", "x", "X") else int(field.strip(), 0) for field in row]
+            return
+        sizes = [(width + 7) // 8 for width in self.widths]
+        record = sum(sizes)
+        if record == 0:
+            return
+        for start in range(self._start, len(self._map) - record + 1, record):
+            values = []
+            for size in sizes:
+                values.append(int.from_bytes(self._map[start : start + size], "little"))
+                start += size
+            yield values
+
+    def close(self):
+        if self.widths is not None:
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class VectorWriter:
+    """Write a file of vectors, one per cycle, in the format given by the extension of the file name (see
+    `VectorReader`). The vectors are streamed to the file."""
+
+    def __init__(self, name:str, names, widths):
+        self.names = list(names)
+        self.widths = list(widths)
+        if is_csv(name):
+            self._file = open(name, "w", newline="")
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(self.names)
+        else:
+            self._file = open(name, "wb", buffering=1 << 20)
+            self._file.write(("vectors " + " ".join(f"{n}:{w}" for n, w in zip(self.names, self.widths)) + "\n")
+                .encode("ascii"))
+            self._writer = None
+            self._formats = [((1 << width) - 1, (width + 7) // 8) for width in self.widths]
+
+    def write(self, values):
+        if self._writer is not None:
+            self._writer.writerow(values)
+        else:
+            self._file.write(b"".join((value & mask).to_bytes(size, "little")
+                for value, (mask, size) in zip(values, self._formats)))
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class VectorTestbench:
+    """Apply input vectors to the design at each cycle, sample the other ports, and compare them to expected vectors.
+
+    During each cycle, the inputs are given their vector, the combinational logic settles, then the outputs are
+    sampled, before the clock edge ending the cycle. The ports that are not driven by the input vectors (except the
+    clocks) are the outputs.
+    """
+
+    # the count of mismatches that are detailed
+    MAX_REPORTED = 10
+
+    def __init__(self, parser, fragment, ports, stimulus, vectors_file:str, output_file:str=None, expected_file:str=None):
+        self.vectors_file = vectors_file
+        self.output_file = output_file
+        self.expected_file = expected_file
+        with VectorReader(vectors_file) as reader:
+            self.inputs = [find_port(parser, list(stimulus) + list(ports), name) for name in reader.names]
+        # -- the clocks and the resets of the domains are not outputs, a reset is an input when the vectors drive it
+        controls = SignalSet(domain.clk for domain in fragment.domains.values())
+        controls.update(domain.rst for domain in fragment.domains.values() if domain.rst is not None)
+        input_names = {signal.name for signal in self.inputs}
+        self.outputs = [port for port in ports if port.name not in input_names and port not in controls]
+        self.expected_columns = []
+        if expected_file is not None:
+            names = [port.name for port in self.outputs]
+            with VectorReader(expected_file) as reader:
+                expected_names = reader.names
+            for name in expected_names:
+                if name not in names:
+                    parser.error(f"No output named '{name}' in {expected_file}, known outputs are : {', '.join(names)}")
+                self.expected_columns.append(names.index(name))
+        self.cycles = 0
+        self.mismatches = 0
+        self.reported = []
+
+    def process(self, sync_clocks:int, start_cycle:int = 0):
+        """The simulation process applying the vectors from `start_cycle` (e.g. a restored checkpoint) until
+        `sync_clocks` at most ; the mismatches are reported by cycle since the reset."""
+        from amaranth.sim import Settle, Tick
+
+        def process():
+            inputs = VectorReader(self.vectors_file)
+            expected = VectorReader(self.expected_file) if self.expected_file is not None else None
+            writer = None
+            if self.output_file is not None:
+                writer = VectorWriter(self.output_file, [port.name for port in self.outputs],
+                    [len(port) for port in self.outputs])
+            try:
+                input_vectors = iter(inputs)
+                expected_vectors = iter(expected) if expected is not None else iter(())
+                current = [None] * len(self.inputs)
+                for cycle in range(start_cycle, sync_clocks):
+                    vector = next(input_vectors, None)
+                    if vector is None and expected is None and writer is None:
+                        return
+                    for i, (signal, value) in enumerate(zip(self.inputs, vector or ())):
+                        # -- only write the inputs that change
+                        if value is not None and value != current[i]:
+                            current[i] = value
+                            yield signal.eq(value)
+                    yield Settle()
+                    values = []
+                    for signal in self.outputs:
+                        values.append((yield signal))
+                    if writer is not None:
+                        writer.write(values)
+                    self.check(cycle, values, next(expected_vectors, None))
+                    self.cycles = cycle + 1 - start_cycle
+                    yield Tick("sync")
+            finally:
+                if writer is not None:
+                    writer.close()
+                inputs.close()
+                if expected is not None:
+                    expected.close()
+        return process
+
+    def check(self, cycle:int, values, expected_vector):
+        if expected_vector is None:
+            return
+        for column, expected_value in zip(self.expected_columns, expected_vector):
+            port = self.outputs[column]
+            mask = (1 << len(port)) - 1
+            if expected_value is not None and (values[column] ^ expected_value) & mask != 0:
+                self.mismatches += 1
+                if len(self.reported) < self.MAX_REPORTED:
+                    self.reported.append(f"cycle {cycle} : {port.name} is {values[column]}, expected {expected_value}")
+
+    def report(self) -> bool:
+        """Print the result of the comparison, and tell whether the outputs are the expected ones."""
+        if self.expected_file is None:
+            return True
+        for mismatch in self.reported:
+            print(mismatch)
+        if self.mismatches > len(self.reported):
+            print(f"... and {self.mismatches - len(self.reported)} other mismatches")
+        print(f"vectors : {self.cycles} cycles, {self.mismatches} mismatches against {self.expected_file}")
+        return self.mismatches == 0
+
+
+### checkpoints ###
+
+# the version of the content of a checkpoint file
+CHECKPOINT_FORMAT = 1
+
+
+def checkpoint_signal_names(fragment:Fragment):
+    """The hierarchical name of each signal of the (prepared) design, that identifies it across runs."""
+    names = SignalDict()
+    for subfragment, subfragment_name in fragment._assign_names_to_fragments(hierarchy=("top",)).items():
+        for signal, signal_name in subfragment._assign_names_to_signals().items():
+            name = ".".join((*subfragment_name, signal_name))
+            if signal not in names or name < names[signal]:
+                names[signal] = name
+    return names
+
+
+def checkpoint_design_key(names) -> str:
+    """Hash the names, widths and reset values of the signals : a checkpoint is only restored into the same design."""
+    digest = hashlib.sha256()
+    for name, width, reset in sorted((name, len(signal), signal.reset) for signal, name in names.items()):
+        digest.update(f"{name}:{width}:{reset}\n".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def clock_processes(sim:"Simulator") -> dict:
+    """The processes of the simulator that drive a clock, by clock signal."""
+    from amaranth.sim._pyclock import PyClockProcess
+
+    state = sim._engine._state
+    return SignalDict((state.slots[process.slot].signal, process) for process in sim._engine._processes
+        if isinstance(process, PyClockProcess))
+
+
+def save_checkpoint(sim:"Simulator", checkpoint_file:str, cycle:int, sync_period:float):
+    """Save the state of the python simulator, between two cycles : the value of each signal, the time, and the phase
+    of each clock.
+
+    The python processes (the stimulus of the test bench) are generators, their position cannot be saved ; they are
+    started again by the run restoring the checkpoint.
+    """
+    engine = sim._engine
+    names = checkpoint_signal_names(sim._fragment)
+    state = engine._state
+    clocks = {}
+    for clock, process in clock_processes(sim).items():
+        deadline = engine._timeline.deadlines.get(process)
+        clocks[names[clock]] = dict(initial=process.initial, runnable=process.runnable,
+            delay=None if deadline is None else deadline - engine.now)
+    checkpoint = dict(format=CHECKPOINT_FORMAT, amaranth=amaranth_version, design=checkpoint_design_key(names),
+        cycle=cycle, now=engine.now, sync_period=sync_period, clocks=clocks,
+        signals={names[signal]: state.slots[index].curr for signal, index in state.signals.items() if signal in names})
+    temporary_file = f"{checkpoint_file}.tmp"
+    with gzip.open(temporary_file, "wt", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+    os.replace(temporary_file, checkpoint_file)
+    print(f"checkpoint : cycle {cycle} saved into {checkpoint_file}", file=sys.stderr)
+
+
+def read_checkpoint(checkpoint_file:str) -> dict:
+    with gzip.open(checkpoint_file, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def restore_checkpoint(sim:"Simulator", checkpoint:dict, sync_period:float):
+    """Put a new simulator, with its clocks but before it runs, in the state saved by `save_checkpoint()`.
+
+    Raise ValueError when the checkpoint was saved from another design or another clock period.
+    """
+    engine = sim._engine
+    if engine.now != 0:
+        raise ValueError("the simulation has already started")
+    if checkpoint.get("format") != CHECKPOINT_FORMAT:
+        raise ValueError(f"unknown format {checkpoint.get('format')}")
+    names = checkpoint_signal_names(sim._fragment)
+    if checkpoint["design"] != checkpoint_design_key(names):
+        raise ValueError("it was saved from another design")
+    if checkpoint["sync_period"] != sync_period:
+        raise ValueError(f"it was saved with a period of {checkpoint['sync_period']} s")
+
+    state = engine._state
+    for signal, name in names.items():
+        slot = state.slots[state.get_signal(signal)]
+        slot.curr = slot.next = checkpoint["signals"].get(name, signal.reset)
+    state.pending.clear()
+    engine._timeline.now = checkpoint["now"]
+    for clock, process in clock_processes(sim).items():
+        clock_state = checkpoint["clocks"].get(names[clock])
+        if clock_state is None:
+            raise ValueError(f"the clock {names[clock]} was not simulated")
+        process.initial = clock_state["initial"]
+        process.runnable = clock_state["runnable"]
+        engine._timeline.deadlines.pop(process, None)
+        if clock_state["delay"] is not None:
+            engine._timeline.at(checkpoint["now"] + clock_state["delay"], process)
+
+
+# the restored simulation that the copies of --fork share, set before the copies are started
+_fork_job = None
+
+
+def scenario_file(file:str, scenario:str) -> str:
+    return None if file is None else file.replace("{scenario}", scenario)
+
+
+def run_fork(index:int):
+    """Run a copy of the restored simulation with its vectors ; return whether it passed, and its report."""
+    fragment, checkpoint, testbenches, options = _fork_job
+    from amaranth.sim import Simulator
+
+    testbench, vcd_file = testbenches[index]
+    sim = Simulator(fragment)
+    sim.add_clock(options["sync_period"])
+    restore_checkpoint(sim, checkpoint, options["sync_period"])
+    sim.add_process(testbench.process(options["sync_clocks"], checkpoint["cycle"]))
+    start = time.perf_counter()
+    run_python_simulation(sim, vcd_file=vcd_file, start_cycle=checkpoint["cycle"], **options["simulation"])
+    report = io.StringIO()
+    with redirect_stdout(report):
+        passed = testbench.report()
+    return passed, testbench.cycles, time.perf_counter() - start, report.getvalue()
+
+
+def run_forked_simulations(parser, fragment, ports, stimulus, checkpoint:dict, fork_files, sync_period=1e-6,
+        sync_clocks=0, vcd_file=None, output_file=None, expected_file=None, jobs=None, trace_from=0, trace_until=None,
+        trace_trigger=None) -> bool:
+    """Run one copy of the restored simulation per file of vectors, at most `jobs` at once ; tell whether all the
+    copies passed.
+
+    The copies are forked from this process, that has elaborated the design once. Where the processes cannot be
+    forked, the copies are run one after the other.
+    """
+    global _fork_job
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    from amaranth.sim import Simulator
+
+    # -- restore once here, to report a mismatching checkpoint before starting the copies
+    try:
+        restore_checkpoint(Simulator(fragment), checkpoint, sync_period)
+    except ValueError as e:
+        parser.error(f"Unable to restore the checkpoint : {e}")
+    scenarios = [os.path.splitext(os.path.basename(file))[0] for file in fork_files]
+    testbenches = [(VectorTestbench(parser, fragment, ports, stimulus, file, scenario_file(output_file, scenario),
+            scenario_file(expected_file, scenario)), scenario_file(vcd_file, scenario))
+        for file, scenario in zip(fork_files, scenarios)]
+    _fork_job = (fragment, checkpoint, testbenches, dict(sync_period=sync_period, sync_clocks=sync_clocks,
+        simulation=dict(ports=ports, sync_period=sync_period, sync_clocks=sync_clocks, trace_from=trace_from,
+            trace_until=trace_until, trace_trigger=trace_trigger)))
+    try:
+        if "fork" in multiprocessing.get_all_start_methods():
+            with ProcessPoolExecutor(max_workers=max(1, jobs or os.cpu_count()),
+                    mp_context=multiprocessing.get_context("fork")) as executor:
+                results = list(executor.map(run_fork, range(len(testbenches))))
+        else:
+            results = [run_fork(index) for index in range(len(testbenches))]
+    finally:
+        _fork_job = None
+
+    for scenario, (passed, cycles, seconds, report) in zip(scenarios, results):
+        for line in report.splitlines():
+            print(f"[{scenario}] {line}")
+        print(f"[{scenario}] {'PASS' if passed else 'FAIL'} : {cycles} cycles from cycle {checkpoint['cycle']}"
+            f" in {seconds:.3f} s")
+    return all(passed for passed, _, _, _ in results)
+
+
+### cxxrtl engine ###
+
+# where the compiled simulations are kept, one directory per hash of the design
+CXXRTL_CACHE_DIR = os.path.join("build", "cxxrtl")
+
+# the testbench of a compiled simulation : toggles the clock for the required count of periods, like
+# `Simulator.add_clock()`, and writes the trace window on the standard output.
+CXXRTL_DRIVER = r"""
+#include <cstdlib>
+#include <iostream>
+#include <cxxrtl/cxxrtl_vcd.h>
+#include "design.cc"
+
+static bool isAsserted(const cxxrtl::debug_item &item) {
+	for (size_t i = 0; i < (item.width + 31) / 32; i++)
+		if (item.curr[i] != 0)
+			return true;
+	return false;
+}
+
+static const cxxrtl::debug_item *findItem(const cxxrtl::debug_items &items, const std::string &name) {
+	if (items.count(name) != 1) {
+		std::cerr << "No single part item named '" << name << "'" << std::endl;
+		std::exit(2);
+	}
+	return &items[name];
+}
+
+// usage : sim CLOCK CLOCKS HALF_PERIOD_PS [TRACE_FROM TRACE_UNTIL [TRIGGER]]
+int main(int argc, char **argv) {
+	if (argc < 4) {
+		std::cerr << "usage : " << argv[0] << " CLOCK CLOCKS HALF_PERIOD_PS [TRACE_FROM TRACE_UNTIL [TRIGGER]]" << std::endl;
+		return 2;
+	}
+	const uint64_t clocks = std::strtoull(argv[2], nullptr, 10);
+	const uint64_t halfPeriod = std::strtoull(argv[3], nullptr, 10);
+	const bool isTracing = argc > 5;
+	uint64_t traceFrom = isTracing ? std::strtoull(argv[4], nullptr, 10) : 0;
+	uint64_t traceUntil = isTracing ? std::strtoull(argv[5], nullptr, 10) : 0;
+
+	cxxrtl_design::p_top top;
+	cxxrtl::debug_items items;
+	top.debug_info(&items, nullptr, "");
+	const cxxrtl::debug_item &clock = *findItem(items, argv[1]);
+	const cxxrtl::debug_item *trigger = argc > 6 ? findItem(items, argv[6]) : nullptr;
+
+	cxxrtl::vcd_writer vcd;
+	if (isTracing) {
+		vcd.timescale(1, "ps");
+		vcd.add_without_memories(items);
+	}
+
+	uint64_t time = 0;
+	top.step();
+	for (uint64_t i = 0; i < clocks; i++) {
+		if (trigger != nullptr && i >= traceFrom && isAsserted(*trigger)) {
+			// -- move the window to start now
+			traceUntil = i + (traceUntil - traceFrom);
+			traceFrom = i;
+			trigger = nullptr;
+		}
+		const bool isSampling = isTracing && trigger == nullptr && i >= traceFrom && i < traceUntil;
+		if (isSampling && i == traceFrom) vcd.sample(time); // -- the first sample dumps every value
+		for (cxxrtl::chunk_t level : {1u, 0u}) {
+			clock.next[0] = level;
+			top.step();
+			time += halfPeriod;
+			if (isSampling) vcd.sample(time);
+		}
+		if (isSampling && vcd.buffer.size() > (1u << 20)) {
+			std::cout << vcd.buffer;
+			vcd.buffer.clear();
+		}
+	}
+	if (isTracing) std::cout << vcd.buffer;
+	return 0;
+}
+"""
+
+
+def compile_cxxrtl_simulation(cxx_source:str) -> str:
+    """Compile the given CXXRTL design with the testbench driver, and return the path to the executable.
+
+    The executable is cached by a hash of the design, the driver and the compiler settings.
+    """
+    compiler = os.environ.get("CXX", "c++")
+    flags = os.environ.get("CXXFLAGS", "-O2").split()
+    from amaranth._toolchain.yosys import find_yosys
+
+    include_dir = find_yosys(lambda ver: ver >= (0, 10)).data_dir() / "include" / "backends" / "cxxrtl" / "runtime"
+
+    digest = hashlib.sha256()
+    for part in (cxx_source, CXXRTL_DRIVER, compiler, *flags):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    build_dir = os.path.join(CXXRTL_CACHE_DIR, digest.hexdigest()[:16])
+    executable = os.path.join(build_dir, "sim")
+    if os.path.exists(executable):
+        return executable
+
+    os.makedirs(build_dir, exist_ok=True)
+    with open(os.path.join(build_dir, "design.cc"), "w") as f:
+        f.write(cxx_source)
+    with open(os.path.join(build_dir, "driver.cc"), "w") as f:
+        f.write(CXXRTL_DRIVER)
+    # -- build then rename, so that an interrupted build is never reused.
+    subprocess.check_call([compiler, "-std=c++14", *flags, "-I", str(include_dir),
+        "-o", executable + ".tmp", os.path.join(build_dir, "driver.cc")])
+    os.replace(executable + ".tmp", executable)
+    return executable
+
+
+def prepare_cxxrtl_simulation(fragment, ports=(), sync_period=1e-6, sync_clocks=0, trace=None, trace_trigger=None,
+        profiler=None):
+    """Compile a CXXRTL model of the design, and build the command line of the simulation.
+
+    `trace` is None to only step the model, or the trace window (first cycle, cycle after the last one) of the cycles to
+    write as VCD on the standard output.
+
+    Returns:
+        the command line, and the names of the debug items of the ports, by port.
+    """
+    from amaranth.back import cxxrtl
+
+    profiler = profiler or PhaseProfiler()
+    with profiler.phase("conversion"):
+        fragment = fragment.prepare(ports=ports)
+        # -- the driver expects the top module to be named 'top'
+        cxx_source, name_map = cxxrtl.convert_fragment(fragment, name="top", emit_src=False)
+    with profiler.phase("compilation"):
+        executable = compile_cxxrtl_simulation(cxx_source)
+
+    # -- debug items are named by their path below the top module, separated by spaces
+    def item_name(signal) -> str:
+        return " ".join(name_map[signal][1:])
+
+    clock_name = item_name(fragment.domains["sync"].clk)
+    half_period = round(sync_period * 1e12 / 2)
+    command = [os.path.abspath(executable), clock_name, str(sync_clocks), str(half_period)]
+    if trace is not None:
+        command += [str(cycle) for cycle in trace]
+        if trace_trigger is not None:
+            command.append(item_name(trace_trigger))
+    return command, SignalDict((signal, item_name(signal)) for signal in ports if signal in name_map)
+
+
+def run_cxxrtl_simulation(fragment, ports=(), sync_period=1e-6, sync_clocks=0, vcd_file=None, gtkw_file=None,
+        trace_from=0, trace_until=None, trace_trigger=None, profiler=None):
+    """Simulate the 'sync' clock domain of the design for `sync_clocks` periods with a compiled CXXRTL model.
+
+    Only the cycles inside the trace window are sampled, out of it the model is only stepped.
+    """
+    trace = None if vcd_file is None else trace_window(sync_clocks, trace_from, trace_until)
+    profiler = profiler or PhaseProfiler()
+    command, port_items = prepare_cxxrtl_simulation(fragment, ports, sync_period, sync_clocks, trace, trace_trigger,
+        profiler)
+    with profiler.phase("simulation"):
+        if vcd_file is None:
+            subprocess.check_call(command)
+        else:
+            with WaveformFile(vcd_file) as vcd_stream:
+                process = subprocess.Popen(command, stdout=subprocess.PIPE, encoding="utf-8")
+                shutil.copyfileobj(process.stdout, vcd_stream, 1 << 20)
+                if process.wait() != 0:
+                    raise subprocess.CalledProcessError(process.returncode, command)
+
+    if gtkw_file is not None:
+        from vcd.gtkw import GTKWSave
+
+        gtkw = GTKWSave(gtkw_file)
+        if vcd_file is not None:
+            gtkw.dumpfile(vcd_file)
+        for item in port_items.values():
+            gtkw.trace(item.replace(" ", "."))
+
+
+### formal verification ###
+
+# where the formal verifications are run, one directory per hash of the design and options, and their results cached
+SBY_WORK_DIR = os.path.join("build", "sby")
+
+SBY_TEMPLATE = """[options]
+mode {task}
+depth {depth}
+multiclock off
+
+[engines]
+{engine}
+
+[script]
+read_rtlil {name}.il
+prep -top {name}
+
+[files]
+{name}.il
+"""
+
+
+def formal_verification_key(rtlil_text:str, **options) -> str:
+    """Hash the design, without the source locations, and the options of a verification."""
+    digest = hashlib.sha256()
+    for line in rtlil_text.splitlines():
+        if not line.lstrip().startswith("attribute \\src "):
+            digest.update(line.encode("utf-8"))
+            digest.update(b"\n")
+    digest.update(json.dumps(options, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def read_sby_status(job_dir:str, returncode:int) -> str:
+    """The status of a finished sby run : PASS, FAIL, UNKNOWN, TIMEOUT or ERROR."""
+    try:
+        with open(os.path.join(job_dir, "verify", "status")) as f:
+            return f.read().split()[0]
+    except (OSError, IndexError):
+        return {0: "PASS", 2: "FAIL"}.get(returncode, "ERROR")
+
+
+def stop_solver(process:subprocess.Popen):
+    """Stop a solver started in its own session, with its subprocesses."""
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+    process.wait()
+
+
+def run_formal_verification(rtlil_text:str, name="top", tasks=("bmc", "cover"), depth=10, engines=("smtbmc boolector",),
+        jobs=None, useCache=True) -> dict:
+    """Run each task with each engine as concurrent sby processes, and return the results by task.
+
+    For a given task, the first engine to reach a conclusive result (PASS or FAIL) wins, and the other engines
+    of the task are stopped. Conclusive results are cached by a hash of the design and of the options.
+    """
+    tool = os.environ.get("SBY", "sby")
+    jobs = max(1, jobs or os.cpu_count())
+    results = {}
+    pending = []  # (task, engine index, engine, job directory)
+    for task in tasks:
+        key = formal_verification_key(rtlil_text, task=task, depth=depth, engines=list(engines))
+        task_dir = os.path.join(SBY_WORK_DIR, key, task)
+        result_file = os.path.join(task_dir, "result.json")
+        if useCache and os.path.exists(result_file):
+            with open(result_file) as f:
+                results[task] = dict(json.load(f), cached=True)
+            continue
+        for index, engine in enumerate(engines):
+            job_dir = os.path.join(task_dir, f"engine_{index}")
+            shutil.rmtree(job_dir, ignore_errors=True)
+            os.makedirs(job_dir)
+            with open(os.path.join(job_dir, f"{name}.il"), "w") as f:
+                f.write(rtlil_text)
+            with open(os.path.join(job_dir, "verify.sby"), "w") as f:
+                f.write(SBY_TEMPLATE.format(task=task, depth=depth, engine=engine, name=name))
+            pending.append((task, index, engine, job_dir))
+
+    running = {}  # task, engine index -> (process, engine, job directory, start time)
+    try:
+        while pending or running:
+            # -- start as many solvers as allowed, skipping the tasks already solved
+            while pending and len(running) < jobs:
+                task, index, engine, job_dir = pending.pop(0)
+                if task in results:
+                    continue
+                with open(os.path.join(job_dir, "sby.log"), "w") as log:
+                    process = subprocess.Popen([tool, "-f", "verify.sby"], cwd=job_dir,
+                        stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+                running[task, index] = (process, engine, job_dir, time.monotonic())
+
+            time.sleep(0.1)
+            for (task, index), (process, engine, job_dir, start) in list(running.items()):
+                if (task, index) not in running or process.poll() is None:
+                    continue
+                del running[task, index]
+                status = read_sby_status(job_dir, process.returncode)
+                result = dict(task=task, status=status, engine=engine, seconds=round(time.monotonic() - start, 3),
+                    log=os.path.join(job_dir, "sby.log"))
+                print(f"[{task}] {engine} : {status} in {result['seconds']} s")
+                if status not in ("PASS", "FAIL"):
+                    # -- inconclusive, keep it unless another engine of the task concludes
+                    if task not in results and not any(t == task for t, _ in running) and not any(p[0] == task for p in pending):
+                        results[task] = result
+                    continue
+                results[task] = result
+                with open(os.path.join(os.path.dirname(job_dir), "result.json"), "w") as f:
+                    json.dump(result, f, indent=2)
+                # -- the first conclusive engine wins, stop the others
+                for other in [k for k in running if k[0] == task]:
+                    stop_solver(running.pop(other)[0])
+    finally:
+        # -- on an error or an interruption, the solvers run in their own sessions and would survive
+        for process, _, _, _ in running.values():
+            stop_solver(process)
+
+    for task in tasks:
+        result = results[task]
+        origin = " (cached)" if result.get("cached") else ""
+        print(f"{task:>6} : {result['status']:<7} {result['engine']}{origin} -- {result['log']}")
+    return results
@@ -0,0 +1,456 @@
+"""Constrained-random fuzzing of the modules of the sandbox, against reference models, with functional coverage.
+
+Each target is a module in a small harness : its inputs (the reset of the `sync` domain included) are driven by
+sequences of input vectors, one per cycle, and its outputs are compared to the ones of a reference model written in
+python, at each cycle. The sequences are generated by a random generator under constraints (biased towards the
+corner cases of the module), each one from its own seed, and run by batches in a pool of simulators.
+
+The functional coverage is a set of bins per target, e.g. "write during match" : the model tells which bins each
+cycle hits. The coverage of the workers is merged, and the campaign stops once every bin is hit often enough, or
+after the maximum number of sequences. A failing sequence is shrunk to a minimal reproducer, written as a CSV file of
+input vectors, one column per input, that `--replay` runs again.
+"""
+### builtin deps
+import argparse
+from abc import ABC, abstractmethod
+import csv
+import json
+import os
+import platform as runtime
+import random
+import sys
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from importlib import metadata
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+### amaranth -- main deps
+from amaranth import *
+from amaranth.sim import Settle, Simulator, Tick
+
+### local deps
+import sandbox  # -- makes the modules of the sandbox importable
+from CellOfTaggedValue import CellOfTaggedValue
+from decoder import Decoder
+
+# a sequence of input vectors, one per cycle, each one giving a value to the inputs by name
+Sequence = List[Dict[str, int]]
+
+
+class FuzzTarget(ABC):
+    """A module to fuzz : its harness, its reference model, the generation of its stimulus and its coverage bins."""
+
+    name = ""
+    inputs: List[str] = []  # -- the names of the inputs, "rst" being the reset of the sync domain
+    bins: List[str] = []
+
+    @abstractmethod
+    def build(self) -> Tuple[Module, Dict[str, Signal], Dict[str, Signal]]:
+        """Build the harness of the module ; return it, its inputs and its outputs by name."""
+
+    @abstractmethod
+    def model(self):
+        """A new reference model, in the reset state : `outputs(vector)` gives the expected outputs during a cycle,
+        `step(vector)` does the clock edge ending the cycle."""
+
+    @abstractmethod
+    def generate(self, rng: random.Random, length: int) -> Sequence:
+        """A sequence of `length` input vectors."""
+
+    @abstractmethod
+    def cover(self, model, vector: Dict[str, int]) -> Iterable[str]:
+        """The bins hit by a cycle, given the model before the clock edge."""
+
+
+class CellModel:
+    """The reference model of `CellOfTaggedValue`."""
+
+    def __init__(self, tag: int, valueWidth: int):
+        self.tag = tag
+        self.mask = (1 << valueWidth) - 1
+        self.isFree = 1
+        self.value = 0
+
+    def isMatching(self, vector: Dict[str, int]) -> bool:
+        return not self.isFree and vector["dataIn"] & self.mask == self.value
+
+    def outputs(self, vector: Dict[str, int]) -> Dict[str, int]:
+        return {"isFree": self.isFree, "isMatching": int(self.isMatching(vector)), "dataOut": self.tag}
+
+    def step(self, vector: Dict[str, int]):
+        if vector["rst"]:
+            self.isFree, self.value = 1, 0
+        elif vector["writeEnabled"]:
+            self.isFree, self.value = 0, vector["dataIn"] & self.mask
+
+
+class CellTarget(FuzzTarget):
+    """`CellOfTaggedValue` in the harness of its test suite : `dataIn` is driven by a 16 bits signal, thus wider than
+    the value."""
+
+    name = "cell"
+    inputs = ["dataIn", "writeEnabled", "rst"]
+    bins = [
+        "bind while free", "rebind to another value", "write during match", "match", "match of a truncated input",
+        "match of 0", "match of the highest value", "miss while bound", "free cell with the reset value at dataIn",
+        "reset while free", "reset after bind", "reset during write",
+    ]
+
+    def __init__(self, tag: int = 3, valueWidth: int = 7):
+        self.tag = tag
+        self.valueWidth = valueWidth
+
+    def build(self) -> Tuple[Module, Dict[str, Signal], Dict[str, Signal]]:
+        m = Module()
+        m.submodules.cell = cell = CellOfTaggedValue(self.tag, unsigned(3), unsigned(self.valueWidth))
+        m.domains.sync = sync = ClockDomain("sync")
+        rst = Signal()
+        sync.rst = rst
+        dataIn = Signal(unsigned(16))
+        writeEnabled = Signal()
+        m.d.comb += [cell.dataIn.eq(dataIn), cell.writeEnabled.eq(writeEnabled)]
+        outputs = {"isFree": cell.isFree, "isMatching": cell.isMatching, "dataOut": cell.dataOut}
+        return m, {"dataIn": dataIn, "writeEnabled": writeEnabled, "rst": rst}, outputs
+
+    def model(self) -> CellModel:
+        return CellModel(self.tag, self.valueWidth)
+
+    def generate(self, rng: random.Random, length: int) -> Sequence:
+        mask = (1 << self.valueWidth) - 1
+        written = [0]  # -- the values written so far, to match them again
+        sequence = []
+        for _ in range(length):
+            roll = rng.random()
+            if roll < 0.35:
+                dataIn = rng.choice(written)
+            elif roll < 0.45:
+                dataIn = rng.choice([0, mask, mask + 1, 0xFFFF])
+            elif roll < 0.55:
+                dataIn = rng.choice(written) | (rng.randrange(1, 1 << (16 - self.valueWidth)) << self.valueWidth)
+            else:
+                dataIn = rng.randrange(1 << self.valueWidth)
+            writeEnabled = int(rng.random() < 0.25)
+            if writeEnabled:
+                written.append(dataIn & mask)
+            sequence.append({"dataIn": dataIn, "writeEnabled": writeEnabled, "rst": int(rng.random() < 0.05)})
+        return sequence
+
+    def cover(self, model: CellModel, vector: Dict[str, int]) -> Iterable[str]:
+        value = vector["dataIn"] & model.mask
+        matching = model.isMatching(vector)
+        write = vector["writeEnabled"] and not vector["rst"]
+        bins = {
+            "bind while free": write and model.isFree,
+            "rebind to another value": write and not model.isFree and value != model.value,
+            "write during match": write and matching,
+            "match": matching,
+            "match of a truncated input": matching and vector["dataIn"] > model.mask,
+            "match of 0": matching and value == 0,
+            "match of the highest value": matching and value == model.mask,
+            "miss while bound": not model.isFree and not matching,
+            "free cell with the reset value at dataIn": model.isFree and value == model.value,
+            "reset while free": vector["rst"] and model.isFree,
+            "reset after bind": vector["rst"] and not model.isFree,
+            "reset during write": vector["rst"] and vector["writeEnabled"],
+        }
+        return [name for name, hit in bins.items() if hit]
+
+
+class DecoderModel:
+    """The reference model of `Decoder` : the output is registered, and only updated when the input changes."""
+
+    def __init__(self, span: int):
+        self.span = span
+        self.previousInput = 0
+        self.output = 1
+        self.outOfRange = 0
+
+    def outputs(self, vector: Dict[str, int]) -> Dict[str, int]:
+        return {"output": self.output, "outOfRange": self.outOfRange}
+
+    def step(self, vector: Dict[str, int]):
+        if vector["rst"]:
+            self.previousInput, self.output, self.outOfRange = 0, 1, 0
+        elif vector["input"] != self.previousInput:
+            self.previousInput = vector["input"]
+            self.output = 1 << vector["input"] if vector["input"] < self.span else 0
+            self.outOfRange = int(vector["input"] >= self.span)
+
+
+class DecoderTarget(FuzzTarget):
+    """`Decoder`, driven by all the values of the width of its input : out of range when the span is not a power
+    of 2."""
+
+    name = "decoder"
+    inputs = ["input", "rst"]
+
+    def __init__(self, span: int = 10):
+        self.span = span
+        self.width = len(Signal(range(0, span)))
+        self.bins = [f"input {value}" for value in range(1 << self.width)] + [
+            "hold", "change within range", "enter out of range", "leave out of range", "reset while out of range",
+            "reset with a changing input",
+        ]
+        if span == 1 << self.width:
+            self.bins = [name for name in self.bins if "out of range" not in name]
+
+    def build(self) -> Tuple[Module, Dict[str, Signal], Dict[str, Signal]]:
+        m = Module()
+        m.submodules.decoder = decoder = Decoder(self.span)
+        m.domains.sync = sync = ClockDomain("sync")
+        rst = Signal()
+        sync.rst = rst
+        outputs = {"output": decoder.output, "outOfRange": decoder.outOfRange}
+        return m, {"input": decoder.input, "rst": rst}, outputs
+
+    def model(self) -> DecoderModel:
+        return DecoderModel(self.span)
+
+    def generate(self, rng: random.Random, length: int) -> Sequence:
+        current = 0
+        sequence = []
+        for _ in range(length):
+            roll = rng.random()
+            if roll < 0.3:
+                pass  # -- hold the input
+            elif roll < 0.5 and self.span < 1 << self.width:
+                current = rng.randrange(self.span, 1 << self.width)
+            else:
+                current = rng.randrange(1 << self.width)
+            sequence.append({"input": current, "rst": int(rng.random() < 0.05)})
+        return sequence
+
+    def cover(self, model: DecoderModel, vector: Dict[str, int]) -> Iterable[str]:
+        value = vector["input"]
+        changing = value != model.previousInput
+        outOfRange = value >= self.span
+        bins = {
+            f"input {value}": True,
+            "hold": not changing,
+            "change within range": changing and not outOfRange and not model.outOfRange,
+            "enter out of range": changing and outOfRange and not model.outOfRange,
+            "leave out of range": changing and not outOfRange and model.outOfRange,
+            "reset while out of range": vector["rst"] and model.outOfRange,
+            "reset with a changing input": vector["rst"] and changing,
+        }
+        return [name for name, hit in bins.items() if hit and name in self.bins]
+
+
+TARGETS = {"cell": CellTarget, "decoder": DecoderTarget}
+
+
+def makeTarget(name: str, span: int) -> FuzzTarget:
+    return DecoderTarget(span) if name == "decoder" else TARGETS[name]()
+
+
+def sequenceOf(target: FuzzTarget, seed: int, index: int, maxLength: int) -> Sequence:
+    """The sequence `index` of a campaign : it only depends on the seed of the campaign and on its index."""
+    rng = random.Random(seed * 1000003 + index)
+    return target.generate(rng, rng.randint(1, maxLength))
+
+
+def runSequences(target: FuzzTarget, sequences: List[Sequence]) -> List[Tuple[Optional[Tuple[int, str]], Counter]]:
+    """Run the sequences one after the other, each one after a cycle of reset, in a new simulator : the finished
+    processes of a simulator are still scanned at each delta cycle, reusing it would slow down each batch.
+
+    Returns:
+        List[Tuple[Optional[Tuple[int, str]], Counter]]: for each sequence, its first mismatch (cycle and description)
+        if any, and the bins it hit.
+    """
+    m, inputs, outputs = target.build()
+    sim = Simulator(m)
+    sim.add_clock(1e-6)
+    results = []
+
+    def process():
+        for sequence in sequences:
+            for name, signal in inputs.items():
+                yield signal.eq(1 if name == "rst" else 0)
+            yield Tick("sync")
+            model = target.model()
+            hits = Counter()
+            failure = None
+            for cycle, vector in enumerate(sequence):
+                for name, value in vector.items():
+                    yield inputs[name].eq(value)
+                yield Settle()
+                expected = model.outputs(vector)
+                for name, signal in outputs.items():
+                    actual = yield signal
+                    if failure is None and actual != expected[name]:
+                        failure = (cycle, f"cycle {cycle} : {name} is {actual}, expected {expected[name]}")
+                hits.update(target.cover(model, vector))
+                if failure is not None:
+                    break
+                model.step(vector)
+                yield Tick("sync")
+            results.append((failure, hits))
+
+    sim.add_process(process)
+    sim.run()
+    return results
+
+
+def runBatch(name: str, span: int, seed: int, indexes: List[int], maxLength: int) -> Dict[str, Any]:
+    """Run a batch of sequences of a campaign, in a worker ; return the merged bins and the failing sequences."""
+    target = makeTarget(name, span)
+    sequences = [sequenceOf(target, seed, index, maxLength) for index in indexes]
+    coverage = Counter()
+    failures = []
+    for index, sequence, (failure, hits) in zip(indexes, sequences, runSequences(target, sequences)):
+        coverage.update(hits)
+        if failure is not None:
+            failures.append((index, failure[1]))
+    return {"sequences": len(sequences), "cycles": sum(len(s) for s in sequences), "coverage": coverage,
+        "failures": failures}
+
+
+def shrink(target: FuzzTarget, sequence: Sequence) -> Tuple[Sequence, str]:
+    """Shrink a failing sequence : remove chunks of cycles, then set the inputs to zero, while it still fails.
+
+    Each round runs all the smaller candidates at once, and keeps the first one that fails.
+    """
+    failure, _ = runSequences(target, [sequence])[0]
+    sequence = sequence[: failure[0] + 1]
+    while True:
+        candidates = []
+        size = len(sequence) // 2
+        while size >= 1:
+            candidates += [sequence[:i] + sequence[i + size :] for i in range(0, len(sequence), size)]
+            size //= 2
+        for cycle, vector in enumerate(sequence):
+            for name, value in vector.items():
+                if value != 0:
+                    candidates.append(sequence[:cycle] + [dict(vector, **{name: 0})] + sequence[cycle + 1 :])
+        candidates = [candidate for candidate in candidates if candidate]
+        for candidate, (candidateFailure, _) in zip(candidates, runSequences(target, candidates)):
+            if candidateFailure is not None:
+                sequence, failure = candidate[: candidateFailure[0] + 1], candidateFailure
+                break
+        else:
+            return sequence, failure[1]
+
+
+def writeSequence(target: FuzzTarget, sequence: Sequence, file: str):
+    with open(file, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(target.inputs)
+        for vector in sequence:
+            writer.writerow([vector[name] for name in target.inputs])
+
+
+def readSequence(target: FuzzTarget, file: str) -> Sequence:
+    with open(file, newline="") as f:
+        return [{name: int(row.get(name) or 0, 0) for name in target.inputs} for row in csv.DictReader(f)]
+
+
+def isCovered(target: FuzzTarget, coverage: Counter, minHits: int) -> bool:
+    return all(coverage[name] >= minHits for name in target.bins)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Constrained-random fuzzing of the modules of the sandbox")
+    parser.add_argument("--only", dest="only", metavar="TARGET", nargs="+", choices=list(TARGETS),
+        help=f"only fuzz the given targets, among {', '.join(TARGETS)}")
+    parser.add_argument("--span", dest="span", metavar="SPAN", type=int, default=10,
+        help="the span of the decoder (default: %(default)s, not a power of 2)")
+    parser.add_argument("--seed", dest="seed", metavar="SEED", type=int, default=0,
+        help="the seed of the campaign, each sequence is generated from it and its index (default: %(default)s)")
+    parser.add_argument("--length", dest="length", metavar="CYCLES", type=int, default=32,
+        help="the maximum length of a sequence (default: %(default)s)")
+    parser.add_argument("--max-sequences", dest="maxSequences", metavar="COUNT", type=int, default=20000,
+        help="stop after COUNT sequences, even when the coverage is not reached (default: %(default)s)")
+    parser.add_argument("--min-hits", dest="minHits", metavar="COUNT", type=int, default=10,
+        help="the coverage is reached when each bin is hit COUNT times (default: %(default)s)")
+    parser.add_argument("--batch", dest="batch", metavar="COUNT", type=int, default=200,
+        help="the number of sequences run by a worker at once (default: %(default)s)")
+    parser.add_argument("-j", "--jobs", dest="jobs", metavar="COUNT", type=int, default=os.cpu_count(),
+        help="run COUNT simulators in parallel (default: %(default)s)")
+    parser.add_argument("--reproducers", dest="reproducers", metavar="COUNT", type=int, default=3,
+        help="shrink at most COUNT failing sequences of each target (default: %(default)s)")
+    parser.add_argument("--out", dest="outDir", metavar="DIRECTORY", default=os.path.join("build", "fuzz"),
+        help="write the reproducers into DIRECTORY (default: %(default)s)")
+    parser.add_argument("--replay", dest="replayFile", metavar="CSV-FILE",
+        help="only run the sequence of CSV-FILE (a reproducer) on the first target, and tell whether it fails")
+    parser.add_argument("--json", dest="jsonFile", metavar="FILE",
+        help="write the results to FILE, as JSON")
+    args = parser.parse_args()
+
+    names = args.only or list(TARGETS)
+    if args.replayFile is not None:
+        target = makeTarget(names[0], args.span)
+        failure, hits = runSequences(target, [readSequence(target, args.replayFile)])[0]
+        print(f"{target.name} : {'FAIL -- ' + failure[1] if failure else 'PASS'} ; bins : {', '.join(sorted(hits))}")
+        sys.exit(1 if failure else 0)
+
+    results = []
+    for name in names:
+        target = makeTarget(name, args.span)
+        start = time.perf_counter()
+        coverage = Counter()
+        failures = []
+        sequences = cycles = 0
+        nextIndex = 0
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            pending = set()
+            while True:
+                # -- keep every worker busy, until the coverage is reached
+                while len(pending) < 2 * args.jobs and nextIndex < args.maxSequences \
+                        and not isCovered(target, coverage, args.minHits):
+                    indexes = list(range(nextIndex, min(nextIndex + args.batch, args.maxSequences)))
+                    pending.add(executor.submit(runBatch, name, args.span, args.seed, indexes, args.length))
+                    nextIndex = indexes[-1] + 1
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch = future.result()
+                    sequences += batch["sequences"]
+                    cycles += batch["cycles"]
+                    coverage.update(batch["coverage"])
+                    failures += batch["failures"]
+                if isCovered(target, coverage, args.minHits):
+                    for future in pending:
+                        future.cancel()
+        seconds = time.perf_counter() - start
+
+        # -- shrink the first failing sequences into reproducers
+        reproducers = []
+        for index, message in sorted(failures)[: args.reproducers]:
+            sequence, shrunk = shrink(target, sequenceOf(target, args.seed, index, args.length))
+            os.makedirs(args.outDir, exist_ok=True)
+            file = os.path.join(args.outDir, f"{name}_seed{args.seed}_{index}.csv")
+            writeSequence(target, sequence, file)
+            reproducers.append({"sequence": index, "failure": message, "cycles": len(sequence), "shrunk": shrunk,
+                "file": file})
+
+        missing = [bin for bin in target.bins if coverage[bin] < args.minHits]
+        result = {
+            "target": name if name != "decoder" else f"decoder(span={args.span})",
+            "sequences": sequences,
+            "cycles": cycles,
+            "seconds": round(seconds, 3),
+            "covered": len(target.bins) - len(missing),
+            "bins": len(target.bins),
+            "coverage": {bin: coverage[bin] for bin in target.bins},
+            "failures": len(failures),
+            "reproducers": reproducers,
+        }
+        results.append(result)
+        status = "FAIL" if failures or missing else "PASS"
+        print(f"{status} : {result['target']:<18} {sequences:>6} sequences {cycles:>8} cycles in {seconds:6.2f} s,"
+            f" {result['covered']}/{result['bins']} bins hit {args.minHits} times, {len(failures)} failing sequences")
+        for bin in missing:
+            print(f"    not covered : {bin} ({coverage[bin]} hits)")
+        for reproducer in reproducers:
+            print(f"    sequence {reproducer['sequence']} : {reproducer['failure']}")
+            print(f"        shrunk to {reproducer['cycles']} cycles, {reproducer['shrunk']} -- {reproducer['file']}")
+
+    if args.jsonFile is not None:
+        report = {"python": runtime.python_version(), "amaranth": metadata.version("amaranth"), "seed": args.seed,
+            "minHits": args.minHits, "results": results}
+        with open(args.jsonFile, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    sys.exit(1 if any(r["failures"] or r["covered"] < r["bins"] for r in results) else 0)
@@ -0,0 +1,72 @@
+"""Make the modules of the sandbox importable from the benchmarks, and helpers shared by the benchmarks.
+
+The sandbox is a set of directories of plain modules that import each other by their bare names ; importing this
+module puts all those directories in the search path.
+"""
+import itertools
+import os
+import sys
+from typing import Any, Callable, Dict, List
+
+from amaranth import Elaboratable
+from amaranth.hdl.ast import SignalSet
+from amaranth.hdl.ir import Fragment
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIRECTORIES = ["01_blinky", "02_cell_of_tagged_value", "board--colorlight-i9"]
+
+for directory in DIRECTORIES:
+    path = os.path.join(ROOT, directory)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def sortPorts(module, platform):
+    """Elaborate a module, and sort its ports into inputs and outputs.
+
+    The outputs are the ports driven by the module or its submodules, the other ports are the inputs.
+
+    Returns:
+        Tuple[Fragment, List[Signal], List[Signal]]: the elaborated module, its inputs and its outputs.
+    """
+    fragment = Fragment.get(module, platform)
+    driven = SignalSet()
+    fragments = [fragment]
+    while fragments:
+        current = fragments.pop()
+        driven.update(signal for _, signal in current.iter_drivers())
+        fragments.extend(subfragment for subfragment, _ in current.subfragments)
+    inputs = [port for port in module.ports() if port not in driven]
+    outputs = [port for port in module.ports() if port in driven]
+    return fragment, inputs, outputs
+
+
+class Benchmark:
+    """The sweep of the parameters of a module or design."""
+
+    def __init__(self, name: str, factory: Callable[..., Elaboratable], sweep: Dict[str, List[Any]], wholeDesign: bool = False,
+            synthOptions: str = ""):
+        """Set up the benchmark.
+
+        Args:
+            name (str): the name of the benchmark.
+            factory (Callable[..., Elaboratable]): creates the module from the swept parameters, given by name.
+            sweep (Dict[str, List[Any]]): the values of each parameter, all the combinations are benchmarked.
+            wholeDesign (bool, optional): True for a design requesting the platform resources, built by the platform. Defaults to False.
+            synthOptions (str, optional): more options of yosys `synth_ecp5`, e.g. "-nowidelut". Defaults to "".
+        """
+        self.name = name
+        self.factory = factory
+        self.sweep = sweep
+        self.wholeDesign = wholeDesign
+        self.synthOptions = synthOptions
+
+    def cases(self) -> List[Dict[str, Any]]:
+        """List the parameters of each case."""
+        names = list(self.sweep.keys())
+        return [dict(zip(names, values)) for values in itertools.product(*(self.sweep[name] for name in names))]
+
+
+def caseName(benchmark: str, params: Dict[str, Any]) -> str:
+    """The name of a case, e.g. `RippleCounter(width=64)`."""
+    return f"{benchmark}({', '.join(f'{name}={value}' for name, value in params.items())})"
@@ -0,0 +1,140 @@
+"""Traffic benchmark of the SDRAM controller of the Colorlight i9 (see `board--colorlight-i9/sdram.py`).
+
+Each pattern is a list of burst requests, simulated with the controller and the cycle accurate model of the SDRAM,
+which checks the timings and the data. For each pattern and clock frequency, the report gives :
+
+* the sustained bandwidth : the words transferred per cycle, from the first request taken (after the initialization)
+  to the last word, and in MB/s ;
+* the latency of the reads and the writes : the cycles from the request taken to its first word, on average and
+  at worst ;
+* the number of refreshes and of ACTIVATE commands.
+
+The patterns of the latency are made of lone requests (40 cycles apart, more than a burst takes), the other
+ones are made of back to back requests.
+"""
+### builtin deps
+import argparse
+import json
+import platform as runtime
+import random
+import sys
+from importlib import metadata
+from typing import Callable, Dict, List, Tuple
+
+### local deps
+import sandbox  # -- makes the modules of the sandbox importable
+from colorlight_i9 import Colorlight_I9_V7_2_Platform
+from sdram import SdramController, simulateTraffic
+
+
+def address(c: SdramController, column: int, bank: int, row: int) -> int:
+    """The address of a burst."""
+    return column | (bank << c.burstBits) | (row << (c.burstBits + c.bankBits))
+
+
+def sequential(write: bool) -> Callable[[SdramController, random.Random, int], List[Tuple[bool, int]]]:
+    return lambda c, rng, n: [(write, i % (1 << len(c.requestAddress))) for i in range(n)]
+
+
+def randomly(write: bool) -> Callable[[SdramController, random.Random, int], List[Tuple[bool, int]]]:
+    return lambda c, rng, n: [(write, rng.randrange(1 << len(c.requestAddress))) for _ in range(n)]
+
+
+def mixed(c: SdramController, rng: random.Random, n: int) -> List[Tuple[bool, int]]:
+    """Sequential writes and reads, alternating every 8 bursts."""
+    return [((i // 8) % 2 == 0, i % (1 << len(c.requestAddress))) for i in range(n)]
+
+
+def sameRow(c: SdramController, rng: random.Random, n: int) -> List[Tuple[bool, int]]:
+    """Reads of the same row : row hits."""
+    return [(False, address(c, i % (1 << c.burstBits), 0, 0)) for i in range(n)]
+
+
+def sameBank(c: SdramController, rng: random.Random, n: int) -> List[Tuple[bool, int]]:
+    """Reads of the same bank, alternating two rows : row misses."""
+    return [(False, address(c, 0, 0, i % 2)) for i in range(n)]
+
+
+# -- the patterns, and the gap between the requests
+PATTERNS: Dict[str, Tuple[Callable[[SdramController, random.Random, int], List[Tuple[bool, int]]], int]] = {
+    "sequential read": (sequential(False), 0),
+    "sequential write": (sequential(True), 0),
+    "random read": (randomly(False), 0),
+    "random write": (randomly(True), 0),
+    "mixed": (mixed, 0),
+    "latency row hit": (sameRow, 40),
+    "latency row miss": (sameBank, 40),
+}
+
+
+def average(values: List[int]) -> float:
+    return sum(values) / len(values) if values else 0.0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Traffic benchmark of the SDRAM controller of the Colorlight i9")
+    parser.add_argument("--only", dest="only", metavar="PATTERN", nargs="+",
+        help=f"only run the given patterns, among {', '.join(PATTERNS)}")
+    parser.add_argument("--frequencies", dest="frequencies", metavar="HERTZ", type=float, nargs="+", default=[25e6, 100e6],
+        help="the frequencies of the controller (default: 25e6 100e6)")
+    parser.add_argument("--burst-length", dest="burstLength", metavar="WORDS", type=int, default=8,
+        help="the burst length of the controller (default: %(default)s)")
+    parser.add_argument("--cas-latency", dest="casLatency", metavar="CYCLES", type=int, default=2,
+        help="the CAS latency of the controller (default: %(default)s)")
+    parser.add_argument("-n", "--requests", dest="requests", metavar="COUNT", type=int, default=500,
+        help="the number of requests of each pattern (default: %(default)s)")
+    parser.add_argument("--seed", dest="seed", metavar="SEED", type=int, default=0,
+        help="the seed of the random patterns (default: %(default)s)")
+    parser.add_argument("--json", dest="jsonFile", metavar="FILE",
+        help="write the results to FILE, as JSON")
+    args = parser.parse_args()
+
+    patterns = [name for name in PATTERNS if args.only is None or name in args.only]
+    if len(patterns) == 0:
+        parser.error("no pattern to run")
+
+    results = []
+    for frequency in args.frequencies:
+        platform = Colorlight_I9_V7_2_Platform(build_cache_dir=None, clocks={"sync": frequency})
+        for name in patterns:
+            factory, gap = PATTERNS[name]
+            controller = SdramController(burstLength=args.burstLength, casLatency=args.casLatency)
+            requests = factory(controller, random.Random(args.seed), args.requests)
+            traffic, model = simulateTraffic(controller, requests, platform, args.seed, gap)
+            problems = model.violations + traffic.mismatches
+            bandwidth = traffic.bandwidth()
+            result = {
+                "pattern": name,
+                "frequency": platform.default_clk_frequency,
+                "requests": len(requests),
+                "wordsPerCycle": round(bandwidth, 3),
+                "megabytesPerSecond": round(bandwidth * platform.default_clk_frequency * controller.dataWidth / 8e6, 1),
+                "readLatency": [round(average(traffic.latencies(False)), 2), max(traffic.latencies(False), default=0)],
+                "writeLatency": [round(average(traffic.latencies(True)), 2), max(traffic.latencies(True), default=0)],
+                "refreshes": len(model.refreshes),
+                "activates": model.commands.get("ACTIVATE", 0),
+            }
+            if problems:
+                result["error"] = problems[0]
+            results.append(result)
+            label = f"{name:<20} {frequency / 1e6:>6.1f} MHz"
+            if "error" in result:
+                print(f"FAILED : {label} -- {result['error']}")
+            else:
+                print(f"{label} {result['wordsPerCycle']:>6.3f} words/cycle {result['megabytesPerSecond']:>7.1f} MB/s"
+                    f"  read latency {result['readLatency'][0]:>6.2f} (max {result['readLatency'][1]:>3})"
+                    f"  write latency {result['writeLatency'][0]:>6.2f} (max {result['writeLatency'][1]:>3})"
+                    f"  {result['activates']:>4} ACTIVATE {result['refreshes']:>3} REFRESH")
+
+    if args.jsonFile is not None:
+        report = {
+            "python": runtime.python_version(),
+            "amaranth": metadata.version("amaranth"),
+            "burstLength": args.burstLength,
+            "casLatency": args.casLatency,
+            "results": results,
+        }
+        with open(args.jsonFile, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    sys.exit(1 if any("error" in result for result in results) else 0)
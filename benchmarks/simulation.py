@@ -0,0 +1,232 @@
+"""Simulation throughput benchmark of the modules of the sandbox.
+
+Each benchmark builds a module at several sizes, and simulates a fixed number of clock cycles with each engine
+(the Python simulator of amaranth, and a compiled CXXRTL model), with and without writing a VCD file. The inputs of a
+module are driven by a free running counter, so that the design is busy without any Python process.
+
+For each case, the report gives :
+
+* the time to the first cycle : the elaboration, then the preparation of the engine (compilation into Python code,
+  or into a CXXRTL executable ; the executables are cached by `cli_sporny`, the first run of a case is slower) ;
+* the simulation speed, in cycles per second ;
+* the peak resident memory of the process that simulates ;
+* with a VCD file, the toggle activity : the number of value changes of the signals, per cycle.
+
+Each case runs in its own process. The results are written as JSON, with the versions of python and amaranth, to
+compare them across versions and engines.
+"""
+### builtin deps
+import argparse
+import json
+import multiprocessing
+import os
+import platform as runtime
+import resource
+import subprocess
+import sys
+import time
+from importlib import metadata
+from typing import Any, Dict, List, Optional
+
+### amaranth -- main deps
+from amaranth import *
+from amaranth.build import Platform
+from amaranth.hdl.ir import Fragment
+from amaranth.sim import Simulator
+
+### local deps
+from sandbox import Benchmark, caseName, sortPorts  # -- also makes the modules of the sandbox importable
+from colorlight_i9 import Colorlight_I9_V7_2_Platform
+from bleep import Bleeper
+from counter import RippleCounter
+from decoder import Decoder
+from chaser_gpio import ChaserCore, ChaserGpio
+from CellOfTaggedValue import CellOfTaggedValue
+from cli_sporny import prepare_cxxrtl_simulation
+
+BENCHMARKS = [
+    Benchmark("Bleeper", lambda: Bleeper(), {}),
+    Benchmark("RippleCounter", lambda width: RippleCounter(width), {"width": [8, 64, 256]}),
+    Benchmark("Decoder", lambda span: Decoder(span), {"span": [10, 100, 1000]}),
+    Benchmark(
+        "CellOfTaggedValue",
+        lambda valueWidth: CellOfTaggedValue(5, unsigned(4), unsigned(valueWidth)),
+        {"valueWidth": [8, 64]},
+    ),
+    # -- a fast beat, for the counter and the decoder to be busy during the simulation
+    Benchmark("ChaserCore", lambda strobed: ChaserCore(10, 1000000, strobed), {"strobed": [False, True]}),
+    Benchmark("ChaserGpio", lambda: ChaserGpio("p", 2, (5, 7, 9, 11, 13, 17, 23, 25, 27, 29)), {}, wholeDesign=True),
+]
+
+ENGINES = ["pysim", "cxxrtl"]
+
+
+class Exercised(Elaboratable):
+    """Drive all the inputs of a module from a free running counter.
+
+    A whole design has no inputs, it is elaborated as is.
+    """
+
+    def __init__(self, module: Elaboratable, wholeDesign: bool):
+        self.module = module
+        self.wholeDesign = wholeDesign
+        self.inputs = []
+        self.outputs = []
+
+    def ports(self) -> List[Signal]:
+        return self.outputs
+
+    def prepare(self, platform: Platform):
+        """Elaborate the module and sort its ports ; MUST be called before `ports()` and the elaboration."""
+        if self.wholeDesign:
+            self.fragment = Fragment.get(self.module, platform)
+        else:
+            self.fragment, self.inputs, self.outputs = sortPorts(self.module, platform)
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        m.submodules.module = self.fragment
+        if self.inputs:
+            stimulus = Signal(sum(len(port) for port in self.inputs))
+            m.d.sync += stimulus.eq(stimulus + 1)
+            m.d.comb += Cat(self.inputs).eq(stimulus)
+
+        return m
+
+
+def countToggles(vcdFile: str) -> int:
+    """Count the value changes of a VCD file, the initial values (`$dumpvars`) excepted."""
+    toggles = 0
+    with open(vcdFile) as f:
+        for line in f:
+            if line.startswith("$enddefinitions"):
+                break
+        inDump = False
+        for line in f:
+            if line.startswith("$dumpvars"):
+                inDump = True
+            elif line.startswith("$end"):
+                inDump = False
+            elif not inDump and line[0] not in "#$\n":
+                toggles += 1
+    return toggles
+
+
+def runCase(benchmarkName: str, params: Dict[str, Any], engine: str, cycles: int, vcdFile: Optional[str]) -> Dict[str, Any]:
+    """Elaborate and simulate one case, in the current process.
+
+    Returns:
+        Dict[str, Any]: the result ; `error` is set when the case could not be simulated.
+    """
+    benchmark = next(b for b in BENCHMARKS if b.name == benchmarkName)
+    result = {
+        "case": caseName(benchmarkName, params), "benchmark": benchmarkName, "params": params,
+        "engine": engine, "cycles": cycles, "vcd": vcdFile is not None,
+    }
+    try:
+        start = time.perf_counter()
+        platform = Colorlight_I9_V7_2_Platform(build_cache_dir=None)
+        top = Exercised(benchmark.factory(**params), benchmark.wholeDesign)
+        top.prepare(platform)
+        fragment = Fragment.get(top, platform)
+        result["elaboration"] = round(time.perf_counter() - start, 4)
+        period = 1 / platform.default_clk_frequency
+
+        start = time.perf_counter()
+        if engine == "pysim":
+            sim = Simulator(fragment)
+            sim.add_clock(period, domain="sync")
+            result["preparation"] = round(time.perf_counter() - start, 4)
+            start = time.perf_counter()
+            if vcdFile is None:
+                sim.run_until(cycles * period, run_passive=True)
+            else:
+                with sim.write_vcd(vcdFile):
+                    sim.run_until(cycles * period, run_passive=True)
+            result["simulation"] = round(time.perf_counter() - start, 4)
+            result["peakMemory"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        else:
+            trace = None if vcdFile is None else (0, cycles)
+            command, _ = prepare_cxxrtl_simulation(fragment, top.ports(), period, cycles, trace)
+            result["preparation"] = round(time.perf_counter() - start, 4)
+            start = time.perf_counter()
+            with open(os.devnull if vcdFile is None else vcdFile, "w") as output:
+                process = subprocess.Popen(command, stdout=output)
+                # -- the resources of the simulation alone, not of the compiler
+                _, status, usage = os.wait4(process.pid, 0)
+                process.returncode = os.waitstatus_to_exitcode(status)
+            result["simulation"] = round(time.perf_counter() - start, 4)
+            if process.returncode != 0:
+                raise subprocess.CalledProcessError(process.returncode, command)
+            result["peakMemory"] = usage.ru_maxrss * 1024
+        if vcdFile is not None:
+            result["togglesPerCycle"] = round(countToggles(vcdFile) / cycles, 3)
+        result["firstCycle"] = round(result["elaboration"] + result["preparation"], 4)
+        result["cyclesPerSecond"] = round(cycles / result["simulation"])
+    except Exception as e:
+        result["error"] = f"{type(e).__name__} : {e}"
+    return result
+
+
+def runCaseInWorker(arguments):
+    return runCase(*arguments)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulation throughput benchmark of the modules of the sandbox")
+    parser.add_argument("--only", dest="only", metavar="BENCHMARK", nargs="+",
+        help=f"only run the given benchmarks, among {', '.join(b.name for b in BENCHMARKS)}")
+    parser.add_argument("--engines", dest="engines", metavar="ENGINE", nargs="+", choices=ENGINES, default=ENGINES,
+        help=f"the simulation engines to benchmark (default: {' '.join(ENGINES)})")
+    parser.add_argument("--cycles", dest="cycles", metavar="COUNT", type=int, default=100000,
+        help="the number of clock cycles to simulate (default: %(default)s)")
+    parser.add_argument("--no-vcd", dest="withVcd", action="store_false",
+        help="do not benchmark the simulations writing a VCD file")
+    parser.add_argument("-j", "--jobs", dest="jobs", metavar="COUNT", type=int, default=1,
+        help="run at most COUNT cases at once ; more than one skews the figures (default: %(default)s)")
+    parser.add_argument("--build-dir", dest="buildDir", metavar="DIR", default=os.path.join("build", "simulation"),
+        help="where to write the VCD files (default: %(default)s)")
+    parser.add_argument("--json", dest="jsonFile", metavar="FILE",
+        help="write the results to FILE, as JSON")
+    args = parser.parse_args()
+
+    benchmarks = [b for b in BENCHMARKS if args.only is None or b.name in args.only]
+    if args.only is not None:
+        unknown = set(args.only) - {b.name for b in benchmarks}
+        if unknown:
+            parser.error(f"unknown benchmarks : {', '.join(sorted(unknown))}")
+
+    os.makedirs(args.buildDir, exist_ok=True)
+    cases = []
+    for b in benchmarks:
+        for params in b.cases():
+            for engine in args.engines:
+                for withVcd in [False, True] if args.withVcd else [False]:
+                    vcdFile = os.path.join(args.buildDir, f"case_{len(cases):03}.vcd") if withVcd else None
+                    cases.append((b.name, params, engine, args.cycles, vcdFile))
+
+    # -- one fresh process per case, for the peak memory of each case
+    results = []
+    with multiprocessing.get_context("spawn").Pool(args.jobs, maxtasksperchild=1) as pool:
+        for result in pool.imap(runCaseInWorker, cases):
+            results.append(result)
+            label = f"{result['case']:<36} {result['engine']:<7} {'vcd' if result['vcd'] else '':<4}"
+            if "error" in result:
+                print(f"FAILED : {label} -- {result['error']}")
+            else:
+                print(f"{label} first cycle {result['firstCycle']:>8.3f} s {result['cyclesPerSecond']:>12} cycles/s"
+                    f" {result['peakMemory'] / (1 << 20):>8.1f} MiB"
+                    + (f" {result['togglesPerCycle']:>8.2f} toggles/cycle" if "togglesPerCycle" in result else ""))
+
+    if args.jsonFile is not None:
+        report = {
+            "python": runtime.python_version(),
+            "amaranth": metadata.version("amaranth"),
+            "cycles": args.cycles,
+            "results": results,
+        }
+        with open(args.jsonFile, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    sys.exit(1 if any("error" in result for result in results) else 0)
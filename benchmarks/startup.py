@@ -0,0 +1,196 @@
+"""Start-up benchmark of the command lines of the sandbox.
+
+Each scenario runs a command line of the sandbox in a fresh python process, under `python -X importtime`, several
+times. For each scenario, the report gives :
+
+* the import time : the cumulative time of the top level imports, as reported by `-X importtime` (median of the runs) ;
+* the wall time of the whole command (median of the runs) ;
+* the slowest top level imports.
+
+The import times are compared to `startup_baseline.json` : the script fails when the import time of a scenario grows
+by more than the tolerance. It also fails when a scenario imports a module it must not import, e.g. the simulator for
+the generate action : those modules are only imported by the actions that need them.
+"""
+### builtin deps
+import argparse
+import json
+import os
+import platform as runtime
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from importlib import metadata
+from typing import Any, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "startup_baseline.json")
+
+
+class Scenario:
+    """A command line to start, and the modules it must not import."""
+
+    def __init__(self, name: str, directory: str, arguments: List[str], forbidden: List[str]):
+        """Set up the scenario.
+
+        Args:
+            name (str): the name of the scenario.
+            directory (str): the directory of the sandbox to run the command from.
+            arguments (List[str]): the arguments of python ; `{out}` is replaced by a temporary directory.
+            forbidden (List[str]): the modules (and their submodules) that the command must not import.
+        """
+        self.name = name
+        self.directory = directory
+        self.arguments = arguments
+        self.forbidden = forbidden
+
+
+# -- the backends, the simulator, the toolchain and the waveform tools
+BACKENDS = ["amaranth.back", "amaranth._toolchain"]
+SIMULATION = ["amaranth.sim", "vcd"]
+PLATFORM = ["amaranth.build", "amaranth.vendor", "jinja2"]
+
+SCENARIOS = [
+    Scenario("import CellOfTaggedValue", "02_cell_of_tagged_value", ["-c", "import CellOfTaggedValue"],
+        ["cli_sporny", "amaranth.asserts", *BACKENDS, *SIMULATION, *PLATFORM]),
+    Scenario("generate", "02_cell_of_tagged_value", ["CellOfTaggedValue.py", "generate", "-t", "il", "{out}/top.il"],
+        ["amaranth.back.cxxrtl", "amaranth.back.verilog", "amaranth._toolchain", *SIMULATION, *PLATFORM]),
+    Scenario("simulate", "02_cell_of_tagged_value", ["CellOfTaggedValue.py", "simulate", "-c", "20"],
+        [*BACKENDS, "vcd.gtkw", *PLATFORM]),
+    Scenario("make.py --help", "board--colorlight-i9", ["make.py", "--help"], ["amaranth"]),
+]
+
+
+def parseImportTime(stderr: str) -> Tuple[float, Dict[str, float], List[str]]:
+    """Parse the report of `-X importtime`.
+
+    Returns:
+        Tuple[float, Dict[str, float], List[str]]: the total of the top level imports in milliseconds, the cumulative
+        time of each top level import in milliseconds, and all the imported modules.
+    """
+    total = 0.0
+    topLevel = {}
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules.append(name.strip())
+        if not name[1:].startswith(" "):
+            milliseconds = int(cumulative) / 1000
+            total += milliseconds
+            topLevel[name.strip()] = milliseconds
+    return total, topLevel, modules
+
+
+def isForbidden(module: str, forbidden: List[str]) -> bool:
+    return any(module == prefix or module.startswith(prefix + ".") for prefix in forbidden)
+
+
+def runScenario(scenario: Scenario, runs: int) -> Dict[str, Any]:
+    """Run the scenario several times, and return the median of its timings, and the forbidden modules it imported."""
+    importTimes = []
+    wallTimes = []
+    topLevel = {}
+    modules = set()
+    with tempfile.TemporaryDirectory() as out:
+        arguments = [argument.replace("{out}", out) for argument in scenario.arguments]
+        for _ in range(runs):
+            start = time.perf_counter()
+            process = subprocess.run([sys.executable, "-X", "importtime", *arguments],
+                cwd=os.path.join(ROOT, scenario.directory), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                encoding="utf-8")
+            wallTimes.append((time.perf_counter() - start) * 1000)
+            if process.returncode != 0:
+                return {"scenario": scenario.name, "error": f"exit code {process.returncode}"}
+            total, runTopLevel, runModules = parseImportTime(process.stderr)
+            importTimes.append(total)
+            topLevel = runTopLevel
+            modules.update(runModules)
+    slowest = sorted(topLevel.items(), key=lambda item: item[1], reverse=True)[:5]
+    return {
+        "scenario": scenario.name,
+        "importMs": round(statistics.median(importTimes), 1),
+        "wallMs": round(statistics.median(wallTimes), 1),
+        "slowestImports": {name: round(milliseconds, 1) for name, milliseconds in slowest},
+        "forbiddenImports": sorted(module for module in modules if isForbidden(module, scenario.forbidden)),
+    }
+
+
+def compareToBaseline(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float) -> List[str]:
+    """List the regressions of the results against the baseline.
+
+    A regression is an import time growing by more than `tolerance` (relative). The scenarios missing from the
+    baseline are not compared.
+    """
+    references = {reference["scenario"]: reference for reference in baseline}
+    regressions = []
+    for result in results:
+        reference = references.get(result["scenario"])
+        if reference is None or "error" in result:
+            continue
+        if result["importMs"] > reference["importMs"] * (1 + tolerance):
+            regressions.append(f"{result['scenario']} : import time {reference['importMs']} ms -> {result['importMs']} ms")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Start-up benchmark of the command lines of the sandbox")
+    parser.add_argument("--only", dest="only", metavar="SCENARIO", nargs="+",
+        help=f"only run the given scenarios, among {', '.join(repr(s.name) for s in SCENARIOS)}")
+    parser.add_argument("--runs", dest="runs", metavar="COUNT", type=int, default=5,
+        help="run each scenario COUNT times, and keep the median (default: %(default)s)")
+    parser.add_argument("--baseline", dest="baseline", metavar="FILE", default=BASELINE,
+        help="fail when an import time regresses from the baseline in FILE, a JSON report (default: %(default)s)")
+    parser.add_argument("--tolerance", dest="tolerance", metavar="RATIO", type=float, default=0.25,
+        help="the relative difference from the baseline that is not a regression (default: %(default)s)")
+    parser.add_argument("--update-baseline", dest="updateBaseline", action="store_true",
+        help="write the results into the baseline file instead of comparing them")
+    parser.add_argument("--json", dest="jsonFile", metavar="FILE",
+        help="write the results to FILE, as JSON")
+    args = parser.parse_args()
+
+    scenarios = [s for s in SCENARIOS if args.only is None or s.name in args.only]
+    if len(scenarios) == 0:
+        parser.error("no scenario to run")
+
+    results = []
+    for scenario in scenarios:
+        result = runScenario(scenario, args.runs)
+        results.append(result)
+        if "error" in result:
+            print(f"FAILED : {scenario.name:<26} -- {result['error']}")
+            continue
+        slowest = ", ".join(f"{name} {milliseconds:.1f}" for name, milliseconds in result["slowestImports"].items())
+        print(f"{scenario.name:<26} imports {result['importMs']:>7.1f} ms, wall {result['wallMs']:>7.1f} ms -- {slowest}")
+        if result["forbiddenImports"]:
+            print(f"    imports {', '.join(result['forbiddenImports'])}")
+
+    if args.jsonFile is not None:
+        report = {"python": runtime.python_version(), "amaranth": metadata.version("amaranth"), "results": results}
+        with open(args.jsonFile, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+
+    failed = any("error" in result or result["forbiddenImports"] for result in results)
+    if args.updateBaseline:
+        # -- the scenarios that were not run are kept in the baseline
+        baseline = []
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        updated = {result["scenario"] for result in results}
+        baseline = [reference for reference in baseline if reference["scenario"] not in updated]
+        baseline += [{"scenario": r["scenario"], "importMs": r["importMs"]} for r in results if "error" not in r]
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+            f.write("\n")
+        print(f"Baseline updated : {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compareToBaseline(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION : {regression}")
+        failed = failed or len(regressions) > 0
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,307 @@
+"""Synthesis benchmark of the modules of the sandbox, on the Colorlight i9 (LFE5U-45F, speed 6).
+
+Each benchmark sweeps the parameters of the constructor of a module ; each case is synthesized with yosys
+`synth_ecp5` and placed and routed with nextpnr-ecp5, in parallel workers. The utilization and the maximum
+frequency reported by nextpnr are collected into a JSON and/or CSV report, and compared to a baseline.
+
+* A module is synthesized out of context, with all its ports registered, so that its combinational paths are
+  timed too.
+* A whole design (e.g. `ChaserGpio`) is built by the platform itself, with the pins constraints.
+
+The tools are found like amaranth does : the YOSYS and NEXTPNR_ECP5 environment variables, or `yosys` and
+`nextpnr-ecp5` from the PATH.
+"""
+### builtin deps
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+### amaranth -- main deps
+from amaranth import *
+from amaranth.back import rtlil
+from amaranth.build import Platform
+
+### local deps
+from sandbox import Benchmark, caseName, sortPorts  # -- also makes the modules of the sandbox importable
+from colorlight_i9 import Colorlight_I9_V7_2_Platform
+from counter import RippleCounter, SlowRippleCounter, PipelinedCounter
+from decoder import Decoder, TreeDecoder, Encoder
+from slowbeat import SlowBeat, SharedSlowBeat
+from blinky import Blinky
+from chaser_gpio import ChaserCore, ChaserGpio
+from CellOfTaggedValue import CellOfTaggedValue
+from ContentAddressableMemory import ContentAddressableMemory
+from HashedAssociativeTable import HashedAssociativeTable
+from sdram import SdramController
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "synthesis_baseline.json")
+PRIMES = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47, 53]
+
+
+class SlowBeats(Elaboratable):
+    """Independent `SlowBeat` instances, one per frequency, to compare with `SharedSlowBeat`."""
+
+    def __init__(self, frequencies: List[int]):
+        self.beats = [SlowBeat(frequency) for frequency in frequencies]
+
+    def ports(self) -> List[Signal]:
+        return [port for beat in self.beats for port in beat.ports()]
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        m.submodules += self.beats
+
+        return m
+
+
+BENCHMARKS = [
+    Benchmark("RippleCounter", lambda width: RippleCounter(width), {"width": [8, 16, 32, 64, 128, 256]}),
+    Benchmark("SlowRippleCounter", lambda width: SlowRippleCounter(width), {"width": [8, 32]}),
+    Benchmark(
+        "PipelinedCounter",
+        lambda width, chunk: PipelinedCounter(width, chunk),
+        {"width": [16, 32, 64, 128, 256], "chunk": [8, 16]},
+    ),
+    Benchmark("Decoder", lambda span: Decoder(span), {"span": [2, 4, 16, 64, 256, 1024, 4096]}),
+    Benchmark(
+        "TreeDecoder",
+        lambda span, pipelineEvery: TreeDecoder(span, pipelineEvery=pipelineEvery, registered=True),
+        {"span": [2, 16, 256, 1024, 4096], "pipelineEvery": [0, 1]},
+    ),
+    # -- without wide LUTs, yosys shares the predecoded fields of the combinational AND-plane
+    Benchmark(
+        "TreeDecoderNoWideLut",
+        lambda span: TreeDecoder(span, registered=True),
+        {"span": [2, 16, 256, 1024, 4096]},
+        synthOptions="-nowidelut",
+    ),
+    Benchmark(
+        "Encoder",
+        lambda span, pipelineEvery: Encoder(span, pipelineEvery=pipelineEvery, registered=True),
+        {"span": [2, 16, 256, 1024, 4096], "pipelineEvery": [0, 2]},
+    ),
+    Benchmark("SlowBeat", lambda frequency: SlowBeat(frequency), {"frequency": [1, 3, 1000, 1000000]}),
+    Benchmark("SlowBeats", lambda beats: SlowBeats(PRIMES[:beats]), {"beats": [1, 4, 16]}),
+    Benchmark("SharedSlowBeat", lambda beats: SharedSlowBeat(PRIMES[:beats]), {"beats": [1, 4, 16]}),
+    Benchmark(
+        "CellOfTaggedValue",
+        lambda valueWidth: CellOfTaggedValue(5, unsigned(4), unsigned(valueWidth)),
+        {"valueWidth": [8, 32]},
+    ),
+    Benchmark(
+        "ContentAddressableMemory",
+        lambda depth, pipelineEvery: ContentAddressableMemory(depth, unsigned(16), pipelineEvery),
+        {"depth": [16, 64, 256], "pipelineEvery": [0, 1, 2]},
+    ),
+    Benchmark(
+        "HashedAssociativeTable",
+        lambda buckets, ways: HashedAssociativeTable(unsigned(16), buckets, ways),
+        {"buckets": [64, 512], "ways": [1, 4, 8]},
+    ),
+    Benchmark("ChaserCore", lambda strobed: ChaserCore(10, 3, strobed), {"strobed": [False, True]}),
+    Benchmark("SdramController", lambda burstLength: SdramController(burstLength=burstLength), {"burstLength": [1, 8]}),
+    Benchmark("Blinky", lambda: Blinky(), {}, wholeDesign=True),
+    Benchmark("ChaserGpio", lambda: ChaserGpio("p", 2, (5, 7, 9, 11, 13, 17, 23, 25, 27, 29)), {}, wholeDesign=True),
+]
+
+
+class RegisteredPorts(Elaboratable):
+    """Register all the ports of a module, to time its paths from and to its ports.
+
+    The outputs are the ports driven by the module, the other ports are the inputs.
+    """
+
+    def __init__(self, module: Elaboratable):
+        self.module = module
+        self.inputs = []  # pairs (port, register)
+        self.outputs = []  # pairs (port, register)
+
+    def ports(self) -> List[Signal]:
+        return [register for _, register in self.inputs + self.outputs]
+
+    def prepare(self, platform: Platform):
+        """Elaborate the module and sort its ports ; MUST be called before `ports()` and the elaboration."""
+        self.fragment, inputs, outputs = sortPorts(self.module, platform)
+        self.inputs = [(port, Signal.like(port, name=f"i_{port.name}")) for port in inputs]
+        self.outputs = [(port, Signal.like(port, name=f"o_{port.name}")) for port in outputs]
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        m.submodules.module = self.fragment
+        m.d.sync += [port.eq(register) for port, register in self.inputs]
+        m.d.sync += [register.eq(port) for port, register in self.outputs]
+
+        return m
+
+
+def readReport(reportFile: str) -> Dict[str, Any]:
+    """Extract the utilization and the maximum frequency from a nextpnr report."""
+    with open(reportFile) as f:
+        report = json.load(f)
+    utilization = report["utilization"]
+    frequencies = [clock["achieved"] for clock in report.get("fmax", {}).values()]
+    return {
+        "lut": utilization["TRELLIS_COMB"]["used"],
+        "ff": utilization["TRELLIS_FF"]["used"],
+        "bram": utilization["DP16KD"]["used"],
+        "fmax": round(min(frequencies), 2) if frequencies else None,
+    }
+
+
+def runCase(benchmarkName: str, params: Dict[str, Any], workDir: str) -> Dict[str, Any]:
+    """Synthesize, place and route one case, in its own working directory.
+
+    Returns:
+        Dict[str, Any]: the result ; `error` is set when the case could not be built.
+    """
+    benchmark = next(b for b in BENCHMARKS if b.name == benchmarkName)
+    result = {"case": caseName(benchmarkName, params), "benchmark": benchmarkName, "params": params}
+    os.makedirs(workDir, exist_ok=True)
+    platform = Colorlight_I9_V7_2_Platform(build_cache_dir=None)
+    try:
+        start = time.perf_counter()
+        if benchmark.wholeDesign:
+            plan = platform.prepare(benchmark.factory(**params), "top", synth_opts=benchmark.synthOptions,
+                nextpnr_opts="--report top.report.json")
+            result["elaboration"] = round(time.perf_counter() - start, 3)
+            start = time.perf_counter()
+            plan.execute_local(workDir)
+        else:
+            top = RegisteredPorts(benchmark.factory(**params))
+            top.prepare(platform)
+            with open(os.path.join(workDir, "top.il"), "w") as f:
+                f.write(rtlil.convert(top, platform=platform, ports=top.ports()))
+            result["elaboration"] = round(time.perf_counter() - start, 3)
+            start = time.perf_counter()
+            # -- relative paths only, the tools may run in a sandbox rooted at the working directory
+            subprocess.run(
+                [os.environ.get("YOSYS", "yosys"), "-q", "-l", "top.rpt", "-p", f"read_rtlil top.il; synth_ecp5 {benchmark.synthOptions} -top top -json top.json"],
+                cwd=workDir, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+            )
+            subprocess.run(
+                [
+                    os.environ.get("NEXTPNR_ECP5", "nextpnr-ecp5"), "--quiet", "--log", "top.tim",
+                    platform._nextpnr_device_options[platform.device],
+                    "--package", platform._nextpnr_package_options[platform.package].upper(),
+                    "--speed", platform.speed,
+                    "--json", "top.json", "--out-of-context", "--report", "top.report.json",
+                    "--freq", str(platform.default_clk_frequency / 1e6),
+                ],
+                cwd=workDir, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+            )
+        result["synthesis"] = round(time.perf_counter() - start, 3)
+        result.update(readReport(os.path.join(workDir, "top.report.json")))
+    except subprocess.CalledProcessError as e:
+        result["error"] = f"{os.path.basename(e.cmd[0])} failed : {(e.stderr or '').strip()[-500:]}"
+    except Exception as e:
+        result["error"] = f"{type(e).__name__} : {e}"
+    return result
+
+
+def compareToBaseline(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float) -> List[str]:
+    """List the regressions of the results against the baseline.
+
+    A regression is a LUT, FF or block RAM count growing by more than `tolerance` (relative), or a maximum frequency
+    dropping by more than `tolerance`. The cases missing from the baseline are not compared.
+    """
+    references = {reference["case"]: reference for reference in baseline}
+    regressions = []
+    for result in results:
+        reference = references.get(result["case"])
+        if reference is None or "error" in result:
+            continue
+        for resource in ["lut", "ff", "bram"]:
+            if result[resource] > reference[resource] * (1 + tolerance):
+                regressions.append(f"{result['case']} : {resource} {reference[resource]} -> {result[resource]}")
+        if reference["fmax"] is not None and (result["fmax"] is None or result["fmax"] < reference["fmax"] * (1 - tolerance)):
+            regressions.append(f"{result['case']} : fmax {reference['fmax']} MHz -> {result['fmax']} MHz")
+    return regressions
+
+
+CSV_FIELDS = ["case", "lut", "ff", "bram", "fmax", "elaboration", "synthesis", "error"]
+
+
+def writeReports(results: List[Dict[str, Any]], jsonFile: Optional[str], csvFile: Optional[str]):
+    if jsonFile is not None:
+        with open(jsonFile, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+    if csvFile is not None:
+        with open(csvFile, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Synthesis benchmark of the modules of the sandbox, on the Colorlight i9")
+    parser.add_argument("--only", dest="only", metavar="BENCHMARK", nargs="+",
+        help=f"only run the given benchmarks, among {', '.join(b.name for b in BENCHMARKS)}")
+    parser.add_argument("-j", "--jobs", dest="jobs", metavar="COUNT", type=int, default=os.cpu_count(),
+        help="run at most COUNT cases at once (default: %(default)s)")
+    parser.add_argument("--build-dir", dest="buildDir", metavar="DIR", default=os.path.join("build", "synthesis"),
+        help="where to build the cases (default: %(default)s)")
+    parser.add_argument("--json", dest="jsonFile", metavar="FILE",
+        help="write the results to FILE, as JSON")
+    parser.add_argument("--csv", dest="csvFile", metavar="FILE",
+        help="write the results to FILE, as CSV")
+    parser.add_argument("--baseline", dest="baseline", metavar="FILE", default=BASELINE,
+        help="fail when a result regresses from the baseline in FILE, a JSON report (default: %(default)s)")
+    parser.add_argument("--tolerance", dest="tolerance", metavar="RATIO", type=float, default=0.1,
+        help="the relative difference from the baseline that is not a regression (default: %(default)s)")
+    parser.add_argument("--update-baseline", dest="updateBaseline", action="store_true",
+        help="write the results into the baseline file instead of comparing them")
+    args = parser.parse_args()
+
+    benchmarks = [b for b in BENCHMARKS if args.only is None or b.name in args.only]
+    if args.only is not None:
+        unknown = set(args.only) - {b.name for b in benchmarks}
+        if unknown:
+            parser.error(f"unknown benchmarks : {', '.join(sorted(unknown))}")
+
+    # -- all the cases are run in parallel, the results are listed in the order of the benchmarks
+    cases = [(b.name, params) for b in benchmarks for params in b.cases()]
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        futures = [
+            executor.submit(runCase, name, params, os.path.join(args.buildDir, f"case_{index:03}"))
+            for index, (name, params) in enumerate(cases)
+        ]
+        results = []
+        for future in futures:
+            result = future.result()
+            results.append(result)
+            if "error" in result:
+                print(f"FAILED : {result['case']} -- {result['error']}")
+            else:
+                fmax = "-" if result["fmax"] is None else f"{result['fmax']:.1f} MHz"
+                print(f"{result['case']:<50} {result['lut']:>6} LUT {result['ff']:>6} FF {result['bram']:>3} BRAM {fmax:>12}")
+
+    writeReports(results, args.jsonFile, args.csvFile)
+    failed = any("error" in result for result in results)
+    if args.updateBaseline or os.path.exists(args.baseline):
+        if args.updateBaseline:
+            # -- the cases that were not run are kept in the baseline
+            baseline = []
+            if os.path.exists(args.baseline):
+                with open(args.baseline) as f:
+                    baseline = json.load(f)
+            updated = {result["case"] for result in results if "error" not in result}
+            baseline = [reference for reference in baseline if reference["case"] not in updated]
+            baseline += [result for result in results if "error" not in result]
+            writeReports(baseline, args.baseline, None)
+            print(f"Baseline updated : {args.baseline}")
+        else:
+            with open(args.baseline) as f:
+                regressions = compareToBaseline(results, json.load(f), args.tolerance)
+            for regression in regressions:
+                print(f"REGRESSION : {regression}")
+            failed = failed or len(regressions) > 0
+    sys.exit(1 if failed else 0)
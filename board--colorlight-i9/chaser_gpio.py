@@ -6,10 +6,73 @@ from typing import List, Dict, Tuple, Optional
 
 ### local deps
 from slowbeat import SlowBeat
-from counter import SlowRippleCounter
+from counter import RippleCounter, SlowRippleCounter
 from decoder import Decoder
 
-__all__ = ["ChaserGpio"]
+__all__ = ["ChaserCore", "ChaserGpio"]
+
+class ChaserCore(Elaboratable):
+    """The logic of the chaser : one of the `count` outputs at a time is asserted with slowbeat, the next one at
+    each period of the beat.
+
+    When `strobed` is set, the counter and the decoder are under the enable of the strobe of slowbeat, they only
+    advance one clock cycle per period of the beat. Otherwise the counter detects the leading edges of the beat
+    by itself, and the decoder runs at the pace of the clock.
+    """
+
+    def __init__(self, count:int, frequency:int = 3, strobed:bool = True):
+        """Store the parameters for the elaboration
+
+        Args:
+            count (int): The number of outputs
+            frequency (int, optional): The frequency of the beat, in Hertz. Defaults to 3.
+            strobed (bool, optional): Whether the counter and the decoder run under the enable of the strobe. Defaults to True.
+        """
+        self.count = count
+        self.frequency = frequency
+        self.strobed = strobed
+        self.output = Signal(count)
+
+    def ports(self) -> List[Signal]:
+        return [self.output]
+
+    def elaborate(self, platform):
+        # Prepare
+        m = Module()
+        # -- submodules
+        m.submodules.slowbeat = slowbeat = SlowBeat(self.frequency)
+        if self.strobed:
+            # -- the whole subtree is clock enabled, the decoder does not need its own change detection anymore
+            # -- -- but it still registers the count, thus shows the count of the previous strobe.
+            decoder = Decoder(self.count, changeDetection=False)
+            counter = RippleCounter(decoder.input.shape().width)
+            m.submodules.counter = EnableInserter(slowbeat.strobe)(counter)
+            m.submodules.decoder = EnableInserter(slowbeat.strobe)(decoder)
+        else:
+            decoder = Decoder(self.count)
+            counter = SlowRippleCounter(decoder.input.shape().width)
+            m.submodules.counter = counter
+            m.submodules.decoder = decoder
+            # -- counter is clocked by slowbeat
+            m.d.comb += counter.beat.eq(slowbeat.beat_p)
+
+        # Wiring
+        # -- each output is selected with decoder and asserted with slowbeat
+        # -- -- output #0 is also selected when decoder is in error, for when 
+        # -- -- the number of outputs is not a power of 2. In this case it is usefull
+        # -- -- to visually identify the first output.
+        for i in range(self.count):
+            if (i == 0):
+                m.d.comb += self.output[i].eq((decoder.output[i] | decoder.outOfRange) & slowbeat.beat_p)
+            else:
+                m.d.comb += self.output[i].eq(decoder.output[i] & slowbeat.beat_p)
+
+        # -- decoder is fed by counter
+        m.d.comb += decoder.input.eq(counter.value)
+
+        # DONE
+        return m
+
 
 class ChaserGpio(Elaboratable):
     """A one second cycle, 50% duty to drive a led on a target gpio of a connector.
@@ -54,30 +117,16 @@ class ChaserGpio(Elaboratable):
         # Prepare
         m = Module()
         # -- submodules
-        m.submodules.decoder = decoder = Decoder(len(self.targetPinIndexes))
-        m.submodules.slowbeat = slowbeat = SlowBeat(3)
-        m.submodules.counter = counter = SlowRippleCounter(decoder.input.shape().width)
+        m.submodules.core = core = ChaserCore(len(self.targetPinIndexes), 3)
 
         # -- configure the targeted pins as "my_gpio" with indexes starting from 0
         self.setup(platform)
 
         # Wiring
-        # -- each gpio is selected with decoder and asserted with slowbeat
-        # -- -- pin #0 is also selected when decoder is in error, for when 
-        # -- -- the number of pins is not a power of 2. In this case it is usefull
-        # -- -- to visually identify the first pin.
+        # -- each gpio follows an output of the core
         for i in range(len(self.targetPinIndexes)):
             target = platform.request("my_gpio",i)
-            if (i == 0):
-                m.d.comb += target.eq((decoder.output[i] | decoder.outOfRange) & slowbeat.beat_p)
-            else:
-                m.d.comb += target.eq(decoder.output[i] & slowbeat.beat_p)
-
-        # -- decoder is fed by counter
-        m.d.comb += decoder.input.eq(counter.value)
-
-        # -- counter is clocked by slowbeat
-        m.d.comb += counter.beat.eq(slowbeat.beat_p)
+            m.d.comb += target.eq(core.output[i])
 
         # DONE
-        return m 
\ No newline at end of file
+        return m
@@ -1,10 +1,19 @@
+import itertools
+import json
 import os
+import shlex
+import shutil
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
+from amaranth import *
 from amaranth.build import *
+from amaranth.build.run import BuildPlan
 from amaranth.vendor.lattice_ecp5 import *
 from amaranth_boards.resources import *  # from .resources import *
 
+from pll import Ecp5Pll, PllClockDomain, PllSettings
+
 
 class Colorlight_I9_V7_2_Platform(LatticeECP5Platform):
     """See board info at https://github.com/wuxx/Colorlight-FPGA-Projects/blob/master/colorlight_i9_v7.2.md"""
@@ -21,6 +30,15 @@ class Colorlight_I9_V7_2_Platform(LatticeECP5Platform):
         *LEDResources(
             pins="L2", attrs=Attrs(IO_TYPE="LVCMOS33", DRIVE="4")
         ),  # the sample use LVCMOS25, but this pins is also accessible out of the board
+        # M12L64322A, 4 banks x 2048 rows x 256 columns x 32 bits ; CS, CKE and DQM are tied on the board
+        SDRAMResource(
+            0,
+            clk="B9", we_n="A10", ras_n="B10", cas_n="A9",
+            ba="B11 C8", a="B13 C14 A16 A17 B16 B15 A14 A13 A12 A11 B12",
+            dq="B6 A5 A6 A7 C7 B8 B5 A8 D8 D7 E8 D6 C6 D5 E7 C5 "
+            "C10 D9 E11 D11 C11 D12 E9 C12 E14 C15 E13 D15 E12 B17 D14 D13",
+            attrs=Attrs(IO_TYPE="LVCMOS33", SLEWRATE="FAST"),
+        ),
     ]
 
     # no connectors for now
@@ -35,6 +53,85 @@ class Colorlight_I9_V7_2_Platform(LatticeECP5Platform):
         ),
     ]
 
+    def __init__(self, *, build_cache_dir=os.path.join("build", "cache"), build_cache_size=256 * 1024 * 1024, clocks=None,
+            pnr_seeds=1, pnr_options=None, pnr_jobs=None, **kwargs):
+        """Set up the platform.
+
+        Args:
+            build_cache_dir (str, optional): Where to keep the bitstreams already built, None to disable the cache. Defaults to "build/cache".
+            build_cache_size (int, optional): The maximum size of the cache in bytes, the least recently used bitstreams are evicted first. Defaults to 256 MiB.
+            clocks (Dict[str, Union[float, Tuple[float, float]]], optional): The clock domains generated by the PLL from clk25, by name,
+                see `PllSettings` ; e.g. `{"sync": 100e6, "fast": 200e6, "sync_90": (100e6, 90)}`. Defaults to None, the sync domain
+                is then clocked by clk25.
+            pnr_seeds (Union[int, List[int]], optional): The seeds of nextpnr-ecp5, or their number (seeds 1 to N). Defaults to 1.
+            pnr_options (List[str], optional): Variants of the options of nextpnr-ecp5, each one is run with each seed,
+                e.g. `["", "--placer sa", "--tmg-ripup"]`. Defaults to None, a single variant without any option.
+            pnr_jobs (int, optional): The maximum number of nextpnr-ecp5 runs at once. Defaults to None, the number of CPUs.
+        """
+        super().__init__(**kwargs)
+        self.build_cache_dir = build_cache_dir
+        self.build_cache_size = build_cache_size
+        self.pllSettings = None if clocks is None else PllSettings(self.lookup("clk25").clock.frequency, clocks)
+        self._pll = None
+        self._clkIn = None
+        seeds = list(range(1, pnr_seeds + 1)) if isinstance(pnr_seeds, int) else list(pnr_seeds)
+        self.pnr_runs = list(itertools.product(seeds, [""] if pnr_options is None else pnr_options))
+        self.pnr_jobs = pnr_jobs
+
+    @property
+    def default_clk_frequency(self):
+        """The frequency of the sync domain : the one generated by the PLL, if any, else the one of clk25."""
+        return self.clockFrequency("sync")
+
+    def clockFrequency(self, domain:str) -> float:
+        """The frequency of the given clock domain, in Hertz.
+
+        Args:
+            domain (str): The name of the domain, "sync" or any clock generated by the PLL.
+        """
+        if self.pllSettings is not None and any(output.name == domain for output in self.pllSettings.outputs):
+            return self.pllSettings.frequencyOf(domain)
+        if domain == "sync":
+            return super().default_clk_frequency
+        raise ValueError(f"Unknown clock domain '{domain}'")
+
+    def clockInput(self) -> Signal:
+        """The input of clk25, requested once for the PLL and the sync domain that both use it."""
+        if self._clkIn is None:
+            self._clkIn = self.request(self.default_clk).i
+        return self._clkIn
+
+    def create_missing_domain(self, name):
+        if self.pllSettings is None:
+            return super().create_missing_domain(name)
+        if not any(output.name == name for output in self.pllSettings.outputs):
+            if name == "sync":
+                # -- like LatticeECP5Platform, from the pin of clk25 that the PLL may have requested already
+                return self._syncDomainOfClockInput()
+            return super().create_missing_domain(name)
+        # -- one PLL for all the domains, instanciated with the first of them
+        if self._pll is None:
+            self._pll = Ecp5Pll(self.pllSettings)
+            for output in self.pllSettings.outputs:
+                self.add_clock_constraint(self._pll.clocks[output.name], output.frequency)
+            return PllClockDomain(self._pll, name, self.clockInput())
+        return PllClockDomain(self._pll, name)
+
+    def _syncDomainOfClockInput(self) -> Module:
+        """The sync domain clocked by clk25, reset by GSR after a reset synchronizer, like LatticeECP5Platform does."""
+        m = Module()
+        clk_i = self.clockInput()
+        gsr0 = Signal()
+        gsr1 = Signal()
+        m.submodules += [
+            Instance("FD1S3AX", p_GSR="DISABLED", i_CK=clk_i, i_D=Const(1), o_Q=gsr0),
+            Instance("FD1S3AX", p_GSR="DISABLED", i_CK=clk_i, i_D=gsr0, o_Q=gsr1),
+            Instance("SGSR", i_CLK=clk_i, i_GSR=gsr1),
+        ]
+        m.domains += ClockDomain("sync", reset_less=True)
+        m.d.comb += ClockSignal("sync").eq(clk_i)
+        return m
+
     @property
     def required_tools(self):
         return super().required_tools + ["openFPGALoader"]
@@ -42,9 +139,200 @@ class Colorlight_I9_V7_2_Platform(LatticeECP5Platform):
     def toolchain_prepare(self, fragment, name, **kwargs):
         overrides = dict(ecppack_opts="--compress")
         overrides.update(kwargs)
-        return super().toolchain_prepare(fragment, name, **overrides)
+        plan = super().toolchain_prepare(fragment, name, **overrides)
+        products = [f"{name}.bit", f"{name}.svf"]
+        if len(self.pnr_runs) > 1:
+            plan = SweepBuildPlan(plan, self, name, self.pnr_runs, self.pnr_jobs, overrides)
+            products.append(f"{name}.pnr.json")
+        if self.build_cache_dir is None:
+            return plan
+        return CachedBuildPlan(plan, products, self.build_cache_dir, self.build_cache_size)
 
     def toolchain_program(self, products, name):
         tool = os.environ.get("OPENFPGALOADER", "openFPGALoader")
         with products.extract("{}.bit".format(name)) as bitstream_filename:
             subprocess.check_call([tool, "-c", "cmsisdap", "-m", bitstream_filename])
+
+
+class CachedBuildPlan(BuildPlan):
+    """A build plan that reuses the products of a previous build of the very same plan.
+
+    The plan is identified by the digest of its files (RTLIL, constraints, scripts with the toolchain options).
+    The products are kept in one directory per digest ; when the cache grows over its maximum size, the least
+    recently used entries are evicted.
+    """
+
+    def __init__(self, plan:BuildPlan, products, cacheDir:str, cacheSize:int):
+        super().__init__(plan.script)
+        self.plan = plan
+        self.files = plan.files
+        self.products = products
+        self.cacheDir = cacheDir
+        self.cacheSize = cacheSize
+
+    def execute_local(self, root="build", *, run_script=True, env=None):
+        if not run_script:
+            return self.plan.execute_local(root, run_script=False, env=env)
+
+        entry = os.path.join(self.cacheDir, self.digest(32).hex())
+        if all(os.path.exists(os.path.join(entry, product)) for product in self.products):
+            print(f"Reusing the products of the build from {entry}")
+            products = self.plan.execute_local(root, run_script=False, env=env)
+            for product in self.products:
+                shutil.copy(os.path.join(entry, product), os.path.join(root, product))
+            os.utime(entry)
+            return products
+
+        products = self.plan.execute_local(root, run_script=True, env=env)
+        os.makedirs(self.cacheDir, exist_ok=True)
+        # -- fill a temporary directory then rename it, so that an entry is always complete.
+        pending = f"{entry}.{os.getpid()}.tmp"
+        shutil.rmtree(pending, ignore_errors=True)
+        os.makedirs(pending)
+        for product in self.products:
+            shutil.copy(os.path.join(root, product), os.path.join(pending, product))
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(pending, entry)
+        self.evict()
+        return products
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in its maximum size."""
+        entries = []
+        for name in os.listdir(self.cacheDir):
+            path = os.path.join(self.cacheDir, name)
+            if not os.path.isdir(path) or name.endswith(".tmp"):
+                continue
+            size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+            entries.append((os.path.getmtime(path), size, path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries[:-1]:  # -- always keep the most recent entry
+            if total <= self.cacheSize:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+class SweepBuildPlan(BuildPlan):
+    """A build plan that places and routes the synthesized netlist several times, and keeps the best bitstream.
+
+    The netlist is synthesized once by yosys, then nextpnr-ecp5 is run in parallel, once per seed and variant of
+    the options ; the run with the best worst slack (among all the clocks) is packed by ecppack. The summary of all
+    the runs is written as `{name}.pnr.json`, the files of each run are kept in `pnr/run_XX/`.
+
+    Only the local execution sweeps, the script of the plan (for a remote build) still runs a single nextpnr-ecp5.
+    """
+
+    def __init__(self, plan:BuildPlan, platform, name:str, runs, jobs, overrides):
+        super().__init__(plan.script)
+        self.plan = plan
+        self.platform = platform
+        self.name = name
+        self.runs = runs  # pairs (seed, options)
+        self.jobs = jobs
+        self.overrides = overrides
+        self.files = dict(plan.files)
+        # -- the runs are part of the plan, thus of its digest
+        self.files[f"{name}.pnr_runs.json"] = json.dumps([{"seed": seed, "options": options} for seed, options in runs])
+
+    def execute_local(self, root="build", *, run_script=True, env=None):
+        products = super().execute_local(root, run_script=False, env=env)
+        if not run_script:
+            return products
+
+        root = os.path.abspath(root)
+        env = os.environ if env is None else env
+        name = self.name
+        subprocess.run([env.get("YOSYS", "yosys"), "-q", *self.options("yosys_opts"), "-l", f"{name}.rpt", f"{name}.ys"],
+            cwd=root, env=env, check=True)
+
+        with ThreadPoolExecutor(max_workers=self.jobs or os.cpu_count()) as executor:
+            runs = list(executor.map(lambda index: self.placeAndRoute(root, env, index), range(len(self.runs))))
+        placed = [run for run in runs if "slack" in run]
+        best = max(placed, key=lambda run: run["slack"], default=None)
+        summary = {"best": None if best is None else best["run"], "runs": runs}
+        with open(os.path.join(root, f"{name}.pnr.json"), "w") as f:
+            json.dump(summary, f, indent=2)
+            f.write("\n")
+        for run in runs:
+            if "error" in run:
+                print(f"pnr run {run['run']:>2} (seed {run['seed']}, '{run['options']}') : FAILED")
+            else:
+                fmax = ", ".join(f"{clock} {frequency:.1f} MHz" for clock, frequency in run["fmax"].items())
+                print(f"pnr run {run['run']:>2} (seed {run['seed']}, '{run['options']}') : slack {run['slack']:.3f} ns, {fmax}"
+                    + (" <- best" if run is best else ""))
+        if best is None:
+            raise RuntimeError(f"No place and route succeeded, see {os.path.join(root, 'pnr')}")
+        if best["slack"] < 0 and "--timing-allow-fail" not in self.options("nextpnr_opts"):
+            raise RuntimeError(f"No place and route meets the timing constraints, see {os.path.join(root, f'{name}.pnr.json')}")
+
+        shutil.copy(os.path.join(root, best["directory"], f"{name}.config"), os.path.join(root, f"{name}.config"))
+        subprocess.run([env.get("ECPPACK", "ecppack"), *self.options("ecppack_opts"),
+            "--input", f"{name}.config", "--bit", f"{name}.bit", "--svf", f"{name}.svf"],
+            cwd=root, env=env, check=True)
+        return products
+
+    def options(self, override:str):
+        """The options given to the platform for a tool, as a list."""
+        options = self.overrides.get(override, [])
+        return shlex.split(options) if isinstance(options, str) else list(options)
+
+    def placeAndRoute(self, root:str, env, index:int):
+        """Run nextpnr-ecp5 once, in its own directory ; return the summary of the run."""
+        seed, options = self.runs[index]
+        directory = os.path.join("pnr", f"run_{index:02}")
+        os.makedirs(os.path.join(root, directory), exist_ok=True)
+        platform = self.platform
+        run = {"run": index, "seed": seed, "options": options, "directory": directory}
+        completed = subprocess.run(
+            [
+                env.get("NEXTPNR_ECP5", "nextpnr-ecp5"), "--quiet", *self.options("nextpnr_opts"), *shlex.split(options),
+                "--seed", str(seed), "--timing-allow-fail",
+                "--log", os.path.join(directory, f"{self.name}.tim"),
+                "--report", os.path.join(directory, "report.json"),
+                platform._nextpnr_device_options[platform.device],
+                "--package", platform._nextpnr_package_options[platform.package].upper(),
+                "--speed", platform.speed,
+                "--json", f"{self.name}.json",
+                "--lpf", f"{self.name}.lpf",
+                "--textcfg", os.path.join(directory, f"{self.name}.config"),
+            ],
+            cwd=root, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        if completed.returncode != 0:
+            run["error"] = f"nextpnr-ecp5 exited with {completed.returncode}"
+            return run
+        with open(os.path.join(root, directory, "report.json")) as f:
+            report = json.load(f)
+        clocks = report.get("fmax", {})
+        run["fmax"] = {clock: round(timing["achieved"], 2) for clock, timing in clocks.items()}
+        # -- the slack of a clock is the difference of the periods, in ns
+        run["slack"] = round(min((1e3 / timing["constraint"] - 1e3 / timing["achieved"] for timing in clocks.values()), default=0.0), 3)
+        return run
+
+
+if __name__ == "__main__":
+    # -- elaborate a design using sync and the domains of the PLL, for each way to give the clocks ; no toolchain needed
+    class ClockedDesign(Elaboratable):
+        def __init__(self, domains):
+            self.domains = domains
+
+        def elaborate(self, platform):
+            m = Module()
+            for domain in self.domains:
+                toggle = Signal(name=f"toggle_{domain}")
+                m.d[domain] += toggle.eq(~toggle)
+            return m
+
+    cases = [
+        (None, ["sync"]),
+        ({"sync": 100e6}, ["sync"]),
+        ({"sync": 100e6, "fast": 200e6}, ["sync", "fast"]),
+        ({"fast": 200e6}, ["sync", "fast"]),
+        ({"fast": 200e6}, ["fast", "sync"]),
+    ]
+    for clocks, domains in cases:
+        platform = Colorlight_I9_V7_2_Platform(clocks=clocks, build_cache_dir=None)
+        platform.prepare(ClockedDesign(domains), name="clocks")
+        print(f"OK : clocks={clocks}, domains {', '.join(domains)}")
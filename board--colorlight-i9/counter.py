@@ -65,3 +65,71 @@ class SlowRippleCounter(Elaboratable):
                 m.d.sync += [self.value.eq((self.value + 1)[0 : self.width])]
 
         return m
+
+
+class PipelinedCounter(Elaboratable):
+    """Counter that is incremented at each clock ; the value has the specified width, split into chunks.
+
+    Each chunk of `chunk` bits has its own adder, and a registered flag telling whether the chunk is full
+    (all ones). A chunk is incremented when all the lower chunks are full (carry lookahead), so that the
+    longest path is one chunk wide adder plus an AND of the flags, instead of a `width` bits wide adder.
+
+    All the chunks are updated on the same clock : the value is always consistent, without latency.
+    """
+
+    def __init__(self, width: int, chunk: int = 16):
+        if width < 1:
+            raise ValueError("PipelinedCounter MUST have a width of at least 1.")
+        if chunk < 1:
+            raise ValueError("PipelinedCounter MUST have chunks of at least 1 bit.")
+        self.width = width
+        self.chunk = chunk
+        self.value = Signal(width)
+
+    def ports(self) -> List[Signal]:
+        return [self.value]
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        self.elaborateChunks(m, Const(1))
+
+        return m
+
+    def elaborateChunks(self, m: Module, increment: Value):
+        """Increment the value when `increment` is asserted.
+
+        Args:
+            m (Module): the module to populate.
+            increment (Value): the condition to increment the value.
+        """
+        carry = increment
+        for start in range(0, self.width, self.chunk):
+            part = self.value[start : start + self.chunk]
+            isFull = Signal(name=f"isFull_{start // self.chunk}")  # is the chunk all ones ?
+            with m.If(carry):
+                m.d.sync += [
+                    part.eq((part + 1)[0 : len(part)]),
+                    isFull.eq(part == (1 << len(part)) - 2),
+                ]
+            carry = carry & isFull
+
+
+class SlowPipelinedCounter(PipelinedCounter):
+    """PipelinedCounter that is incremented on each leading edge of the active high `beat` input."""
+
+    def __init__(self, width: int, chunk: int = 16):
+        super().__init__(width, chunk)
+        self.beat = Signal()
+
+    def ports(self) -> List[Signal]:
+        return [self.beat, self.value]
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        previousBeatValue = Signal()
+        m.d.sync += [previousBeatValue.eq(self.beat)]
+        self.elaborateChunks(m, (self.beat != previousBeatValue) & (self.beat == 1))
+
+        return m
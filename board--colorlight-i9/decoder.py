@@ -19,7 +19,7 @@ If not, see <https://www.gnu.org/licenses/>. 
 ---
 """
 ### builtin deps
-from typing import List  # , Dict, Tuple, Optional
+from typing import List, Optional  # , Dict, Tuple
 
 ### amaranth -- main deps
 from amaranth import *
@@ -27,12 +27,17 @@ from amaranth.build import Platform
 
 
 class Decoder(Elaboratable):
-    """Generate a decoder that supports an input in range [0..span[."""
+    """Generate a decoder that supports an input in range [0..span[.
 
-    def __init__(self, span: int):
+    The outputs are registered, and only updated when the input changes. Without `changeDetection`, they are
+    updated at each clock cycle, e.g. when the decoder is already under a clock enable.
+    """
+
+    def __init__(self, span: int, changeDetection: bool = True):
         if span < 2:
             raise ValueError("Decoder MUST have a span of at least 2.")
         self.span = span
+        self.changeDetection = changeDetection
         self.input = Signal(range(0, span))
         self.output = Signal(span, reset=1)
         self.outOfRange = Signal()
@@ -43,11 +48,186 @@ class Decoder(Elaboratable):
     def elaborate(self, platform: Platform) -> Module:
         m = Module()
 
-        previousInput = Signal(self.input.shape())
-        with m.If(previousInput != self.input):
+        if self.changeDetection:
+            previousInput = Signal(self.input.shape())
+            changed = previousInput != self.input
             m.d.sync += previousInput.eq(self.input)
+        else:
+            changed = Const(1)
+        with m.If(changed):
             for i in range(0, self.span):
                 m.d.sync += self.output[i].eq(Mux(self.input == i, 1, 0))
             m.d.sync += self.outOfRange.eq(Mux(self.input < self.span, 0, 1))
 
         return m
+
+
+def _stage(m: Module, value: Value, name: Optional[str] = None) -> Signal:
+    """Register the given value, and return the register."""
+    register = Signal.like(value, name=name)
+    m.d.sync += register.eq(value)
+    return register
+
+
+class TreeDecoder(Elaboratable):
+    """Generate a decoder that supports an input in range [0..span[, structured as a tree.
+
+    The input is split into fields of `fieldWidth` bits, each field is predecoded into a one-hot vector,
+    then the AND-plane combines the one-hot vectors two by two (outer products) until there is one line
+    per output bit. Each output bit is thus a 2 inputs AND of the level before.
+
+    When `pipelineEvery` is 0, the whole tree is combinational. Otherwise the partial products are
+    registered every `pipelineEvery` levels, the predecoding being the first level. When `registered` is
+    set, the outputs are registered too. The outputs are valid `latency` clock cycles after the input.
+    """
+
+    def __init__(self, span: int, fieldWidth: int = 2, pipelineEvery: int = 0, registered: bool = False):
+        if span < 2:
+            raise ValueError("TreeDecoder MUST have a span of at least 2.")
+        if fieldWidth < 1:
+            raise ValueError("fieldWidth MUST be at least 1.")
+        if pipelineEvery < 0:
+            raise ValueError("pipelineEvery MUST be positive, or 0 to disable the pipeline.")
+        self.span = span
+        self.fieldWidth = fieldWidth
+        self.pipelineEvery = pipelineEvery
+        self.registered = registered
+        self.input = Signal(range(0, span))
+        self.output = Signal(span)
+        self.outOfRange = Signal()
+
+    @property
+    def fields(self) -> int:
+        """The number of predecoded fields."""
+        return -(-len(self.input) // self.fieldWidth)
+
+    @property
+    def levels(self) -> int:
+        """The number of levels of the tree, including the predecoding."""
+        return 1 + (self.fields - 1).bit_length()
+
+    @property
+    def latency(self) -> int:
+        """The number of clock cycles between an input and its decoded output."""
+        stages = 0 if self.pipelineEvery == 0 else (self.levels - 1) // self.pipelineEvery
+        return stages + (1 if self.registered else 0)
+
+    def ports(self) -> List[Signal]:
+        return [self.input, self.output, self.outOfRange]
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        # -- predecoding, one one-hot vector per field, the lowest bits first
+        vectors = []
+        for start in range(0, len(self.input), self.fieldWidth):
+            field = self.input[start : start + self.fieldWidth]
+            vector = Signal(1 << len(field), name=f"predecoded_l0_{start // self.fieldWidth}")
+            m.d.comb += vector.eq(Cat(field == v for v in range(1 << len(field))))
+            vectors.append(vector)
+        outOfRange = self.input >= self.span if self.span < (1 << len(self.input)) else Const(0)
+
+        # -- AND-plane, outer products of the vectors two by two
+        level = 1
+        while True:
+            if self.pipelineEvery > 0 and level % self.pipelineEvery == 0 and level < self.levels:
+                vectors = [_stage(m, v, f"{v.name}_q") for v in vectors]
+                outOfRange = _stage(m, outOfRange, f"outOfRange_l{level}")
+            if len(vectors) == 1:
+                break
+            level += 1
+            nextVectors = []
+            for i in range(0, len(vectors) - 1, 2):
+                low, high = vectors[i], vectors[i + 1]
+                width = len(low) * len(high)
+                if len(vectors) == 2:
+                    width = min(width, self.span)  # -- the final product, only the lines in the span are needed
+                product = Signal(width, name=f"product_l{level}_{i // 2}")
+                m.d.comb += product.eq(Cat(low & Repl(high[j], len(low)) for j in range(len(high))))
+                nextVectors.append(product)
+            if len(vectors) % 2 == 1:
+                # -- odd one out, goes straight to the next level
+                nextVectors.append(vectors[-1])
+            vectors = nextVectors
+
+        domain = m.d.sync if self.registered else m.d.comb
+        domain += [
+            self.output.eq(vectors[0][0 : self.span]),
+            self.outOfRange.eq(outOfRange),
+        ]
+
+        return m
+
+
+class Encoder(Elaboratable):
+    """Generate a priority encoder of `span` lines, structured as a tree.
+
+    `output` is the index of the lowest asserted line of `input`, and `isEmpty` is asserted when no line is
+    asserted (`output` is then meaningless). A one-hot input is thus encoded into the index of its line.
+
+    Each level of the tree merges two halves : the index of the lower half wins when the lower half has an
+    asserted line. `pipelineEvery` and `registered` work like for `TreeDecoder`.
+    """
+
+    def __init__(self, span: int, pipelineEvery: int = 0, registered: bool = False):
+        if span < 2:
+            raise ValueError("Encoder MUST have a span of at least 2.")
+        if pipelineEvery < 0:
+            raise ValueError("pipelineEvery MUST be positive, or 0 to disable the pipeline.")
+        self.span = span
+        self.pipelineEvery = pipelineEvery
+        self.registered = registered
+        self.input = Signal(span)
+        self.output = Signal(range(0, span))
+        self.isEmpty = Signal()
+
+    @property
+    def levels(self) -> int:
+        """The number of levels of the tree."""
+        return (self.span - 1).bit_length()
+
+    @property
+    def latency(self) -> int:
+        """The number of clock cycles between an input and its encoded output."""
+        stages = 0 if self.pipelineEvery == 0 else (self.levels - 1) // self.pipelineEvery
+        return stages + (1 if self.registered else 0)
+
+    def ports(self) -> List[Signal]:
+        return [self.input, self.output, self.isEmpty]
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        # -- each level is a vector of nodes : is any line asserted, and the index of the lowest asserted line
+        valid, index = self.input, Const(0, 0)
+        level = 0
+        while len(valid) > 1:
+            level += 1
+            width = level - 1  # -- the width of an index at the previous level
+            validNodes = []
+            indexNodes = []
+            for i in range(0, len(valid) - 1, 2):
+                lowIndex, highIndex = index[i * width : (i + 1) * width], index[(i + 1) * width : (i + 2) * width]
+                validNodes.append(valid[i] | valid[i + 1])
+                indexNodes.append(Cat(Mux(valid[i], lowIndex, highIndex), ~valid[i]))
+            if len(valid) % 2 == 1:
+                # -- odd one out, goes straight to the next level as a lower half
+                validNodes.append(valid[-1])
+                indexNodes.append(Cat(index[-width:] if width > 0 else Const(0, 0), Const(0, 1)))
+            nextValid = Signal(len(validNodes), name=f"valid_l{level}")
+            nextIndex = Signal(len(indexNodes) * level, name=f"index_l{level}")
+            m.d.comb += [
+                nextValid.eq(Cat(validNodes)),
+                nextIndex.eq(Cat(indexNodes)),
+            ]
+            valid, index = nextValid, nextIndex
+            if self.pipelineEvery > 0 and level % self.pipelineEvery == 0 and level < self.levels:
+                valid, index = _stage(m, valid, f"valid_l{level}_q"), _stage(m, index, f"index_l{level}_q")
+
+        domain = m.d.sync if self.registered else m.d.comb
+        domain += [
+            self.output.eq(index),
+            self.isEmpty.eq(~valid),
+        ]
+
+        return m
@@ -1,10 +1,13 @@
-from colorlight_i9 import Colorlight_I9_V7_2_Platform
-from blinky import *
-from blinky_gpio import *
-from chaser_gpio import *
-from amaranth import Elaboratable
-from amaranth.build import Platform
-from typing import List
+import argparse
+import os
+from typing import TYPE_CHECKING, List, Optional
+
+# -- amaranth, the platform, the demos and the pool of processes are imported once the command line is parsed, see
+# -- `benchmarks/startup.py`
+if TYPE_CHECKING:
+    from concurrent.futures import Executor, Future
+    from amaranth import Elaboratable
+    from amaranth.build import Platform
 
 def askContinue() -> bool:
     action = input("Continue ? (y/n) :")
@@ -29,18 +32,38 @@ class TestRunner:
     def run(self):
         raise(RuntimeError("NOT IMPLEMENTED"))
 
+    def platformDemos(self) -> List["PlatformDemoTestRunner"]:
+        """All the tests that build a gateware, in the order they are run."""
+        return []
+
 class PlatformDemoTestRunner(TestRunner):
-    def __init__(self, testLabel:str, testDescription:str, platform:Platform, testModule:Elaboratable):
+    def __init__(self, testLabel:str, testDescription:str, platform:"Platform", testModule:"Elaboratable"):
         self._label = testLabel
         self._description = testDescription
         self.platform = platform
         self.module = testModule
+        self.pendingBuild:Optional["Future"] = None
+
+    def platformDemos(self) -> List["PlatformDemoTestRunner"]:
+        return [self]
+
+    def startBuild(self, executor:"Executor", buildDir:str):
+        """Elaborate the module now, and let the executor build the gateware in the background."""
+        plan = self.platform.prepare(self.module)
+        self.pendingBuild = executor.submit(plan.execute_local, buildDir)
+
+    def waitBuild(self):
+        """Wait for the gateware, built now if it was not started in the background ; return the build products."""
+        if self.pendingBuild is None:
+            return self.platform.build(self.module)
+        return self.pendingBuild.result()
 
     def run(self):
         print(f"========================[ START OF {self.label} ]============================")
         if len(self._description) > 0:
             print(self._description)
-        self.platform.build(self.module, do_program = True)
+        products = self.waitBuild()
+        self.platform.toolchain_program(products, "top")
         print(f"-- -- -- -- -- -- -- -- [ END OF {self.label} ] -- -- -- -- -- -- -- --")
 
 class GroupOfTests(TestRunner):
@@ -60,13 +83,47 @@ class GroupOfTests(TestRunner):
                     if askContinue() is False:
                         break
         print(f"-- -- -- -- -- -- -- -- [ END OF GROUP {self.label} ] -- -- -- -- -- -- -- --")
-    
+
+    def platformDemos(self) -> List[PlatformDemoTestRunner]:
+        return [demo for test in self.tests for demo in test.platformDemos()]
+
+def buildAll(demos:List[PlatformDemoTestRunner]) -> bool:
+    """Wait for all the gateware to be built, report each build ; return True when all the builds succeeded."""
+    failures = 0
+    for demo in demos:
+        try:
+            demo.waitBuild()
+            print(f"BUILT  : {demo.label}")
+        except Exception as e:
+            failures += 1
+            print(f"FAILED : {demo.label} -- {e}")
+    print(f"{len(demos) - failures}/{len(demos)} gateware built.")
+    return failures == 0
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and upload a bunch of gateware demonstrating the platform resources")
+    parser.add_argument("--build-only", dest="buildOnly", action="store_true",
+        help="only build all the gateware, without asking anything nor programming the board")
+    parser.add_argument("-j", "--jobs", dest="jobs", metavar="COUNT", type=int, default=os.cpu_count(),
+        help="build at most COUNT gateware at once (default: %(default)s)")
+    parser.add_argument("--pnr-seeds", dest="pnrSeeds", metavar="COUNT", type=int, default=1,
+        help="place and route each gateware with COUNT seeds, and keep the best one (default: %(default)s)")
+    args = parser.parse_args()
+
+    from concurrent.futures import ProcessPoolExecutor
+    from colorlight_i9 import Colorlight_I9_V7_2_Platform
+    from blinky import Blinky
+    from chaser_gpio import ChaserGpio
+
+    def platform() -> Colorlight_I9_V7_2_Platform:
+        # -- the CPUs are shared by the builds running at once, each one runs its seeds on its share
+        return Colorlight_I9_V7_2_Platform(pnr_seeds=args.pnrSeeds, pnr_jobs=max(1, (os.cpu_count() or 1) // args.jobs))
+
     allTheTests = GroupOfTests(
         "Demonstration of platform 'Colorlight I9 v7.2'",
         "Build and upload a bunch of gateware demonstrating the platform resources",
         [
-            PlatformDemoTestRunner("testing onboard LED", "Build and upload a gateware that makes onboard LED(s) blink", Colorlight_I9_V7_2_Platform(), Blinky()),
+            PlatformDemoTestRunner("testing onboard LED", "Build and upload a gateware that makes onboard LED(s) blink", platform(), Blinky()),
             GroupOfTests(
                 "Testing expansion board connectors",
                 "Test connectors p2..p6 of the expansion board needs to connect LEDs to one row of the connector, for each row",
@@ -75,13 +132,13 @@ if __name__ == "__main__":
                         PlatformDemoTestRunner(
                             f"Testing connector 'p'#{conn_index} -- row 1", 
                             f"INSTALL test rig on row 1 of connector {conn_index}", 
-                            Colorlight_I9_V7_2_Platform(), 
+                            platform(), 
                             ChaserGpio("p", conn_index, (5,7,9,11,13,17,23,25,27,29))
                         ),
                         PlatformDemoTestRunner(
                             f"Testing connector 'p'#{conn_index} -- row 1", 
                             f"INSTALL test rig on row 2 of connector {conn_index}", 
-                            Colorlight_I9_V7_2_Platform(), 
+                            platform(), 
                             ChaserGpio("p", conn_index, (6,8,10,12,14,18,24,26,28,30))
                         ),
                     ]
@@ -89,5 +146,17 @@ if __name__ == "__main__":
                 ]
             )
         ]
-    ).run()
+    )
+
+    # all the gateware are built ahead of time, each test waits only for its own gateware
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        demos = allTheTests.platformDemos()
+        for index, demo in enumerate(demos):
+            demo.startBuild(executor, os.path.join("build", f"demo_{index:02}"))
+        if args.buildOnly:
+            if not buildAll(demos):
+                exit(1)
+        else:
+            allTheTests.run()
+            executor.shutdown(cancel_futures=True)
     print("ALL DONE.")
\ No newline at end of file
@@ -0,0 +1,261 @@
+"""
+---
+(c) 2022 David SPORN
+---
+This is part of Sporniket's "Amaranth Stuff" project.
+
+Sporniket's "Amaranth Stuff" project is free software: you can redistribute it and/or
+modify it under the terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your option)
+any later version.
+
+Sporniket's "Amaranth Stuff" project is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+or FITNESS FOR A PARTICULAR PURPOSE.
+
+See the GNU Lesser General Public License for more details.
+You should have received a copy of the GNU Lesser General Public License along with Sporniket's "Amaranth Stuff" project.
+If not, see <https://www.gnu.org/licenses/>.
+---
+"""
+### builtin deps
+from typing import Dict, List, Optional, Tuple, Union
+
+### amaranth -- main deps
+from amaranth import *
+from amaranth.build import Platform
+from amaranth.lib.cdc import ResetSynchronizer
+
+# the limits of the EHXPLLL of the ECP5, in Hertz, see Lattice TN1263 and the 'ecppll' tool of Project Trellis
+PFD_MIN, PFD_MAX = 3.125e6, 400e6
+VCO_MIN, VCO_MAX = 400e6, 800e6
+OUTPUT_MIN, OUTPUT_MAX = 3.125e6, 400e6
+CLKI_DIV_MAX, CLKFB_DIV_MAX, CLKO_DIV_MAX = 128, 80, 128
+
+# the outputs of the EHXPLLL, the first one is the feedback
+PLL_OUTPUTS = ["CLKOP", "CLKOS", "CLKOS2", "CLKOS3"]
+
+
+class PllOutput:
+    """An output of the PLL : its divider, its phase shift, and the achieved frequency and phase."""
+
+    def __init__(self, name: str, port: str, div: int, phaseSteps: int, frequency: float):
+        self.name = name
+        self.port = port
+        self.div = div
+        self.phaseSteps = phaseSteps  # the shift, in eighths of a cycle of the VCO
+        self.frequency = frequency
+
+    @property
+    def cphase(self) -> int:
+        """The coarse phase, in cycles of the VCO ; `div - 1` is no shift."""
+        return self.div - 1 + self.phaseSteps // 8
+
+    @property
+    def fphase(self) -> int:
+        """The fine phase, in eighths of a cycle of the VCO."""
+        return self.phaseSteps % 8
+
+    @property
+    def phase(self) -> float:
+        """The achieved phase shift, in degrees."""
+        return self.phaseSteps * 360 / (8 * self.div)
+
+
+class PllSettings:
+    """The dividers of an EHXPLLL giving the requested clocks from the input clock.
+
+    The first clock is the feedback (CLKOP), without phase shift : its frequency is `inputFrequency * clkfbDiv /
+    clkiDiv`, the VCO runs at this frequency times its divider. The other clocks (at most 3, CLKOS to CLKOS3) divide
+    the VCO, and may be shifted by a phase given in degrees, in steps of 1/8 of a cycle of the VCO.
+
+    Among the dividers giving all the frequencies within `tolerance` (a ratio), the smallest error wins, then the
+    VCO closest to the middle of its range.
+    """
+
+    def __init__(self, inputFrequency: float, clocks: Dict[str, Union[float, Tuple[float, float]]], tolerance: float = 0.01):
+        """Compute the dividers.
+
+        Args:
+            inputFrequency (float): the frequency of the input clock, in Hertz.
+            clocks (Dict[str, Union[float, Tuple[float, float]]]): the frequency in Hertz of each clock, by name,
+                or a tuple (frequency, phase in degrees) ; the first clock is the feedback, it cannot be shifted.
+            tolerance (float, optional): the maximum relative error of each frequency. Defaults to 0.01.
+
+        Raises:
+            ValueError: when the clocks cannot be generated.
+        """
+        if not 0 < len(clocks) <= len(PLL_OUTPUTS):
+            raise ValueError(f"An EHXPLLL MUST generate from 1 to {len(PLL_OUTPUTS)} clocks.")
+        self.inputFrequency = inputFrequency
+        self.requests = []  # tuples (name, frequency, phase)
+        for name, request in clocks.items():
+            frequency, phase = request if isinstance(request, tuple) else (request, 0)
+            if not OUTPUT_MIN <= frequency <= OUTPUT_MAX:
+                raise ValueError(
+                    f"Cannot generate the clock '{name}' of {frequency} Hz ;"
+                    f" the EHXPLLL outputs from {OUTPUT_MIN} Hz to {OUTPUT_MAX} Hz."
+                )
+            self.requests.append((name, frequency, phase % 360))
+        if self.requests[0][2] != 0:
+            raise ValueError(f"The first clock '{self.requests[0][0]}' is the feedback, it cannot be shifted.")
+
+        best = None
+        primaryFrequency = self.requests[0][1]
+        for clkiDiv in range(1, CLKI_DIV_MAX + 1):
+            pfd = inputFrequency / clkiDiv
+            if pfd < PFD_MIN:
+                break
+            if pfd > PFD_MAX:
+                continue
+            for clkfbDiv in range(1, CLKFB_DIV_MAX + 1):
+                primary = pfd * clkfbDiv
+                if abs(primary - primaryFrequency) > tolerance * primaryFrequency:
+                    continue
+                for clkopDiv in range(max(1, int(VCO_MIN // primary)), min(CLKO_DIV_MAX, int(VCO_MAX // primary)) + 1):
+                    vco = primary * clkopDiv
+                    if not VCO_MIN <= vco <= VCO_MAX:
+                        continue
+                    divs = [clkopDiv] + [min(CLKO_DIV_MAX, max(1, round(vco / f))) for _, f, _ in self.requests[1:]]
+                    error = max(abs(vco / div - f) / f for div, (_, f, _) in zip(divs, self.requests))
+                    score = (error, abs(vco - (VCO_MIN + VCO_MAX) / 2))
+                    if error <= tolerance and (best is None or score < best[0]):
+                        best = (score, clkiDiv, clkfbDiv, vco, divs)
+        if best is None:
+            raise ValueError(
+                f"Cannot generate {', '.join(f'{f} Hz' for _, f, _ in self.requests)}"
+                f" from {inputFrequency} Hz within {tolerance * 100} %."
+            )
+
+        _, self.clkiDiv, self.clkfbDiv, self.vcoFrequency, divs = best
+        self.outputs: List[PllOutput] = []
+        for port, div, (name, _, phase) in zip(PLL_OUTPUTS, divs, self.requests):
+            output = PllOutput(name, port, div, round(phase * 8 * div / 360) % (8 * div), self.vcoFrequency / div)
+            if output.cphase > CLKO_DIV_MAX - 1:
+                raise ValueError(f"Cannot shift the clock '{name}' by {phase} degrees, the VCO is too fast.")
+            self.outputs.append(output)
+
+    def output(self, name: str) -> PllOutput:
+        """The output giving the clock of the given name."""
+        return next(output for output in self.outputs if output.name == name)
+
+    def frequencyOf(self, name: str) -> float:
+        """The achieved frequency of the clock of the given name."""
+        return self.output(name).frequency
+
+
+class Ecp5Pll(Elaboratable):
+    """An EHXPLLL configured by `PllSettings` : `clocks` are the generated clocks, by name, `locked` is asserted
+    once they are stable.
+
+    The PLL does not create any clock domain, see `PllClockDomain`.
+    """
+
+    def __init__(self, settings: PllSettings):
+        self.settings = settings
+        self.clkIn = Signal()  # the input clock
+        self.locked = Signal()
+        self.clocks = {output.name: Signal(name=f"pll_{output.name}") for output in settings.outputs}
+
+    def ports(self) -> List[Signal]:
+        return [self.clkIn, self.locked] + list(self.clocks.values())
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+        settings = self.settings
+        feedback = self.clocks[settings.outputs[0].name]
+
+        params = {
+            "a_FREQUENCY_PIN_CLKI": f"{settings.inputFrequency / 1e6:.6f}",
+            "a_ICP_CURRENT": "12",
+            "a_LPF_RESISTOR": "8",
+            "a_MFG_ENABLE_FILTEROPAMP": "1",
+            "a_MFG_GMCREF_SEL": "2",
+            "p_PLLRST_ENA": "DISABLED",
+            "p_INTFB_WAKE": "DISABLED",
+            "p_STDBY_ENABLE": "DISABLED",
+            "p_DPHASE_SOURCE": "DISABLED",
+            "p_OUTDIVIDER_MUXA": "DIVA",
+            "p_OUTDIVIDER_MUXB": "DIVB",
+            "p_OUTDIVIDER_MUXC": "DIVC",
+            "p_OUTDIVIDER_MUXD": "DIVD",
+            "p_CLKI_DIV": settings.clkiDiv,
+            "p_CLKFB_DIV": settings.clkfbDiv,
+            "p_FEEDBK_PATH": "CLKOP",
+            "i_CLKI": self.clkIn,
+            "i_CLKFB": feedback,
+            "i_RST": 0,
+            "i_STDBY": 0,
+            "i_PHASESEL0": 0,
+            "i_PHASESEL1": 0,
+            "i_PHASEDIR": 1,
+            "i_PHASESTEP": 1,
+            "i_PHASELOADREG": 1,
+            "i_PLLWAKESYNC": 0,
+            "o_LOCK": self.locked,
+        }
+        for port in PLL_OUTPUTS:
+            params[f"i_EN{port}"] = 0
+        for output in settings.outputs:
+            params.update({
+                f"a_FREQUENCY_PIN_{output.port}": f"{output.frequency / 1e6:.6f}",
+                f"p_{output.port}_ENABLE": "ENABLED",
+                f"p_{output.port}_DIV": output.div,
+                f"p_{output.port}_CPHASE": output.cphase,
+                f"p_{output.port}_FPHASE": output.fphase,
+                f"o_{output.port}": self.clocks[output.name],
+            })
+        m.submodules.pll = Instance("EHXPLLL", **params)
+
+        return m
+
+
+class PllClockDomain(Elaboratable):
+    """The clock domain `name` driven by the clock of the same name of a PLL, held in reset until the PLL is locked.
+
+    The reset is released synchronously to the clock of the domain. When `clkIn` is given, the PLL itself is a
+    submodule of this domain, fed by `clkIn` ; it MUST be so for exactly one of the domains of a PLL.
+    """
+
+    def __init__(self, pll: Ecp5Pll, name: str, clkIn: Optional[Signal] = None):
+        self.pll = pll
+        self.name = name
+        self.clkIn = clkIn
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        if self.clkIn is not None:
+            m.submodules.pll = self.pll
+            m.d.comb += self.pll.clkIn.eq(self.clkIn)
+        m.domains += ClockDomain(self.name)
+        m.d.comb += ClockSignal(self.name).eq(self.pll.clocks[self.name])
+        m.submodules.reset_sync = ResetSynchronizer(~self.pll.locked, domain=self.name)
+
+        return m
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compute the dividers of an EHXPLLL, like the 'ecppll' tool")
+    parser.add_argument("clocks", metavar="FREQUENCY[:PHASE]", nargs="+",
+        help="the frequencies of the clocks to generate, in Hertz (e.g. 100e6), optionally shifted by PHASE degrees ; the first one cannot be shifted")
+    parser.add_argument("-i", "--input", dest="inputFrequency", metavar="FREQUENCY", type=float, default=25e6,
+        help="the frequency of the input clock, in Hertz (default: %(default)s)")
+    parser.add_argument("--tolerance", dest="tolerance", metavar="RATIO", type=float, default=0.01,
+        help="the maximum relative error of each frequency (default: %(default)s)")
+    args = parser.parse_args()
+
+    clocks = {}
+    for index, request in enumerate(args.clocks):
+        frequency, _, phase = request.partition(":")
+        clocks[f"clk{index}"] = (float(frequency), float(phase or 0))
+    try:
+        settings = PllSettings(args.inputFrequency, clocks, args.tolerance)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"CLKI_DIV {settings.clkiDiv}, CLKFB_DIV {settings.clkfbDiv}, VCO {settings.vcoFrequency / 1e6:.3f} MHz")
+    for output in settings.outputs:
+        print(f"{output.port:<6} DIV {output.div:>3}, CPHASE {output.cphase:>3}, FPHASE {output.fphase}"
+            f" : {output.frequency / 1e6:.3f} MHz, {output.phase:.1f} degrees")
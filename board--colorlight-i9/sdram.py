@@ -0,0 +1,719 @@
+"""
+---
+(c) 2022 David SPORN
+---
+This is part of Sporniket's "Amaranth Stuff" project.
+
+Sporniket's "Amaranth Stuff" project is free software: you can redistribute it and/or
+modify it under the terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your option)
+any later version.
+
+Sporniket's "Amaranth Stuff" project is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+or FITNESS FOR A PARTICULAR PURPOSE.
+
+See the GNU Lesser General Public License for more details.
+You should have received a copy of the GNU Lesser General Public License along with Sporniket's "Amaranth Stuff" project.
+If not, see <https://www.gnu.org/licenses/>.
+---
+"""
+### builtin deps
+import math
+from typing import Dict, List, Optional, Tuple  # , Union
+
+### amaranth -- main deps
+from amaranth import *
+from amaranth.build import Platform
+
+# the codes of the burst length in the mode register
+BURST_LENGTH_CODES = {1: 0, 2: 1, 4: 2, 8: 3}
+
+
+class SdramTimings:
+    """The timings of a SDR SDRAM chip, in nanoseconds unless told otherwise."""
+
+    def __init__(self, tRP: float, tRCD: float, tRC: float, tRAS: float, tRRD: float, tWR: float, tRFC: float,
+            tREFI: float, tInit: float = 200000, tMRD: int = 2):
+        """Set up the timings.
+
+        Args:
+            tRP (float): PRECHARGE to ACTIVATE of the same bank.
+            tRCD (float): ACTIVATE to READ or WRITE.
+            tRC (float): ACTIVATE to ACTIVATE of the same bank.
+            tRAS (float): ACTIVATE to PRECHARGE.
+            tRRD (float): ACTIVATE to ACTIVATE of another bank.
+            tWR (float): the last data of a WRITE to PRECHARGE.
+            tRFC (float): REFRESH to any command.
+            tREFI (float): the average interval between two REFRESH.
+            tInit (float, optional): the wait after power up, before the first command. Defaults to 200000 (200 us).
+            tMRD (int, optional): LOAD MODE REGISTER to any command, in clock cycles. Defaults to 2.
+        """
+        self.tRP = tRP
+        self.tRCD = tRCD
+        self.tRC = tRC
+        self.tRAS = tRAS
+        self.tRRD = tRRD
+        self.tWR = tWR
+        self.tRFC = tRFC
+        self.tREFI = tREFI
+        self.tInit = tInit
+        self.tMRD = tMRD
+
+    def cycles(self, clockFrequency: float) -> Dict[str, int]:
+        """The timings in clock cycles, at least 1 ; tREFI is rounded down, the other ones up."""
+        period = 1e9 / clockFrequency
+        result = {
+            name: max(1, math.ceil(getattr(self, name) / period - 1e-9))
+            for name in ["tRP", "tRCD", "tRC", "tRAS", "tRRD", "tWR", "tRFC", "tInit"]
+        }
+        result["tREFI"] = int(self.tREFI / period)
+        result["tMRD"] = self.tMRD
+        return result
+
+
+# the SDRAM of the Colorlight i9 v7.2 (M12L64322A, 4 banks x 2048 rows x 256 columns x 32 bits), speed grade -6
+M12L64322A = SdramTimings(tRP=18, tRCD=18, tRC=60, tRAS=42, tRRD=12, tWR=15, tRFC=60, tREFI=64e6 / 4096)
+
+
+class SdramController(Elaboratable):
+    """A controller of SDR SDRAM, with a stream of burst requests and a stream of read data.
+
+    * A request is taken when `requestValid` and `requestReady` are both asserted : `requestWrite` tells a write
+      from a read, `requestAddress` is the address of the burst of `burstLength` words, the lowest bits select the
+      column, then the bank, then the row. Consecutive bursts thus fill a row of each bank in turn.
+    * The data of a write burst is taken one word per cycle, when `writeDataReady` is asserted : `writeData` MUST
+      be valid then.
+    * The data of a read burst is output one word per cycle, when `readDataValid` is asserted, in the order of
+      the requests ; there is no backpressure.
+
+    The rows are left open (open page policy). While the burst of the oldest request is waiting for its bank, or
+    is being transferred, the bank of the next request is precharged and activated if required : the bursts to
+    different banks follow each other without a gap on the data bus. The refresh is scheduled every tREFI, the
+    pending bursts are delayed meanwhile. `isReady` is asserted once the initialization of the SDRAM is done.
+
+    The commands, the address and the data to write are registered, so is the read data ; `pins` is the `sdram`
+    resource of the platform, None to connect the signals of the controller in a simulation.
+    """
+
+    def __init__(self, pins=None, dataWidth: int = 32, bankBits: int = 2, rowBits: int = 11, columnBits: int = 8,
+            burstLength: int = 8, casLatency: int = 2, timings: SdramTimings = M12L64322A):
+        """Set up the controller, by default for the SDRAM of the Colorlight i9.
+
+        Args:
+            pins (Record, optional): the `sdram` resource of the platform. Defaults to None.
+            dataWidth (int, optional): the width of the data bus. Defaults to 32.
+            bankBits (int, optional): the width of the bank address. Defaults to 2.
+            rowBits (int, optional): the width of the row address. Defaults to 11.
+            columnBits (int, optional): the width of the column address, at most 10. Defaults to 8.
+            burstLength (int, optional): the words per burst, 1, 2, 4 or 8. Defaults to 8.
+            casLatency (int, optional): the CAS latency, 2 or 3. Defaults to 2.
+            timings (SdramTimings, optional): the timings of the chip. Defaults to M12L64322A.
+        """
+        if burstLength not in BURST_LENGTH_CODES:
+            raise ValueError(f"SdramController MUST have a burst length among {', '.join(map(str, BURST_LENGTH_CODES))}.")
+        if casLatency not in (2, 3):
+            raise ValueError("SdramController MUST have a CAS latency of 2 or 3.")
+        if not max(1, (burstLength - 1).bit_length()) <= columnBits <= 10:
+            raise ValueError("SdramController MUST have from 1 to 10 column bits, enough for a burst.")
+        if rowBits < 11:
+            raise ValueError("SdramController MUST have at least 11 row bits, A10 selects all the banks to precharge.")
+        self.pins = pins
+        self.dataWidth = dataWidth
+        self.bankBits = bankBits
+        self.rowBits = rowBits
+        self.columnBits = columnBits
+        self.burstLength = burstLength
+        self.casLatency = casLatency
+        self.timings = timings
+        self.burstBits = columnBits - (burstLength - 1).bit_length()  # the column bits of the address of a burst
+
+        # requests
+        self.requestValid = Signal()
+        self.requestReady = Signal()
+        self.requestWrite = Signal()
+        self.requestAddress = Signal(self.burstBits + bankBits + rowBits)
+        # data
+        self.writeData = Signal(dataWidth)
+        self.writeDataReady = Signal()
+        self.readData = Signal(dataWidth)
+        self.readDataValid = Signal()
+        self.isReady = Signal()
+
+        # the SDRAM side, the commands are active high
+        self.ras = Signal()
+        self.cas = Signal()
+        self.we = Signal()
+        self.ba = Signal(bankBits)
+        self.a = Signal(rowBits)
+        self.dqOut = Signal(dataWidth)
+        self.dqOe = Signal()
+        self.dqIn = Signal(dataWidth)
+
+    @property
+    def banks(self) -> int:
+        return 1 << self.bankBits
+
+    @property
+    def modeRegister(self) -> int:
+        """Sequential bursts of `burstLength` words for reads and writes, `casLatency`."""
+        return BURST_LENGTH_CODES[self.burstLength] | (self.casLatency << 4)
+
+    def ports(self) -> List[Signal]:
+        return [
+            # inputs
+            self.requestValid, self.requestWrite, self.requestAddress, self.writeData, self.dqIn,
+
+            #outputs
+            self.requestReady, self.writeDataReady, self.readData, self.readDataValid, self.isReady,
+            self.ras, self.cas, self.we, self.ba, self.a, self.dqOut, self.dqOe,
+        ]
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+        t = self.timings.cycles(platform.default_clk_frequency)
+        burstLength = self.burstLength
+        burstShift = (burstLength - 1).bit_length()
+
+        if self.pins is not None:
+            # -- the SDRAM samples on the falling edge of the clock, half a cycle after the commands are launched
+            m.d.comb += [
+                self.pins.clk.o.eq(~ClockSignal("sync")),
+                self.pins.ras.o.eq(self.ras),
+                self.pins.cas.o.eq(self.cas),
+                self.pins.we.o.eq(self.we),
+                self.pins.ba.o.eq(self.ba),
+                self.pins.a.o.eq(self.a),
+                self.pins.dq.o.eq(self.dqOut),
+                self.pins.dq.oe.eq(self.dqOe),
+                self.dqIn.eq(self.pins.dq.i),
+            ]
+
+        # -- the timers count down the cycles before a command is allowed
+        timers = []
+
+        def timer(name: str, maximum: int) -> Signal:
+            result = Signal(range(maximum + 1), name=name)
+            timers.append(result)
+            return result
+
+        def load(value: Signal, cycles: int):
+            """Allow the next command `cycles + 1` cycles from now, unless it is already later."""
+            if cycles > 0:
+                m.d.sync += value.eq(Mux(value > cycles, value - 1, cycles))
+
+        longest = max(t["tRC"], t["tRFC"], t["tRP"]) - 1
+        isOpen = [Signal(name=f"isOpen_{b}") for b in range(self.banks)]
+        openRow = [Signal(self.rowBits, name=f"openRow_{b}") for b in range(self.banks)]
+        actTimer = [timer(f"actTimer_{b}", longest) for b in range(self.banks)]  # until ACTIVATE
+        rwTimer = [timer(f"rwTimer_{b}", t["tRCD"] - 1) for b in range(self.banks)]  # until READ or WRITE
+        preTimer = [timer(f"preTimer_{b}", max(t["tRAS"], burstLength + t["tWR"]) - 1) for b in range(self.banks)]  # until PRECHARGE
+        rrdTimer = timer("rrdTimer", t["tRRD"] - 1)  # until ACTIVATE of any bank
+        columnTimer = timer("columnTimer", burstLength - 1)  # until the next burst
+        turnTimer = timer("turnTimer", self.casLatency + burstLength)  # until a write, after the data of a read
+        initTimer = timer("initTimer", max(t["tInit"], t["tRFC"], t["tMRD"]) - 1)
+        for value in timers:
+            with m.If(value != 0):
+                m.d.sync += value.eq(value - 1)
+
+        # -- the commands, NOP unless told otherwise
+        m.d.sync += [self.ras.eq(0), self.cas.eq(0), self.we.eq(0)]
+
+        def command(ras: int, cas: int, we: int, ba: Value = 0, a: Value = 0):
+            m.d.sync += [self.ras.eq(ras), self.cas.eq(cas), self.we.eq(we), self.ba.eq(ba), self.a.eq(a)]
+
+        def activate(bank: Value, row: Value):
+            command(1, 0, 0, bank, row)
+            for b in range(self.banks):
+                with m.If(bank == b):
+                    m.d.sync += [isOpen[b].eq(1), openRow[b].eq(row)]
+                    load(actTimer[b], t["tRC"] - 1)
+                    load(rwTimer[b], t["tRCD"] - 1)
+                    load(preTimer[b], t["tRAS"] - 1)
+            load(rrdTimer, t["tRRD"] - 1)
+
+        def precharge(bank: Optional[Value]):
+            command(1, 0, 1, 0 if bank is None else bank, Const(1 << 10, self.rowBits) if bank is None else 0)
+            for b in range(self.banks):
+                with m.If(Const(1) if bank is None else (bank == b)):
+                    m.d.sync += isOpen[b].eq(0)
+                    load(actTimer[b], t["tRP"] - 1)
+
+        def refresh():
+            command(1, 1, 0)
+            for b in range(self.banks):
+                load(actTimer[b], t["tRFC"] - 1)
+
+        # -- the queue of requests : the oldest one (0) waits for its burst, the next one (1) prepares its bank
+        slots = []
+        for index in range(2):
+            slot = Record([
+                ("valid", 1), ("write", 1),
+                ("column", self.burstBits), ("bank", self.bankBits), ("row", self.rowBits),
+            ], name=f"slot_{index}")
+            slots.append(slot)
+        incoming = Record.like(slots[0], name="incoming")
+        m.d.comb += [
+            incoming.valid.eq(1),
+            incoming.write.eq(self.requestWrite),
+            Cat(incoming.column, incoming.bank, incoming.row).eq(self.requestAddress),
+            self.requestReady.eq(~slots[1].valid),
+        ]
+        push = Signal()
+        pop = Signal()
+        m.d.comb += push.eq(self.requestValid & self.requestReady)
+        with m.If(pop):
+            with m.If(slots[1].valid):
+                m.d.sync += [slots[0].eq(slots[1]), slots[1].valid.eq(0)]
+            with m.Elif(push):
+                m.d.sync += slots[0].eq(incoming)
+            with m.Else():
+                m.d.sync += slots[0].valid.eq(0)
+        with m.Elif(push):
+            with m.If(slots[0].valid):
+                m.d.sync += slots[1].eq(incoming)
+            with m.Else():
+                m.d.sync += slots[0].eq(incoming)
+
+        isOpenOf = Array(isOpen)
+        openRowOf = Array(openRow)
+        actTimerOf = Array(actTimer)
+        rwTimerOf = Array(rwTimer)
+        preTimerOf = Array(preTimer)
+
+        # -- what can be done for each request
+        canPrecharge = []
+        canActivate = []
+        for slot in slots:
+            precharging = Signal(name=f"{slot.name}_canPrecharge")
+            activating = Signal(name=f"{slot.name}_canActivate")
+            m.d.comb += [
+                precharging.eq(slot.valid & isOpenOf[slot.bank] & (openRowOf[slot.bank] != slot.row) & (preTimerOf[slot.bank] == 0)),
+                activating.eq(slot.valid & ~isOpenOf[slot.bank] & (actTimerOf[slot.bank] == 0) & (rrdTimer == 0)),
+            ]
+            canPrecharge.append(precharging)
+            canActivate.append(activating)
+        head = slots[0]
+        canBurst = Signal()
+        m.d.comb += canBurst.eq(
+            head.valid & isOpenOf[head.bank] & (openRowOf[head.bank] == head.row) & (rwTimerOf[head.bank] == 0)
+            & (columnTimer == 0) & (~head.write | (turnTimer == 0))
+        )
+        isNextBank = Signal()
+        m.d.comb += isNextBank.eq(slots[1].bank != head.bank)
+
+        # -- refresh
+        refreshTimer = Signal(range(max(t["tREFI"], 1)), reset=max(t["tREFI"] - 1, 0))
+        refreshPending = Signal()
+        allClosed = Signal()
+        allPrechargeable = Signal()
+        allActivable = Signal()
+        m.d.comb += [
+            allClosed.eq(~Cat(isOpen).any()),
+            allPrechargeable.eq(Cat(value == 0 for value in preTimer).all()),
+            allActivable.eq(Cat(value == 0 for value in actTimer).all()),
+        ]
+
+        # -- the data of the bursts
+        writeBeats = Signal(range(burstLength))
+        readPending = Signal(self.casLatency + 2)  # the READ command, then its latency up to the registered data
+        readBeats = Signal(range(burstLength))
+        issueWrite = Signal()
+        issueRead = Signal()
+        m.d.comb += self.writeDataReady.eq(issueWrite | (writeBeats != 0))
+        dqInRegistered = Signal(self.dataWidth)
+        m.d.sync += dqInRegistered.eq(self.dqIn)
+        m.d.comb += self.readData.eq(dqInRegistered)
+        m.d.sync += [
+            self.dqOut.eq(self.writeData),
+            self.dqOe.eq(self.writeDataReady),
+            readPending.eq(Cat(issueRead, readPending[:-1])),
+        ]
+        with m.If(issueWrite):
+            m.d.sync += writeBeats.eq(burstLength - 1)
+        with m.Elif(writeBeats != 0):
+            m.d.sync += writeBeats.eq(writeBeats - 1)
+        with m.If(readPending[-1]):
+            m.d.comb += self.readDataValid.eq(1)
+            m.d.sync += readBeats.eq(burstLength - 1)
+        with m.Elif(readBeats != 0):
+            m.d.comb += self.readDataValid.eq(1)
+            m.d.sync += readBeats.eq(readBeats - 1)
+
+        # -- the sequence of commands
+        with m.FSM():
+            with m.State("INIT"):
+                m.d.sync += initTimer.eq(t["tInit"] - 1)
+                m.next = "INIT_WAIT"
+            with m.State("INIT_WAIT"):
+                with m.If(initTimer == 0):
+                    precharge(None)
+                    load(initTimer, t["tRP"] - 1)
+                    m.next = "INIT_REFRESH_0"
+            for index in range(2):
+                with m.State(f"INIT_REFRESH_{index}"):
+                    with m.If(initTimer == 0):
+                        refresh()
+                        load(initTimer, t["tRFC"] - 1)
+                        m.next = f"INIT_REFRESH_{index + 1}" if index == 0 else "INIT_MODE"
+            with m.State("INIT_MODE"):
+                with m.If(initTimer == 0):
+                    command(1, 1, 1, 0, self.modeRegister)
+                    load(initTimer, t["tMRD"] - 1)
+                    m.next = "INIT_DONE"
+            with m.State("INIT_DONE"):
+                with m.If(initTimer == 0):
+                    m.next = "READY"
+            with m.State("READY"):
+                m.d.comb += self.isReady.eq(1)
+                with m.If(refreshTimer == 0):
+                    m.d.sync += [refreshTimer.eq(refreshTimer.reset), refreshPending.eq(1)]
+                with m.Else():
+                    m.d.sync += refreshTimer.eq(refreshTimer - 1)
+
+                with m.If(refreshPending):
+                    with m.If(~allClosed):
+                        with m.If(allPrechargeable):
+                            precharge(None)
+                    with m.Elif(allActivable):
+                        refresh()
+                        m.d.sync += refreshPending.eq(0)
+                with m.Elif(canBurst):
+                    m.d.comb += pop.eq(1)
+                    with m.If(head.write):
+                        m.d.comb += issueWrite.eq(1)
+                        command(0, 1, 1, head.bank, Cat(Const(0, burstShift), head.column))
+                        for b in range(self.banks):
+                            with m.If(head.bank == b):
+                                load(preTimer[b], burstLength + t["tWR"] - 1)
+                    with m.Else():
+                        m.d.comb += issueRead.eq(1)
+                        command(0, 1, 0, head.bank, Cat(Const(0, burstShift), head.column))
+                        for b in range(self.banks):
+                            with m.If(head.bank == b):
+                                load(preTimer[b], burstLength - 1)
+                        load(turnTimer, self.casLatency + burstLength)
+                    load(columnTimer, burstLength - 1)
+                with m.Elif(canPrecharge[0]):
+                    precharge(head.bank)
+                with m.Elif(canActivate[0]):
+                    activate(head.bank, head.row)
+                with m.Elif(canPrecharge[1] & isNextBank):
+                    precharge(slots[1].bank)
+                with m.Elif(canActivate[1] & isNextBank):
+                    activate(slots[1].bank, slots[1].row)
+
+        return m
+
+
+### simulation side ###
+
+class SdramModel:
+    """A cycle accurate behavioural model of a SDR SDRAM, connected to the signals of a `SdramController`.
+
+    The model executes the command of each cycle, checks the timings and the protocol, and drives the read data on
+    `dqIn`, `casLatency` cycles after the READ. The violations are collected into `violations`.
+    """
+
+    def __init__(self, controller: SdramController, clockFrequency: float):
+        self.controller = controller
+        self.t = controller.timings.cycles(clockFrequency)
+        self.memory: Dict[Tuple[int, int, int], int] = {}
+        self.violations: List[str] = []
+        self.refreshes: List[int] = []  # the cycles of the REFRESH commands
+        self.commands: Dict[str, int] = {}  # the number of each command
+
+    def violation(self, cycle: int, message: str):
+        self.violations.append(f"cycle {cycle} : {message}")
+
+    def process(self):
+        """The simulation process, to add with `add_process()`."""
+        from amaranth.sim import Settle, Tick
+
+        c = self.controller
+        t = self.t
+        never = -(1 << 40)
+        banks = c.banks
+        activeRow: List[Optional[int]] = [None] * banks
+        lastActivate = [never] * banks
+        lastPrecharge = [never] * banks
+        lastRead = [never] * banks
+        lastWriteData = [never] * banks
+        lastActivateAny = never
+        lastColumn = never
+        lastRefresh = never
+        refreshes = 0
+        modeSet = False
+        readData: Dict[int, int] = {}  # by cycle
+        writeData: Dict[int, Tuple[int, int, int]] = {}  # the cell of the data to write, by cycle
+        cycle = 0
+        while True:
+            yield Settle()
+            ras, cas, we = (yield c.ras), (yield c.cas), (yield c.we)
+            bank, address = (yield c.ba), (yield c.a)
+            dqOe, dqOut = (yield c.dqOe), (yield c.dqOut)
+
+            name = {(0, 0, 0): "NOP", (1, 0, 0): "ACTIVATE", (0, 1, 0): "READ", (0, 1, 1): "WRITE",
+                (1, 0, 1): "PRECHARGE", (1, 1, 0): "REFRESH", (1, 1, 1): "MODE", (0, 0, 1): "TERMINATE"}[(ras, cas, we)]
+            self.commands[name] = self.commands.get(name, 0) + 1
+            if name != "NOP" and cycle < t["tInit"]:
+                self.violation(cycle, f"{name} during the initial wait")
+            if name == "ACTIVATE":
+                if not modeSet:
+                    self.violation(cycle, "ACTIVATE before the mode register is set")
+                if activeRow[bank] is not None:
+                    self.violation(cycle, f"ACTIVATE of the active bank {bank}")
+                if cycle - lastPrecharge[bank] < t["tRP"]:
+                    self.violation(cycle, f"tRP not met on bank {bank}")
+                if cycle - lastActivate[bank] < t["tRC"]:
+                    self.violation(cycle, f"tRC not met on bank {bank}")
+                if cycle - lastActivateAny < t["tRRD"]:
+                    self.violation(cycle, "tRRD not met")
+                if cycle - lastRefresh < t["tRFC"]:
+                    self.violation(cycle, "tRFC not met")
+                activeRow[bank] = address
+                lastActivate[bank] = lastActivateAny = cycle
+            elif name in ("READ", "WRITE"):
+                column = address & ((1 << c.columnBits) - 1)
+                if activeRow[bank] is None:
+                    self.violation(cycle, f"{name} on the idle bank {bank}")
+                if cycle - lastActivate[bank] < t["tRCD"]:
+                    self.violation(cycle, f"tRCD not met on bank {bank}")
+                if cycle - lastColumn < c.burstLength:
+                    self.violation(cycle, f"{name} interrupts the previous burst")
+                if address & (1 << 10):
+                    self.violation(cycle, f"{name} with auto precharge")
+                if column % c.burstLength != 0:
+                    self.violation(cycle, f"{name} of a burst not aligned")
+                row = activeRow[bank] if activeRow[bank] is not None else 0
+                for beat in range(c.burstLength):
+                    if name == "READ":
+                        readData[cycle + c.casLatency + beat] = self.memory.get((bank, row, column + beat), 0)
+                    else:
+                        writeData[cycle + beat] = (bank, row, column + beat)
+                if name == "READ":
+                    lastRead[bank] = cycle
+                else:
+                    lastWriteData[bank] = cycle + c.burstLength - 1
+                lastColumn = cycle
+            elif name == "PRECHARGE":
+                for b in range(banks) if address & (1 << 10) else [bank]:
+                    if activeRow[b] is None:
+                        continue
+                    if cycle - lastActivate[b] < t["tRAS"]:
+                        self.violation(cycle, f"tRAS not met on bank {b}")
+                    if cycle - lastWriteData[b] < t["tWR"]:
+                        self.violation(cycle, f"tWR not met on bank {b}")
+                    if cycle - lastRead[b] < max(1, c.burstLength - c.casLatency):
+                        self.violation(cycle, f"PRECHARGE truncates the read burst of bank {b}")
+                    activeRow[b] = None
+                    lastPrecharge[b] = cycle
+            elif name == "REFRESH":
+                if any(row is not None for row in activeRow):
+                    self.violation(cycle, "REFRESH while a bank is active")
+                if cycle - max(lastPrecharge) < t["tRP"]:
+                    self.violation(cycle, "tRP not met before REFRESH")
+                if cycle - lastRefresh < t["tRFC"]:
+                    self.violation(cycle, "tRFC not met")
+                if modeSet and cycle - lastRefresh > 9 * t["tREFI"]:
+                    self.violation(cycle, "more than 8 refreshes postponed")
+                lastRefresh = cycle
+                refreshes += 1
+                self.refreshes.append(cycle)
+            elif name == "MODE":
+                if any(row is not None for row in activeRow):
+                    self.violation(cycle, "MODE while a bank is active")
+                if refreshes < 2:
+                    self.violation(cycle, "MODE before the 2 initial refreshes")
+                if address != c.modeRegister:
+                    self.violation(cycle, f"unexpected mode {address:#x}")
+                modeSet = True
+            elif name == "TERMINATE":
+                self.violation(cycle, "BURST TERMINATE is not expected")
+
+            # -- the data bus
+            if cycle in writeData:
+                if not dqOe:
+                    self.violation(cycle, "the data to write is not driven")
+                self.memory[writeData.pop(cycle)] = dqOut
+            if cycle in readData:
+                if dqOe:
+                    self.violation(cycle, "the controller drives the data bus during a read")
+                yield c.dqIn.eq(readData.pop(cycle))
+
+            yield Tick("sync")
+            cycle += 1
+
+
+class SdramTraffic:
+    """Drive a `SdramController` with a list of requests, check the read data, and measure the traffic.
+
+    A request is a tuple (write, address) ; the data of a write burst is drawn at random, the data of a read burst
+    is expected to be the last data written at its address (0 if never written). The requests are presented back
+    to back, or `gap` cycles after the previous one is taken, to measure the latency of a lone request.
+    """
+
+    def __init__(self, controller: SdramController, requests: List[Tuple[bool, int]], seed: int = 0, gap: int = 0):
+        import random
+
+        self.controller = controller
+        self.requests = requests
+        self.gap = gap
+        self.random = random.Random(seed)
+        self.mismatches: List[str] = []
+        self.accepted: List[int] = []  # the cycle each request is taken
+        self.firstData: Dict[int, int] = {}  # the cycle of the first word of each burst, by request
+        self.lastData = 0  # the cycle of the last word transferred
+        self.readyCycle: Optional[int] = None
+        self.done = False
+
+    def process(self):
+        """The simulation process, to add with `add_process()`."""
+        from amaranth.sim import Settle, Tick
+
+        c = self.controller
+        memory: Dict[int, int] = {}  # by address of word
+        toWrite: List[Tuple[int, int]] = []  # (request, word) of the accepted writes, in order
+        toRead: List[Tuple[int, int, int]] = []  # (request, word address, expected word) of the accepted reads
+        writeBeat = 0
+        readBeat = 0
+        nextRequest = 0
+        nextCycle = 0  # the earliest cycle of the next request
+        cycle = 0
+        mask = (1 << c.dataWidth) - 1
+        while not self.done:
+            # -- the requests wait for the initialization, for their latency to be the one of the traffic
+            yield Settle()
+            if self.readyCycle is None and (yield c.isReady):
+                self.readyCycle = cycle
+            presenting = self.readyCycle is not None and nextRequest < len(self.requests) and cycle >= nextCycle
+            if presenting:
+                write, address = self.requests[nextRequest]
+                yield c.requestValid.eq(1)
+                yield c.requestWrite.eq(int(write))
+                yield c.requestAddress.eq(address)
+            else:
+                yield c.requestValid.eq(0)
+            if toWrite:
+                yield c.writeData.eq(toWrite[0][1])
+            yield Settle()
+            if presenting and (yield c.requestReady):
+                self.accepted.append(cycle)
+                nextCycle = cycle + 1 + self.gap
+                for beat in range(c.burstLength):
+                    word = address * c.burstLength + beat
+                    if write:
+                        memory[word] = self.random.getrandbits(c.dataWidth) & mask
+                        toWrite.append((nextRequest, memory[word]))
+                    else:
+                        toRead.append((nextRequest, word, memory.get(word, 0)))
+                nextRequest += 1
+            if (yield c.writeDataReady):
+                if not toWrite:
+                    self.mismatches.append(f"cycle {cycle} : write data requested without any write")
+                else:
+                    request, _ = toWrite.pop(0)
+                    if writeBeat == 0:
+                        self.firstData[request] = cycle
+                    writeBeat = (writeBeat + 1) % c.burstLength
+                    self.lastData = cycle
+            if (yield c.readDataValid):
+                if not toRead:
+                    self.mismatches.append(f"cycle {cycle} : read data without any read")
+                else:
+                    request, word, expected = toRead.pop(0)
+                    actual = yield c.readData
+                    if readBeat == 0:
+                        self.firstData[request] = cycle
+                    readBeat = (readBeat + 1) % c.burstLength
+                    self.lastData = cycle
+                    if actual != expected:
+                        self.mismatches.append(f"cycle {cycle} : word {word:#x} read {actual:#x}, expected {expected:#x}")
+            self.done = nextRequest == len(self.requests) and not toWrite and not toRead
+            yield Tick("sync")
+            cycle += 1
+
+    def latencies(self, write: bool) -> List[int]:
+        """The cycles from the request to its first word, for the requests of the given kind."""
+        return [
+            self.firstData[index] - self.accepted[index]
+            for index, (isWrite, _) in enumerate(self.requests)
+            if isWrite == write and index in self.firstData
+        ]
+
+    def bandwidth(self) -> float:
+        """The words transferred per cycle, from the first request taken to the last word."""
+        start = self.accepted[0] if self.accepted else 0
+        words = len(self.firstData) * self.controller.burstLength
+        return words / max(1, self.lastData - start + 1)
+
+
+def simulateTraffic(controller: SdramController, requests: List[Tuple[bool, int]], platform: Platform,
+        seed: int = 0, gap: int = 0, maxCycles: int = 1000000, vcdFile: Optional[str] = None) -> Tuple[SdramTraffic, SdramModel]:
+    """Simulate the controller with its SDRAM model, until all the requests are done (or `maxCycles`)."""
+    from amaranth.hdl.ir import Fragment
+    from amaranth.sim import Simulator
+
+    model = SdramModel(controller, platform.default_clk_frequency)
+    traffic = SdramTraffic(controller, requests, seed, gap)
+    sim = Simulator(Fragment.get(controller, platform))
+    period = 1 / platform.default_clk_frequency
+    sim.add_clock(period, domain="sync")
+    sim.add_process(model.process)
+    sim.add_process(traffic.process)
+
+    def run():
+        cycles = 0
+        while not traffic.done and cycles < maxCycles:
+            sim.run_until((cycles + 1000) * period, run_passive=True)
+            cycles += 1000
+
+    if vcdFile is None:
+        run()
+    else:
+        with sim.write_vcd(vcdFile, traces=controller.ports()):
+            run()
+    if not traffic.done:
+        traffic.mismatches.append(f"the requests are not done after {maxCycles} cycles")
+    return traffic, model
+
+
+### Test suite ###
+if __name__ == "__main__":
+    import argparse
+    import random
+    from colorlight_i9 import Colorlight_I9_V7_2_Platform
+
+    parser = argparse.ArgumentParser(description="Check the SDRAM controller against the SDRAM model, with random traffic")
+    parser.add_argument("-n", "--requests", dest="requests", metavar="COUNT", type=int, default=400,
+        help="the number of requests (default: %(default)s)")
+    parser.add_argument("--seed", dest="seed", metavar="SEED", type=int, default=0,
+        help="the seed of the random traffic (default: %(default)s)")
+    parser.add_argument("-v", "--vcd-file", dest="vcdFile", metavar="VCD-FILE",
+        help="write the signals of the controller to VCD-FILE")
+    args = parser.parse_args()
+
+    failed = False
+    for frequency, burstLength, casLatency in [(25e6, 8, 2), (100e6, 8, 2), (100e6, 4, 3), (100e6, 1, 2)]:
+        platform = Colorlight_I9_V7_2_Platform(build_cache_dir=None, clocks={"sync": frequency})
+        controller = SdramController(burstLength=burstLength, casLatency=casLatency)
+        rng = random.Random(args.seed)
+        # -- a few rows of each bank, for row hits, row misses and bank conflicts
+        addresses = [
+            rng.randrange(1 << controller.burstBits) | (rng.randrange(controller.banks) << controller.burstBits)
+            | (rng.randrange(3) << (controller.burstBits + controller.bankBits))
+            for _ in range(args.requests)
+        ]
+        requests = [(rng.random() < 0.5, address) for address in addresses]
+        traffic, model = simulateTraffic(controller, requests, platform, args.seed, vcdFile=args.vcdFile)
+        problems = model.violations + traffic.mismatches
+        label = f"{frequency / 1e6:.0f} MHz, burst {burstLength}, CAS latency {casLatency}"
+        if problems:
+            failed = True
+            print(f"FAIL : {label}, {len(model.refreshes)} refreshes")
+            for problem in problems[:10]:
+                print(f"    {problem}")
+        else:
+            print(f"PASS : {label}, {len(requests)} requests, {len(model.refreshes)} refreshes,"
+                f" {traffic.bandwidth():.2f} words/cycle")
+    exit(1 if failed else 0)
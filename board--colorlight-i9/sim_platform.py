@@ -0,0 +1,68 @@
+"""
+---
+(c) 2022 David SPORN
+---
+This is part of Sporniket's "Amaranth Stuff" project.
+
+Sporniket's "Amaranth Stuff" project is free software: you can redistribute it and/or
+modify it under the terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your option)
+any later version.
+
+Sporniket's "Amaranth Stuff" project is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+or FITNESS FOR A PARTICULAR PURPOSE.
+
+See the GNU Lesser General Public License for more details.
+You should have received a copy of the GNU Lesser General Public License along with Sporniket's "Amaranth Stuff" project.
+If not, see <https://www.gnu.org/licenses/>.
+---
+"""
+### builtin deps
+from typing import List, Optional
+
+### amaranth -- main deps
+from amaranth import *
+from amaranth.build.res import ResourceManager
+
+### local deps
+from colorlight_i9 import Colorlight_I9_V7_2_Platform
+
+__all__ = ["SimulationPlatform"]
+
+
+class SimulationPlatform(ResourceManager):
+    """The resources and the connectors of a board, requested as plain signals, to simulate a whole design.
+
+    A design elaborated with it requests its resources (and adds resources from the connectors) like with the
+    platform of the board ; the pins it gets are not connected to any I/O buffer, the test bench drives and samples
+    them. `pins()` lists them, e.g. as the ports to trace.
+    """
+
+    def __init__(self, frequency: Optional[float] = None, board=Colorlight_I9_V7_2_Platform):
+        """Set up the platform.
+
+        Args:
+            frequency (float, optional): The frequency of the sync domain, in Hertz. Defaults to None, the frequency of
+                the default clock of the board.
+            board (type, optional): The platform of the board, providing the resources, the connectors and the default
+                clock. Defaults to Colorlight_I9_V7_2_Platform.
+        """
+        super().__init__(board.resources, board.connectors)
+        self.default_clk = board.default_clk
+        self.frequency = self.lookup(board.default_clk).clock.frequency if frequency is None else frequency
+
+    @property
+    def default_clk_frequency(self):
+        """The frequency of the sync domain."""
+        return self.frequency
+
+    def clockFrequency(self, domain: str) -> float:
+        """The frequency of the given clock domain, in Hertz ; only the sync domain is simulated."""
+        if domain == "sync":
+            return self.frequency
+        raise ValueError(f"Unknown clock domain '{domain}'")
+
+    def pins(self) -> List[Signal]:
+        """The signals of the pins requested so far, in the order of the requests."""
+        return [signal for _, pin, _, _ in self._ports for signal in pin.fields.values()]
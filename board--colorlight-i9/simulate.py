@@ -0,0 +1,67 @@
+"""
+---
+(c) 2022 David SPORN
+---
+This is part of Sporniket's "Amaranth Stuff" project.
+
+Sporniket's "Amaranth Stuff" project is free software: you can redistribute it and/or
+modify it under the terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your option)
+any later version.
+
+Sporniket's "Amaranth Stuff" project is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+or FITNESS FOR A PARTICULAR PURPOSE.
+
+See the GNU Lesser General Public License for more details.
+You should have received a copy of the GNU Lesser General Public License along with Sporniket's "Amaranth Stuff" project.
+If not, see <https://www.gnu.org/licenses/>.
+---
+"""
+# Run the actions of `cli_sporny` (simulate, generate, verify) on the designs of the board, elaborated with a
+# `SimulationPlatform` instead of the platform of the board.
+#
+# E.g. `python3 simulate.py blinky simulate -c 50000000 --fast-forward -v blinky.vcd --trace-from 49999990` simulates
+# two seconds of `Blinky` at 25 MHz.
+### builtin deps
+import argparse
+import os
+import sys
+
+# -- cli_sporny lives with the tutorial of the cell of tagged value
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "02_cell_of_tagged_value"))
+
+### amaranth -- main deps
+from amaranth.hdl.ir import Fragment
+
+### local deps
+from cli_sporny import main_parser_by_sporniket, main_runner_by_sporniket
+from sim_platform import SimulationPlatform
+from slowbeat import SlowBeat
+from blinky import Blinky
+from blinky_gpio import BlinkyGpio
+from chaser_gpio import ChaserGpio
+
+# -- the designs, like in make.py
+DESIGNS = {
+    "slowbeat": lambda: SlowBeat(1),
+    "blinky": lambda: Blinky(),
+    "blinky_gpio": lambda: BlinkyGpio("p", 2, 5),
+    "chaser_gpio": lambda: ChaserGpio("p", 2, (5, 7, 9, 11, 13, 17, 23, 25, 27, 29)),
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run an action of cli_sporny on a design of the board")
+    parser.add_argument("design", metavar="DESIGN", choices=DESIGNS,
+        help=f"the design, among {', '.join(DESIGNS)}")
+    parser.add_argument("--frequency", dest="frequency", metavar="HERTZ", type=float, default=None,
+        help="the frequency of the sync domain (default: the frequency of clk25)")
+    main_parser_by_sporniket(parser)
+    args = parser.parse_args()
+
+    platform = SimulationPlatform(args.frequency)
+    design = DESIGNS[args.design]()
+    # -- the pins are requested during the elaboration, elaborate first for them to be the ports
+    fragment = Fragment.get(design, platform)
+    ports = design.ports() if hasattr(design, "ports") else platform.pins()
+    main_runner_by_sporniket(parser, args, fragment, platform=platform, name=args.design, ports=ports)
@@ -19,7 +19,8 @@ If not, see <https://www.gnu.org/licenses/>. 
 ---
 """
 ### builtin deps
-from typing import List  # , Dict, Tuple, Optional
+from fractions import Fraction
+from typing import List, Union  # , Dict, Tuple, Optional
 
 ### amaranth -- main deps
 from amaranth import *
@@ -27,7 +28,12 @@ from amaranth.build import Platform
 
 
 class SlowBeat(Elaboratable):
-    """A clock signal that have a frequency of up to platform.default_clk_frequency/2 with 50% duty cycle"""
+    """A clock signal that have a frequency of up to platform.default_clk_frequency/2 with 50% duty cycle
+
+    `strobe` is asserted during the single clock cycle ending with each leading edge of `beat_p` ; it is meant
+    to be the enable of the logic running at the pace of the beat (e.g. with `EnableInserter`), instead of
+    detecting the edges of `beat_p`.
+    """
 
     def __init__(self, frequency: int):
         """Set up the target frequency.
@@ -38,9 +44,10 @@ class SlowBeat(Elaboratable):
         self.frequency = frequency
         self.beat_p = Signal(reset=1)  # the active high clock signal
         self.beat_n = Signal()  # the active low clock signal
+        self.strobe = Signal()  # asserted one clock cycle per period of the beat, before the leading edge of beat_p
 
     def ports(self) -> List[Signal]:
-        return [self.beat_p, self.beat_n]
+        return [self.beat_p, self.beat_n, self.strobe]
 
     def elaborate(self, platform: Platform) -> Module():
         # sanity check
@@ -57,6 +64,7 @@ class SlowBeat(Elaboratable):
         timer = Signal(range(limit), reset=limit - 1)
 
         m.d.comb += self.beat_n.eq(~self.beat_p)
+        m.d.comb += self.strobe.eq((timer == 0) & ~self.beat_p)
         with m.If(timer == 0):
             m.d.sync += timer.eq(timer.reset)
             m.d.sync += self.beat_p.eq(~self.beat_p)
@@ -64,3 +72,107 @@ class SlowBeat(Elaboratable):
             m.d.sync += timer.eq(timer - 1)
 
         return m
+
+
+class SharedSlowBeat(Elaboratable):
+    """Many clock signals with 50% duty cycle, derived from one shared prescaler.
+
+    The prescaler divides platform.default_clk_frequency down to a tick, at least `oversampling` times
+    faster than the double of the fastest target frequency. Each beat then toggles when its own fractional
+    accumulator, a small Bresenham-like counter incremented on each tick, overflows. Thus :
+
+    * the average frequency of each beat is exactly the target frequency, even when it does not divide
+      the platform clock frequency (e.g. 3 Hz on 25 MHz) ;
+    * each edge is at most one tick late, i.e. the jitter is bounded by 1/`oversampling` of the half
+      period of the fastest beat ;
+    * the tick frequency is chosen as a divisor of the platform clock frequency, so that the accumulators
+      are only a few bits wide and the only wide counter is the shared prescaler.
+
+    Like for `SlowBeat`, each `strobe` is asserted during the single clock cycle ending with a leading edge
+    of its `beat_p`.
+    """
+
+    def __init__(self, frequencies: List[Union[int, Fraction]], oversampling: int = 16):
+        """Set up the target frequencies.
+
+        Args:
+            frequencies (List[Union[int, Fraction]]): target frequencies, in Hertz.
+            oversampling (int): minimal ratio between the tick frequency and the double of the fastest target
+                frequency ; the higher, the lower the jitter, but the wider the accumulators.
+        """
+        if len(frequencies) == 0:
+            raise ValueError("SharedSlowBeat MUST have at least one target frequency.")
+        if oversampling < 1:
+            raise ValueError("oversampling MUST be at least 1.")
+        self.frequencies = [Fraction(frequency) for frequency in frequencies]
+        self.oversampling = oversampling
+        self.beat_p = [Signal(reset=1, name=f"beat_p_{i}") for i in range(len(frequencies))]  # the active high clock signals
+        self.beat_n = [Signal(name=f"beat_n_{i}") for i in range(len(frequencies))]  # the active low clock signals
+        self.strobe = [Signal(name=f"strobe_{i}") for i in range(len(frequencies))]  # the enables at the pace of the beats
+
+    def ports(self) -> List[Signal]:
+        return self.beat_p + self.beat_n + self.strobe
+
+    def prescale(self, clockFrequency: int) -> int:
+        """Compute the division of the clock frequency giving the tick.
+
+        Args:
+            clockFrequency (int): the frequency of the platform clock, in Hertz.
+
+        Returns:
+            int: the largest divisor of `clockFrequency` giving a tick fast enough for the requested oversampling.
+        """
+        bound = max(1, int(clockFrequency / (2 * max(self.frequencies) * self.oversampling)))
+        divisors = set()
+        for i in range(1, int(clockFrequency**0.5) + 1):
+            if clockFrequency % i == 0:
+                divisors.update([i, clockFrequency // i])
+        return max(d for d in divisors if d <= bound)
+
+    def elaborate(self, platform: Platform) -> Module:
+        # sanity check
+        clockFrequency = int(platform.default_clk_frequency)
+        frequencyMax = Fraction(clockFrequency, 2)
+        for frequency in self.frequencies:
+            if not 0 < frequency <= frequencyMax:
+                raise ValueError(
+                    f"Cannot instanciate a slow beat of {frequency} Hz"
+                    f" when platform clock frequency is {clockFrequency} Hz ;"
+                    f" Maximum allowed {frequencyMax} Hz "
+                )
+
+        m = Module()
+
+        # -- the shared prescaler
+        prescale = self.prescale(clockFrequency)
+        tick = Signal()
+        if prescale == 1:
+            m.d.comb += tick.eq(1)
+        else:
+            timer = Signal(range(prescale), reset=prescale - 1)
+            m.d.comb += tick.eq(timer == 0)
+            with m.If(tick):
+                m.d.sync += timer.eq(timer.reset)
+            with m.Else():
+                m.d.sync += timer.eq(timer - 1)
+
+        # -- a fractional accumulator for each beat : toggles `step` times every `modulo` ticks
+        for i, frequency in enumerate(self.frequencies):
+            ratio = 2 * frequency * prescale / clockFrequency  # ratio <= 1
+            step, modulo = ratio.numerator, ratio.denominator
+            m.d.comb += self.beat_n[i].eq(~self.beat_p[i])
+            if step == modulo:
+                m.d.comb += self.strobe[i].eq(tick & ~self.beat_p[i])
+                with m.If(tick):
+                    m.d.sync += self.beat_p[i].eq(~self.beat_p[i])
+                continue
+            accumulator = Signal(range(modulo), name=f"accumulator_{i}")
+            m.d.comb += self.strobe[i].eq(tick & (accumulator >= modulo - step) & ~self.beat_p[i])
+            with m.If(tick):
+                with m.If(accumulator >= modulo - step):
+                    m.d.sync += accumulator.eq(accumulator - (modulo - step))
+                    m.d.sync += self.beat_p[i].eq(~self.beat_p[i])
+                with m.Else():
+                    m.d.sync += accumulator.eq(accumulator + step)
+
+        return m
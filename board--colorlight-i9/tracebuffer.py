@@ -0,0 +1,341 @@
+"""
+---
+(c) 2022 David SPORN
+---
+This is part of Sporniket's "Amaranth Stuff" project.
+
+Sporniket's "Amaranth Stuff" project is free software: you can redistribute it and/or
+modify it under the terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your option)
+any later version.
+
+Sporniket's "Amaranth Stuff" project is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+or FITNESS FOR A PARTICULAR PURPOSE.
+
+See the GNU Lesser General Public License for more details.
+You should have received a copy of the GNU Lesser General Public License along with Sporniket's "Amaranth Stuff" project.
+If not, see <https://www.gnu.org/licenses/>.
+---
+"""
+### builtin deps
+from typing import List, Tuple  # , Dict, Optional
+
+### amaranth -- main deps
+from amaranth import *
+from amaranth.build import Platform
+
+# the bytes sent before the samples, to find the start of a dump
+TRACE_HEADER = b"TRC"
+
+
+class SerialTransmitter(Elaboratable):
+    """Send bytes on a serial line, 8 data bits, no parity, 1 stop bit (8N1), `divisor` clock cycles per bit.
+
+    A byte is taken when `valid` and `ready` are both asserted ; `ready` is deasserted until its stop bit is sent.
+    """
+
+    def __init__(self, divisor: int):
+        if divisor < 1:
+            raise ValueError("SerialTransmitter MUST have a divisor of at least 1.")
+        self.divisor = divisor
+        self.data = Signal(8)
+        self.valid = Signal()
+        self.ready = Signal()
+        self.tx = Signal(reset=1)  # the serial line, idle high
+
+    def ports(self) -> List[Signal]:
+        return [self.data, self.valid, self.ready, self.tx]
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        shifter = Signal(10, reset=0x3FF)  # start bit, data bits (lowest first), stop bit
+        bitsLeft = Signal(range(11))
+        timer = Signal(range(self.divisor), reset=self.divisor - 1)
+
+        m.d.comb += [
+            self.ready.eq(bitsLeft == 0),
+            self.tx.eq(shifter[0]),
+        ]
+        with m.If(self.ready):
+            with m.If(self.valid):
+                m.d.sync += [
+                    shifter.eq(Cat(Const(0, 1), self.data, Const(1, 1))),
+                    bitsLeft.eq(10),
+                    timer.eq(timer.reset),
+                ]
+        with m.Elif(timer == 0):
+            m.d.sync += [
+                shifter.eq(Cat(shifter[1:], Const(1, 1))),
+                bitsLeft.eq(bitsLeft - 1),
+                timer.eq(timer.reset),
+            ]
+        with m.Else():
+            m.d.sync += timer.eq(timer - 1)
+
+        return m
+
+
+class TraceBuffer(Elaboratable):
+    """An embedded logic analyzer : samples the probes into block RAM at each clock, then sends them on a serial line.
+
+    * Asserting `arm` starts a capture : the probes are written into a circular buffer of `depth` samples.
+    * Once `preTrigger` samples are captured, the first cycle when the trigger condition is met is the trigger :
+      `depth - preTrigger` samples are captured from it, then the capture stops.
+    * The trigger condition is met when `trigger` is asserted, or when `triggerMask` is not 0 and the bits of the
+      sample selected by `triggerMask` equal the ones of `triggerValue`.
+    * The dump is then sent on `tx` (see `SerialTransmitter`) : `TRACE_HEADER`, then the samples from the oldest one,
+      each in `bytesPerSample` bytes, little endian. The trigger is always the sample at index `preTrigger`.
+
+    The sample is the concatenation of the probes, the first probe in the lowest bits. `isCapturing`, `isTriggered`
+    and `isSending` tell the progress.
+    """
+
+    def __init__(self, probes: List[Signal], depth: int = 1024, preTrigger: int = 0, divisor: int = 217):
+        """Set up the trace buffer.
+
+        Args:
+            probes (List[Signal]): the signals to sample.
+            depth (int, optional): the number of samples, a power of 2. Defaults to 1024.
+            preTrigger (int, optional): the number of samples kept before the trigger, less than `depth`. Defaults to 0.
+            divisor (int, optional): the clock cycles per bit of the serial line, e.g. 217 for 115200 bauds at 25 MHz.
+                Defaults to 217.
+        """
+        if len(probes) == 0:
+            raise ValueError("TraceBuffer MUST have at least one probe.")
+        if depth < 2 or depth & (depth - 1) != 0:
+            raise ValueError("TraceBuffer MUST have a depth that is a power of 2, at least 2.")
+        if not 0 <= preTrigger < depth:
+            raise ValueError("preTrigger MUST be positive, and less than the depth.")
+        self.probes = probes
+        self.depth = depth
+        self.preTrigger = preTrigger
+        self.divisor = divisor
+        self.sampleWidth = sum(len(probe) for probe in probes)
+
+        # inputs
+        self.arm = Signal()
+        self.trigger = Signal()
+        self.triggerMask = Signal(self.sampleWidth)
+        self.triggerValue = Signal(self.sampleWidth)
+
+        # outputs
+        self.tx = Signal(reset=1)
+        self.isCapturing = Signal()
+        self.isTriggered = Signal()
+        self.isSending = Signal()
+
+    @property
+    def bytesPerSample(self) -> int:
+        return (self.sampleWidth + 7) // 8
+
+    def layout(self) -> List[Tuple[str, int]]:
+        """The name and the width of each probe, in the order of the sample."""
+        return [(probe.name, len(probe)) for probe in self.probes]
+
+    def ports(self) -> List[Signal]:
+        return [self.arm, self.trigger, self.triggerMask, self.triggerValue, self.tx, self.isCapturing, self.isTriggered, self.isSending]
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+        m.submodules.transmitter = transmitter = SerialTransmitter(self.divisor)
+        m.d.comb += self.tx.eq(transmitter.tx)
+
+        memory = Memory(width=self.sampleWidth, depth=self.depth)
+        m.submodules.write = writePort = memory.write_port()
+        m.submodules.read = readPort = memory.read_port()
+
+        sample = Signal(self.sampleWidth)
+        m.d.comb += sample.eq(Cat(*self.probes))
+        isTrigger = Signal()
+        m.d.comb += isTrigger.eq(
+            self.trigger | ((self.triggerMask != 0) & (((sample ^ self.triggerValue) & self.triggerMask) == 0))
+        )
+
+        address = Signal(range(self.depth))  # the next sample to write, then the oldest sample
+        filled = Signal(range(self.preTrigger + 1))  # the samples captured before the trigger, saturated
+        remaining = Signal(range(self.depth))  # the samples to capture after the trigger
+        m.d.comb += [
+            writePort.addr.eq(address),
+            writePort.data.eq(sample),
+        ]
+
+        headerIndex = Signal(range(len(TRACE_HEADER)))
+        sampleIndex = Signal(range(self.depth))
+        byteIndex = Signal(range(self.bytesPerSample))
+        m.d.comb += readPort.addr.eq(address + sampleIndex)
+        header = Array(Const(byte, 8) for byte in TRACE_HEADER)
+        sampleBytes = Cat(readPort.data, Const(0, self.bytesPerSample * 8 - self.sampleWidth))
+
+        with m.FSM():
+            with m.State("IDLE"):
+                m.d.comb += self.isSending.eq(~transmitter.ready)  # -- the last byte
+                with m.If(self.arm):
+                    m.d.sync += filled.eq(0)
+                    m.next = "CAPTURE"
+            with m.State("CAPTURE"):
+                m.d.comb += [
+                    self.isCapturing.eq(1),
+                    writePort.en.eq(1),
+                ]
+                m.d.sync += address.eq(address + 1)
+                with m.If(isTrigger & (filled == self.preTrigger)):
+                    m.d.sync += remaining.eq(self.depth - self.preTrigger - 1)
+                    m.next = "SEND_HEADER" if self.depth - self.preTrigger == 1 else "TRIGGERED"
+                with m.Elif(filled != self.preTrigger):
+                    m.d.sync += filled.eq(filled + 1)
+            with m.State("TRIGGERED"):
+                m.d.comb += [
+                    self.isCapturing.eq(1),
+                    self.isTriggered.eq(1),
+                    writePort.en.eq(1),
+                ]
+                m.d.sync += [
+                    address.eq(address + 1),
+                    remaining.eq(remaining - 1),
+                ]
+                with m.If(remaining == 1):
+                    m.next = "SEND_HEADER"
+            with m.State("SEND_HEADER"):
+                m.d.comb += [
+                    self.isTriggered.eq(1),
+                    self.isSending.eq(1),
+                    transmitter.data.eq(header[headerIndex]),
+                    transmitter.valid.eq(1),
+                ]
+                m.d.sync += [
+                    sampleIndex.eq(0),
+                    byteIndex.eq(0),
+                ]
+                with m.If(transmitter.ready):
+                    m.d.sync += headerIndex.eq(headerIndex + 1)
+                    with m.If(headerIndex == len(TRACE_HEADER) - 1):
+                        m.d.sync += headerIndex.eq(0)
+                        m.next = "SEND_SAMPLES"
+            with m.State("SEND_SAMPLES"):
+                # -- the sample is read while the previous byte is sent, the transmitter is never ready right away
+                m.d.comb += [
+                    self.isTriggered.eq(1),
+                    self.isSending.eq(1),
+                    transmitter.data.eq(sampleBytes.word_select(byteIndex, 8)),
+                    transmitter.valid.eq(1),
+                ]
+                with m.If(transmitter.ready):
+                    m.d.sync += byteIndex.eq(byteIndex + 1)
+                    with m.If(byteIndex == self.bytesPerSample - 1):
+                        m.d.sync += [
+                            byteIndex.eq(0),
+                            sampleIndex.eq(sampleIndex + 1),
+                        ]
+                        with m.If(sampleIndex == self.depth - 1):
+                            m.next = "IDLE"
+
+        return m
+
+
+### host side ###
+
+def decodeSerial(levels: List[int], divisor: int) -> bytes:
+    """Decode the bytes of a serial line (8N1), sampled at each clock cycle ; used to check the dump in simulation."""
+    result = bytearray()
+    cycle = 0
+    while cycle < len(levels):
+        if levels[cycle] == 1:
+            cycle += 1
+            continue
+        # -- start bit, sample each bit in its middle
+        middle = cycle + divisor // 2
+        bits = [levels[middle + divisor * (i + 1)] for i in range(8) if middle + divisor * (i + 1) < len(levels)]
+        if len(bits) < 8:
+            break
+        result.append(sum(bit << i for i, bit in enumerate(bits)))
+        cycle += divisor * 10 - divisor // 2  # -- resume within the stop bit
+    return bytes(result)
+
+
+def decodeDump(dump: bytes, layout: List[Tuple[str, int]], depth: int) -> List[int]:
+    """Extract the samples from a dump received from a trace buffer."""
+    start = dump.find(TRACE_HEADER)
+    if start < 0:
+        raise ValueError("No trace header in the dump")
+    width = sum(w for _, w in layout)
+    size = (width + 7) // 8
+    data = dump[start + len(TRACE_HEADER) :]
+    if len(data) < depth * size:
+        raise ValueError(f"Truncated dump : {len(data)} bytes, {depth * size} expected")
+    return [int.from_bytes(data[i * size : (i + 1) * size], "little") for i in range(depth)]
+
+
+def writeTraceVcd(vcdFile: str, samples: List[int], layout: List[Tuple[str, int]], preTrigger: int, period: float):
+    """Write the samples as VCD, one variable per probe, and a `trigger` variable asserted on the trigger sample."""
+    from vcd import VCDWriter
+
+    periodNs = period * 1e9
+    with open(vcdFile, "w") as f, VCDWriter(f, timescale="1 ns") as writer:
+        variables = []
+        for name, width in layout:
+            variables.append((writer.register_var("trace", name, "wire", size=width), width))
+        trigger = writer.register_var("trace", "trigger", "wire", size=1)
+        for index, sample in enumerate(samples):
+            timestamp = round(index * periodNs)
+            writer.change(trigger, timestamp, int(index == preTrigger))
+            offset = 0
+            for variable, width in variables:
+                writer.change(variable, timestamp, (sample >> offset) & ((1 << width) - 1))
+                offset += width
+
+
+### Test suite ###
+if __name__ == "__main__":
+    import argparse
+    from amaranth.sim import Simulator, Settle, Tick
+    from counter import RippleCounter
+    from decoder import Decoder
+
+    parser = argparse.ArgumentParser(description="Capture a counter and its decoding with a trace buffer, in simulation")
+    parser.add_argument("-v", "--vcd-file", dest="vcdFile", metavar="VCD-FILE", default="trace.vcd",
+        help="write the decoded dump to VCD-FILE (default: %(default)s)")
+    args = parser.parse_args()
+
+    # Prepare : the design under test, a counter decoded like in ChaserGpio, probed by the trace buffer
+    m = Module()
+    m.submodules.counter = counter = RippleCounter(4)
+    m.submodules.decoder = decoder = Decoder(10)
+    m.d.comb += decoder.input.eq(counter.value)
+    depth, preTrigger, divisor = 32, 8, 4
+    m.submodules.trace = trace = TraceBuffer([counter.value, decoder.output, decoder.outOfRange], depth, preTrigger, divisor)
+
+    armCycle = 5
+    triggerValue = 12  # -- trigger when the counter is 12, 8 samples before and 24 from it
+    levels = []
+    history = []
+
+    def process():
+        yield trace.triggerMask.eq(0xF)
+        yield trace.triggerValue.eq(triggerValue)
+        cycle = 0
+        while True:
+            yield trace.arm.eq(cycle == armCycle)
+            yield Settle()
+            history.append((yield Cat(counter.value, decoder.output, decoder.outOfRange)))
+            levels.append((yield trace.tx))
+            if cycle > armCycle + 1 and not (yield trace.isCapturing) and not (yield trace.isSending):
+                break
+            cycle += 1
+            yield Tick("sync")
+
+    sim = Simulator(m)
+    sim.add_clock(1e-6)
+    sim.add_process(process)
+    sim.run()
+
+    # Check : the dump is the expected window of the probes
+    samples = decodeDump(decodeSerial(levels, divisor), trace.layout(), depth)
+    triggerCycle = next(c for c in range(armCycle + 1 + preTrigger, len(history)) if history[c] & 0xF == triggerValue)
+    expected = history[triggerCycle - preTrigger : triggerCycle - preTrigger + depth]
+    writeTraceVcd(args.vcdFile, samples, trace.layout(), preTrigger, 1e-6)
+    if samples != expected:
+        print(f"FAILED : dump {samples}, expected {expected}")
+        exit(1)
+    print(f"PASS : {depth} samples dumped in {len(levels)} cycles, decoded into {args.vcdFile}")
@@ -0,0 +1,243 @@
+"""Co-simulation of the modules of the sandbox against their NumPy reference models (see `golden.py`).
+
+Each check draws random stimulus arrays, computes the expected traces of the outputs with the reference model, and
+simulates the module with the same stimulus. The simulation only copies the stimulus to the inputs and the outputs
+into preallocated arrays, without any assertion ; the traces are then compared in bulk, and only the mismatching
+cycles are reported.
+
+The convention of the traces : during the cycle `k`, the inputs are given their sample `k`, the combinational logic
+settles, then the outputs are captured into their sample `k`, before the clock edge ending the cycle.
+"""
+### builtin deps
+import argparse
+import os
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+### numpy -- only needed by the co-simulation
+import numpy as np
+
+### amaranth -- main deps
+from amaranth import *
+from amaranth.hdl.ir import Fragment
+from amaranth.sim import Simulator, Settle, Tick
+
+### local deps
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+import sandbox  # -- makes the modules of the sandbox importable
+import golden
+from colorlight_i9 import Colorlight_I9_V7_2_Platform
+from bleep import Bleeper
+from counter import RippleCounter, SlowRippleCounter, PipelinedCounter, SlowPipelinedCounter
+from decoder import Decoder
+from slowbeat import SlowBeat
+from chaser_gpio import ChaserCore
+from CellOfTaggedValue import CellOfTaggedValue
+
+
+def cosimulate(
+    fragment: Fragment,
+    module: Elaboratable,
+    stimulus: Dict[str, np.ndarray],
+    outputs: List[str],
+    cycles: int,
+    period: float = 1e-6,
+) -> Dict[str, np.ndarray]:
+    """Simulate the module with the given stimulus, and capture the traces of its outputs.
+
+    Args:
+        fragment (Fragment): the elaborated module, or a design containing it.
+        module (Elaboratable): the module, its ports are found by name.
+        stimulus (Dict[str, np.ndarray]): the values of each input, by name of port, one per cycle.
+        outputs (List[str]): the names of the ports to capture.
+        cycles (int): the number of cycles to simulate.
+        period (float, optional): the period of the 'sync' clock domain. Defaults to 1e-6.
+
+    Returns:
+        Dict[str, np.ndarray]: the trace of each output, by name of port.
+    """
+    # -- plain lists of python integers are much faster to read from the simulation process
+    inputs = [(getattr(module, name), values[:cycles].tolist()) for name, values in stimulus.items()]
+    traces = {name: np.zeros(cycles, dtype=golden.dtypeOf(len(getattr(module, name)))) for name in outputs}
+    captures = [(getattr(module, name), traces[name]) for name in outputs]
+
+    def process():
+        current = [None] * len(inputs)
+        for k in range(cycles):
+            for i, (signal, values) in enumerate(inputs):
+                # -- only write the inputs that change
+                if values[k] != current[i]:
+                    current[i] = values[k]
+                    yield signal.eq(values[k])
+            yield Settle()
+            for signal, trace in captures:
+                trace[k] = yield signal
+            yield Tick("sync")
+
+    sim = Simulator(fragment)
+    sim.add_clock(period, domain="sync")
+    # -- not a sync process, that would only start after the first clock edge
+    sim.add_process(process)
+    sim.run()
+    return traces
+
+
+def compare(expected: Dict[str, np.ndarray], actual: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Compare the traces in bulk.
+
+    Returns:
+        Dict[str, np.ndarray]: the cycles where each trace differs from the expected one, by name of the traces
+        that differ.
+    """
+    mismatches = {}
+    for name, values in expected.items():
+        cycles = np.flatnonzero(values != actual[name])
+        if len(cycles) > 0:
+            mismatches[name] = cycles
+    return mismatches
+
+
+class Check:
+    """A module, and how to drive it and to predict its outputs."""
+
+    def __init__(
+        self,
+        name: str,
+        factory: Callable[[], Elaboratable],
+        stimulus: Callable[[Elaboratable, np.random.Generator, int], Dict[str, np.ndarray]],
+        model: Callable[[Elaboratable, Dict[str, np.ndarray], int, int], Dict[str, np.ndarray]],
+    ):
+        """Set up the check.
+
+        Args:
+            name (str): the name of the check.
+            factory (Callable[[], Elaboratable]): creates the module.
+            stimulus (Callable[[Elaboratable, np.random.Generator, int], Dict[str, np.ndarray]]): draws the values
+                of each input of the module, by name of port, for the given number of cycles.
+            model (Callable[[Elaboratable, Dict[str, np.ndarray], int, int], Dict[str, np.ndarray]]): computes the
+                expected traces, from the module, the stimulus, the number of cycles and the clock frequency.
+        """
+        self.name = name
+        self.factory = factory
+        self.stimulus = stimulus
+        self.model = model
+
+
+def randomValues(rng: np.random.Generator, width: int, cycles: int, bound: Optional[int] = None) -> np.ndarray:
+    """Draw values of the given width, or below `bound` when given."""
+    high = 1 << width if bound is None else min(bound, 1 << width)
+    return rng.integers(0, high, size=cycles, dtype=np.uint64)
+
+
+def randomStrobe(rng: np.random.Generator, probability: float, cycles: int) -> np.ndarray:
+    """Draw a signal asserted with the given probability at each cycle."""
+    return (rng.random(cycles) < probability).astype(np.uint64)
+
+
+CHECKS = [
+    Check("Bleeper", lambda: Bleeper(), lambda m, rng, n: {}, lambda m, s, n, f: golden.bleeper(n)),
+    Check(
+        "RippleCounter(width=4)",
+        lambda: RippleCounter(4),
+        lambda m, rng, n: {},
+        lambda m, s, n, f: golden.rippleCounter(m.width, n),
+    ),
+    Check(
+        "PipelinedCounter(width=12, chunk=4)",
+        lambda: PipelinedCounter(12, 4),
+        lambda m, rng, n: {},
+        lambda m, s, n, f: golden.rippleCounter(m.width, n),
+    ),
+    Check(
+        "SlowRippleCounter(width=4)",
+        lambda: SlowRippleCounter(4),
+        lambda m, rng, n: {"beat": randomValues(rng, 1, n)},
+        lambda m, s, n, f: golden.slowRippleCounter(m.width, s["beat"]),
+    ),
+    Check(
+        "SlowPipelinedCounter(width=12, chunk=4)",
+        lambda: SlowPipelinedCounter(12, 4),
+        lambda m, rng, n: {"beat": randomValues(rng, 1, n)},
+        lambda m, s, n, f: golden.slowRippleCounter(m.width, s["beat"]),
+    ),
+    Check(
+        "Decoder(span=10)",
+        lambda: Decoder(10),
+        lambda m, rng, n: {"input": randomValues(rng, len(m.input), n)},
+        lambda m, s, n, f: golden.decoder(m.span, s["input"]),
+    ),
+    Check(
+        "Decoder(span=100)",
+        lambda: Decoder(100),
+        lambda m, rng, n: {"input": randomValues(rng, len(m.input), n)},
+        lambda m, s, n, f: golden.decoder(m.span, s["input"]),
+    ),
+    Check(
+        "SlowBeat(frequency=1000000)",
+        lambda: SlowBeat(1000000),
+        lambda m, rng, n: {},
+        lambda m, s, n, f: golden.slowBeat(m.frequency, f, n),
+    ),
+    Check(
+        "ChaserCore(count=10, frequency=1000000)",
+        lambda: ChaserCore(10, 1000000),
+        lambda m, rng, n: {},
+        lambda m, s, n, f: golden.chaserCore(m.count, m.frequency, f, n),
+    ),
+    Check(
+        "CellOfTaggedValue(valueWidth=8)",
+        lambda: CellOfTaggedValue(5, unsigned(4), unsigned(8)),
+        # -- few distinct values and rare writes, for the cell to match often
+        lambda m, rng, n: {"writeEnabled": randomStrobe(rng, 0.01, n), "dataIn": randomValues(rng, 8, n, bound=4)},
+        lambda m, s, n, f: golden.cellOfTaggedValue(m.tag.value, s["writeEnabled"], s["dataIn"]),
+    ),
+]
+
+
+def runCheck(check: Check, cycles: int, seed: int) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+    """Simulate the module of the check against its model.
+
+    Returns:
+        Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray], Dict[str, np.ndarray]]: the mismatches (see `compare()`),
+        the expected traces and the simulated traces.
+    """
+    platform = Colorlight_I9_V7_2_Platform(build_cache_dir=None)
+    clockFrequency = int(platform.default_clk_frequency)
+    module = check.factory()
+    stimulus = check.stimulus(module, np.random.default_rng(seed), cycles)
+    expected = check.model(module, stimulus, cycles, clockFrequency)
+    fragment = Fragment.get(module, platform)
+    actual = cosimulate(fragment, module, stimulus, list(expected.keys()), cycles, 1 / clockFrequency)
+    return compare(expected, actual), expected, actual
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Co-simulation of the modules of the sandbox against NumPy models")
+    parser.add_argument("--only", dest="only", metavar="CHECK", nargs="+",
+        help=f"only run the checks whose name starts with one of the given prefixes, among {', '.join(c.name for c in CHECKS)}")
+    parser.add_argument("--cycles", dest="cycles", metavar="COUNT", type=int, default=100000,
+        help="the number of clock cycles to simulate (default: %(default)s)")
+    parser.add_argument("--seed", dest="seed", metavar="SEED", type=int, default=0,
+        help="the seed of the random stimulus (default: %(default)s)")
+    args = parser.parse_args()
+
+    checks = [c for c in CHECKS if args.only is None or any(c.name.startswith(prefix) for prefix in args.only)]
+    if len(checks) == 0:
+        parser.error("no check to run")
+
+    failed = 0
+    for check in checks:
+        start = time.perf_counter()
+        mismatches, expected, actual = runCheck(check, args.cycles, args.seed)
+        duration = time.perf_counter() - start
+        if len(mismatches) == 0:
+            print(f"{check.name:<40} PASS {args.cycles} cycles in {duration:.3f} s")
+            continue
+        failed += 1
+        print(f"{check.name:<40} FAIL")
+        for name, cycles in mismatches.items():
+            first = cycles[0]
+            print(f"    {name} : {len(cycles)} mismatching cycles, the first at cycle {first} :"
+                f" expected {expected[name][first]}, got {actual[name][first]}")
+    sys.exit(1 if failed > 0 else 0)
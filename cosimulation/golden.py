@@ -0,0 +1,110 @@
+"""Cycle accurate reference models of the modules of the sandbox, computed with NumPy.
+
+Each model computes the whole trace of the outputs of a module from the arrays of its inputs, in one vectorized
+pass. The traces follow the convention of the co-simulation : the sample `k` of an output is its value during the
+clock cycle `k`, i.e. after `k` clock edges, the inputs of the cycle `k` being applied.
+
+The models return a dictionary of arrays, by name of the port of the module (e.g. `value` for `RippleCounter.value`).
+The values are unsigned ; an output wider than 64 bits is an array of python integers (`dtype=object`).
+"""
+### builtin deps
+from typing import Dict
+
+### numpy -- only needed by the co-simulation
+import numpy as np
+
+
+def dtypeOf(width: int):
+    """The type of the array of the values of a signal of the given width."""
+    return np.uint64 if width <= 64 else object
+
+
+def previous(values: np.ndarray, reset: int = 0) -> np.ndarray:
+    """The values delayed by one clock cycle, i.e. the trace of a register loaded at each clock."""
+    result = np.empty_like(values)
+    result[0] = reset
+    result[1:] = values[:-1]
+    return result
+
+
+def bleeper(cycles: int) -> Dict[str, np.ndarray]:
+    """`Bleeper` : `q` toggles at each clock, starting low."""
+    return {"q": (np.arange(cycles, dtype=np.uint64) & 1)}
+
+
+def rippleCounter(width: int, cycles: int) -> Dict[str, np.ndarray]:
+    """`RippleCounter` (and `PipelinedCounter`) : `value` is the number of clock edges, modulo 2**width."""
+    value = np.arange(cycles, dtype=np.uint64)
+    if width < 64:
+        value &= np.uint64((1 << width) - 1)
+    return {"value": value}
+
+
+def slowRippleCounter(width: int, beat: np.ndarray) -> Dict[str, np.ndarray]:
+    """`SlowRippleCounter` (and `SlowPipelinedCounter`) : `value` counts the leading edges of `beat`, modulo 2**width.
+
+    A leading edge at the cycle `k` is counted by the clock edge ending the cycle, it shows at the cycle `k + 1`.
+    """
+    beat = beat.astype(bool)
+    leadingEdges = beat & ~previous(beat)
+    value = previous(np.cumsum(leadingEdges, dtype=np.uint64))
+    if width < 64:
+        value &= np.uint64((1 << width) - 1)
+    return {"value": value}
+
+
+def decoder(span: int, input: np.ndarray) -> Dict[str, np.ndarray]:
+    """`Decoder` : the registered one-hot decoding of `input`, one clock cycle later ; the reset value decodes 0."""
+    input = previous(input.astype(np.int64))
+    outOfRange = input >= span
+    if span <= 64:
+        output = np.left_shift(np.uint64(1), np.minimum(input, 63).astype(np.uint64))
+    else:
+        output = np.left_shift(np.ones(len(input), dtype=object), input.astype(object))
+    output[outOfRange] = 0
+    return {"output": output, "outOfRange": outOfRange.astype(np.uint64)}
+
+
+def slowBeat(frequency: int, clockFrequency: int, cycles: int) -> Dict[str, np.ndarray]:
+    """`SlowBeat` : `beat_p` starts high and toggles every `clockFrequency // frequency // 2` clock cycles.
+
+    `strobe` is asserted during the last cycle before each leading edge of `beat_p`.
+    """
+    limit = int(clockFrequency // frequency // 2)
+    cycle = np.arange(cycles, dtype=np.uint64)
+    beat_p = 1 - ((cycle // np.uint64(limit)) & 1)
+    strobe = ((cycle % np.uint64(limit)) == limit - 1) & (beat_p == 0)
+    return {"beat_p": beat_p, "beat_n": 1 - beat_p, "strobe": strobe.astype(np.uint64)}
+
+
+def chaserCore(count: int, frequency: int, clockFrequency: int, cycles: int) -> Dict[str, np.ndarray]:
+    """`ChaserCore` (strobed) : the output selected by the decoder is asserted with `beat_p`.
+
+    The counter and the decoder only advance on the strobes of the beat : the decoder holds the count before the
+    last strobe, i.e. the number of strobes before the last one ; the first output is also selected out of range.
+    """
+    beat = slowBeat(frequency, clockFrequency, cycles)
+    width = (count - 1).bit_length()
+    strobes = previous(np.cumsum(beat["strobe"], dtype=np.int64))
+    index = (np.maximum(strobes - 1, 0) & ((1 << width) - 1)).astype(np.uint64)
+    index[index >= count] = 0
+    output = np.left_shift(np.uint64(1), index) * beat["beat_p"]
+    return {"output": output}
+
+
+def cellOfTaggedValue(tagValue: int, writeEnabled: np.ndarray, dataIn: np.ndarray) -> Dict[str, np.ndarray]:
+    """`CellOfTaggedValue` : the cell is bound to the last value written before the current cycle.
+
+    `dataIn` MUST already be truncated to the width of the value of the cell.
+    """
+    cycles = len(dataIn)
+    dataIn = dataIn.astype(np.uint64)
+    # -- the cycle of the last write before each cycle, or -1 when there was none
+    lastWrite = previous(np.maximum.accumulate(np.where(writeEnabled.astype(bool), np.arange(cycles), -1)), -1)
+    isFree = lastWrite < 0
+    value = np.where(isFree, np.uint64(0), dataIn[np.maximum(lastWrite, 0)])
+    return {
+        "isFree": isFree.astype(np.uint64),
+        "isMatching": (~isFree & (dataIn == value)).astype(np.uint64),
+        "dataOut": np.full(cycles, tagValue, dtype=np.uint64),
+    }